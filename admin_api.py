@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import hmac
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import unquote, urlsplit
+
+from call_policy import CallAborted, is_daemon_error
+from dotenv import load_dotenv
+from signal_dbus import SignalDBus
+from utils import decode_group_id, encode_group_id
+
+load_dotenv()
+REGISTERED_NUMBER = os.getenv("REGISTERED_NUMBER")
+API_TOKEN = os.getenv("SIGNAL_API_TOKEN")
+
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class TTLCache:
+    """
+    Cache for asynchronous loaders with a time-to-live per entry.
+
+    Concurrent requests for the same key while a load is in flight all wait
+    for that single load instead of starting their own. The load runs in its
+    own task, so a cancelled request neither stops it nor passes the
+    cancellation on to the other requests.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._inflight = {}
+
+    async def get(self, key, loader):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader))
+            # Retrieve the exception so it is not reported as unhandled when nobody waits any more
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader):
+        try:
+            value = await loader()
+        finally:
+            self._inflight.pop(key, None)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def invalidate(self, key=None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class AdminAPI:
+    """
+    Local HTTP API in front of SignalDBus.
+
+    Routes:
+        GET    /groups                    List all groups.
+        GET    /groups/{group_id}/members Members, admins and pending members of a group.
+        POST   /groups/{group_id}/members Add the members in the JSON body {"members": [...]}.
+        DELETE /groups/{group_id}/members Remove the members in the JSON body {"members": [...]}.
+
+    Member changes answer with the members that were changed and the ones that
+    failed, with status 207 when only some and 502 when none of them were changed.
+
+    Group IDs are URL-safe base64. All D-Bus calls run on a single worker
+    thread so the event loop is never blocked by the daemon. Member changes
+    need the header 'Authorization: Bearer <token>' and are refused when no
+    token is configured.
+    """
+
+    def __init__(self, signal_dbus, groups_ttl=10.0, members_ttl=5.0, token=None):
+        self.signal_dbus = signal_dbus
+        self.token = token
+        self.groups_cache = TTLCache(groups_ttl)
+        self.members_cache = TTLCache(members_ttl)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='signal-dbus')
+
+    async def call(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def call_group(self, function, group_id, *args):
+        try:
+            return await self.call(function, group_id, *args)
+        except Exception as e:
+            if is_daemon_error(e):
+                raise
+            # getGroup fails for IDs the daemon does not know
+            raise HTTPError(HTTPStatus.NOT_FOUND, "Group not found")
+
+    def authorize(self, token):
+        if not self.token:
+            raise HTTPError(HTTPStatus.FORBIDDEN, "Member changes are disabled, set SIGNAL_API_TOKEN to enable them")
+        if token is None or not hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8')):
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "Missing or invalid bearer token")
+
+    async def list_groups(self):
+        async def load():
+            groups = await self.call(self.signal_dbus.list_groups)
+            return [{'id': encode_group_id(group_id, urlsafe=True), 'name': group_name} for group_id, group_name in groups]
+        return await self.groups_cache.get('groups', load)
+
+    async def get_members(self, encoded_group_id):
+        async def load():
+            properties = await self.call_group(self.signal_dbus.get_all_group_properties, decode_group_id(encoded_group_id))
+            if properties is None:
+                raise HTTPError(HTTPStatus.NOT_FOUND, "Group not found")
+            return {
+                'id': encoded_group_id,
+                'name': properties.get('Name'),
+                'members': list(properties.get('Members', [])),
+                'admins': list(properties.get('Admins', [])),
+                'pending': list(properties.get('PendingMembers', [])),
+            }
+        return await self.members_cache.get(encoded_group_id, load)
+
+    async def change_members(self, encoded_group_id, body, remove):
+        members = body.get('members') if isinstance(body, dict) else None
+        if not isinstance(members, list) or not all(isinstance(member, str) for member in members):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Expected a JSON body with a 'members' list")
+        group_id = decode_group_id(encoded_group_id)
+        if remove:
+            succeeded = await self.call_group(self.signal_dbus.remove_members, group_id, members)
+        else:
+            succeeded = await self.call_group(self.signal_dbus.add_members, group_id, members)
+        self.members_cache.invalidate(encoded_group_id)
+        succeeded = list(succeeded or [])
+        failed = [member for member in members if member not in succeeded]
+        if not failed:
+            status = HTTPStatus.OK
+        elif succeeded:
+            status = HTTPStatus.MULTI_STATUS
+        else:
+            status = HTTPStatus.BAD_GATEWAY
+        return status, {'id': encoded_group_id, 'removed' if remove else 'added': succeeded, 'failed': failed}
+
+    async def dispatch(self, method, path, body, token=None):
+        parts = [unquote(part) for part in urlsplit(path).path.strip('/').split('/') if part]
+        if parts == ['groups'] and method == 'GET':
+            return HTTPStatus.OK, await self.list_groups()
+        if len(parts) == 3 and parts[0] == 'groups' and parts[2] == 'members':
+            try:
+                decode_group_id(parts[1])
+            except ValueError:
+                raise HTTPError(HTTPStatus.BAD_REQUEST, "Invalid group ID")
+            if method == 'GET':
+                return HTTPStatus.OK, await self.get_members(parts[1])
+            if method in ('POST', 'DELETE'):
+                self.authorize(token)
+                return await self.change_members(parts[1], body, remove=(method == 'DELETE'))
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Method not allowed")
+        raise HTTPError(HTTPStatus.NOT_FOUND, "Not found")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_BYTES:
+                raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+            body = json.loads(await reader.readexactly(length)) if length else None
+            scheme, _, token = headers.get('authorization', '').partition(' ')
+            token = token.strip() if scheme.lower() == 'bearer' else None
+            status, payload = await self.dispatch(method.upper(), path, body, token)
+        except HTTPError as e:
+            status, payload = e.status, {'error': e.message}
+        except (ValueError, json.JSONDecodeError):
+            status, payload = HTTPStatus.BAD_REQUEST, {'error': "Malformed request"}
+        except CallAborted as e:
+            status, payload = HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(e)}
+        except Exception as e:
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+
+        data = json.dumps(payload).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + data
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Admin API listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    """
+    Run the local admin API.
+    """
+    parser = argparse.ArgumentParser(description="Local HTTP admin API for Signal groups.")
+    parser.add_argument('--host', default='127.0.0.1', help="Address to bind to.")
+    parser.add_argument('--port', type=int, default=int(os.getenv('SIGNAL_API_PORT', 8080)), help="Port to listen on.")
+    parser.add_argument('--groups-ttl', type=float, default=10.0, help="Seconds to cache the group list.")
+    parser.add_argument('--members-ttl', type=float, default=5.0, help="Seconds to cache group members.")
+    args = parser.parse_args()
+
+    if not API_TOKEN:
+        print("SIGNAL_API_TOKEN is not set, member changes are disabled.")
+    api = AdminAPI(SignalDBus(REGISTERED_NUMBER), args.groups_ttl, args.members_ttl, API_TOKEN)
+    try:
+        asyncio.run(api.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
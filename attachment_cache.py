@@ -0,0 +1,105 @@
+import hashlib
+import os
+import shutil
+
+DEFAULT_CACHE_DIR = 'env/attachment_cache'
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class AttachmentCache:
+    """
+    Content-addressed store for attachments handed to signal-cli.
+
+    Every file is hashed once (the digest is remembered per path, size and
+    modification time) and stored in a directory named after its SHA-256
+    digest under its original file name, because signal-cli sends the file
+    name of the path it is given. Sending the same flyer to many groups reads
+    and hashes it a single time, and signal-cli is given a stable copy that
+    cannot change during the fan-out and that it can read even when the
+    original is in a private directory. The least recently used entries are
+    evicted once the cache grows beyond max_bytes.
+
+    signal-cli's D-Bus interface only accepts file paths for attachments and
+    offers no way to reuse an already uploaded attachment pointer, so each send
+    still uploads the file once per recipient group.
+
+    The cache directory must be readable by the user running signal-cli.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self._digests = {}
+        os.makedirs(self.cache_dir, mode=0o755, exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(path) for path in self._entries())
+
+    def digest(self, path):
+        """
+        Returns the SHA-256 digest of a file, hashing it only if it changed
+        since the last call.
+        """
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        digest = self._digests.get(key)
+        if digest is None:
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as file:
+                for block in iter(lambda: file.read(1024 * 1024), b''):
+                    sha256.update(block)
+            digest = sha256.hexdigest()
+            self._digests[key] = digest
+        return digest
+
+    def store(self, path):
+        """
+        Adds a file to the cache and returns the absolute path of the cached copy.
+        """
+        digest = self.digest(path)
+        cached_path = os.path.join(self.cache_dir, digest[:2], digest, os.path.basename(path))
+        if os.path.exists(cached_path):
+            # Mark as recently used for eviction
+            os.utime(cached_path)
+            return cached_path
+
+        os.makedirs(os.path.dirname(cached_path), mode=0o755, exist_ok=True)
+        temp_path = cached_path + '.tmp'
+        shutil.copyfile(path, temp_path)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, cached_path)
+        self.total_bytes += os.path.getsize(cached_path)
+        self.evict(keep=cached_path)
+        return cached_path
+
+    def resolve(self, paths):
+        """
+        Stores a list of attachment paths and returns the cached paths in the same order.
+        """
+        return [self.store(path) for path in paths or []]
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used entries until the cache fits into max_bytes.
+        """
+        if self.total_bytes <= self.max_bytes:
+            return
+        entries = sorted(self._entries(), key=os.path.getmtime)
+        for path in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            size = os.path.getsize(path)
+            os.remove(path)
+            self.total_bytes -= size
+            try:
+                # The digest directory goes once its last file name is evicted
+                os.rmdir(os.path.dirname(path))
+            except OSError:
+                pass
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.tmp'):
+                    yield os.path.join(root, name)
@@ -0,0 +1,187 @@
+import getpass
+import gzip
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from utils import encode_group_id
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+MEMBER_METHODS = {'addMembers', 'removeMembers', 'addAdmins', 'removeAdmins'}
+
+
+def default_actor():
+    return os.getenv('SIGNAL_AUDIT_ACTOR') or (
+        f"{getpass.getuser()}@{socket.gethostname()}:{os.path.basename(sys.argv[0]) or 'python'}"
+    )
+
+
+class AuditLog:
+    """
+    Append-only audit log of every mutating D-Bus call made by a SignalDBus instance.
+
+    The mutation listener only puts the raw call on an in-memory queue. A
+    background thread turns queued calls into JSON lines and writes them in
+    batches, one write and flush per batch, to gzip compressed files under
+    directory. A new file is started when the current one exceeds max_bytes,
+    existing files are never rewritten.
+
+    When the queue is full the caller waits up to put_timeout seconds for
+    room. Records that still do not fit are dropped, and a 'dropped' record
+    with their count is written into the log itself. The writer is not a
+    daemon thread: if the program ends without closing the log, the writer
+    still writes everything queued before the process exits.
+    """
+
+    def __init__(self, directory='env/audit', actor=None, max_bytes=DEFAULT_MAX_BYTES, batch_size=1000, max_queue=100000,
+                 put_timeout=5.0):
+        self.directory = directory
+        self.actor = actor or default_actor()
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.signal_dbus = None
+        self.written = 0
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._closed = False
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='audit-log')
+        self._thread.start()
+
+    def attach(self, signal_dbus):
+        self.signal_dbus = signal_dbus
+        signal_dbus.add_mutation_listener(self.on_mutation)
+
+    def on_mutation(self, object_path, method, args, result, error, latency):
+        try:
+            self._queue.put((time.time(), object_path, method, args, result, error, latency), timeout=self.put_timeout)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def _open(self):
+        # Several processes may log at the same time, so every file name includes the PID
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        path = os.path.join(self.directory, f"audit-{stamp}-{os.getpid()}.jsonl.gz")
+        counter = 1
+        while os.path.exists(path):
+            # Files are rotated more than once a second, never append to a finished file
+            path = os.path.join(self.directory, f"audit-{stamp}-{os.getpid()}-{counter}.jsonl.gz")
+            counter += 1
+        self._raw_file = open(path, 'ab')
+        self._file = gzip.GzipFile(fileobj=self._raw_file, mode='ab')
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._raw_file.close()
+            self._file = None
+
+    def _format(self, call):
+        timestamp, object_path, method, args, result, error, latency = call
+        record = {
+            'time': datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec='milliseconds'),
+            'actor': self.actor,
+            'operation': method,
+            'ok': error is None,
+            'latency_ms': round(latency * 1000, 1),
+        }
+        if method == 'createGroup':
+            record['group'] = encode_group_id(result) if result else None
+            record['group_name'] = args[0]
+            record['members'] = list(args[1])
+        else:
+            group_id = self.signal_dbus.group_id_for_path(object_path) if self.signal_dbus is not None else None
+            record['group'] = encode_group_id(group_id) if group_id else object_path
+            if method in MEMBER_METHODS:
+                record['members'] = list(args[0])
+            elif method == 'Set':
+                record['property'] = args[1]
+                record['value'] = args[2]
+            elif args:
+                record['args'] = list(args)
+        if error is not None:
+            record['error'] = str(error)
+        return json.dumps(record, separators=(',', ':'), default=str)
+
+    def _dropped_record(self):
+        # Records the calls dropped since the last batch, so gaps are visible in the log itself
+        with self._dropped_lock:
+            count = self.dropped - self._reported_dropped
+            self._reported_dropped = self.dropped
+        if not count:
+            return ''
+        record = {
+            'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'actor': self.actor,
+            'operation': 'dropped',
+            'ok': False,
+            'count': count,
+        }
+        return json.dumps(record, separators=(',', ':')) + '\n'
+
+    def _write_batch(self, batch):
+        if self._file is None:
+            self._open()
+        data = (self._dropped_record() + ''.join(self._format(call) + '\n' for call in batch)).encode('utf-8')
+        self._file.write(data)
+        # Group commit: one flush per batch instead of one per record
+        self._file.flush()
+        self._raw_file.flush()
+        self.written += len(batch)
+        if self._raw_file.tell() >= self.max_bytes:
+            self._close_file()
+
+    def _run(self):
+        while True:
+            # Everything queued while the previous batch was written goes into the next one
+            try:
+                call = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if threading.main_thread().is_alive():
+                    continue
+                # The program ended without closing the log and everything queued is written
+                call = None
+            batch = []
+            while call is not None:
+                batch.append(call)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    call = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    print(f"Error writing audit log: {str(e)}", file=sys.stderr)
+            if call is None:
+                break
+        if self.dropped != self._reported_dropped:
+            try:
+                self._write_batch([])
+            except Exception as e:
+                print(f"Error writing audit log: {str(e)}", file=sys.stderr)
+        self._close_file()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.signal_dbus is not None:
+            self.signal_dbus.remove_mutation_listener(self.on_mutation)
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self.dropped:
+            print(f"Audit log dropped {self.dropped} records because the queue was full.", file=sys.stderr)
@@ -0,0 +1,97 @@
+import csv
+import os
+import random
+
+
+def group_count(member_rows):
+    return max(10, min(2000, member_rows // 100))
+
+
+def group_id(index):
+    # Group IDs are stored as the string form of the byte list, like groups_created.csv
+    rng = random.Random(index)
+    return str([rng.randrange(256) for _ in range(32)])
+
+
+def phone_number(index):
+    return f"+4915{index:09d}"
+
+
+def write_fixtures(directory, member_rows, seed=0):
+    """
+    Write a members.csv and groups_created.csv of the given size.
+
+    Every member is in one to three groups and about one in twenty is an
+    admin of one of them. Existing fixtures of the same size are reused.
+
+    Args:
+        directory (str): Directory to write the fixtures to.
+        member_rows (int): Number of rows in members.csv.
+        seed (int): Seed for the random generator.
+
+    Returns:
+        tuple: (member_csv_file_path, groups_created_file_path)
+    """
+    os.makedirs(directory, exist_ok=True)
+    member_csv_file_path = os.path.join(directory, f'members-{member_rows}.csv')
+    groups_created_file_path = os.path.join(directory, f'groups_created-{member_rows}.csv')
+    if os.path.exists(member_csv_file_path) and os.path.exists(groups_created_file_path):
+        return member_csv_file_path, groups_created_file_path
+
+    groups = [f"Group {index:04d}" for index in range(group_count(member_rows))]
+    with open(groups_created_file_path, 'w', newline='', encoding='UTF-8') as groups_created_file:
+        writer = csv.writer(groups_created_file)
+        writer.writerow(['Group Name', 'Group ID'])
+        for index, group_name in enumerate(groups):
+            writer.writerow([group_name, group_id(index)])
+
+    rng = random.Random(seed)
+    with open(member_csv_file_path, 'w', newline='', encoding='UTF-8') as member_csv_file:
+        writer = csv.writer(member_csv_file)
+        writer.writerow(['Name', 'Phone Number', 'Group Name', 'Group Admin'])
+        for index in range(member_rows):
+            member_groups = rng.sample(groups, rng.randint(1, 3))
+            admin_groups = member_groups[:1] if rng.random() < 0.05 else []
+            writer.writerow([f"Member {index}", phone_number(index), ';'.join(member_groups), ';'.join(admin_groups)])
+    return member_csv_file_path, groups_created_file_path
+
+
+class FakeSignalDBus:
+    """
+    Stand-in for SignalDBus that answers from memory.
+
+    Every number is registered. Each group's existing members are the desired
+    members with one in twenty missing and a few departed members added, so
+    the diff has work to do in both directions.
+    """
+
+    def __init__(self, group_members=None):
+        self.existing_members = {}
+        self.calls = 0
+        if group_members:
+            self.set_desired_members(group_members)
+
+    def set_desired_members(self, group_members):
+        self.existing_members = {}
+        for group_id, members in group_members.items():
+            existing = [member for index, member in enumerate(members) if index % 20]
+            existing.extend(f"+4917{index:09d}" for index in range(max(1, len(members) // 20)))
+            self.existing_members[group_id] = existing
+
+    def is_registered(self, number):
+        return True
+
+    def get_group_property(self, group_id, property_name):
+        return self.existing_members.get(str(group_id), [])
+
+    def add_members(self, group_id, recipients):
+        self.calls += 1
+        return list(recipients)
+
+    def remove_members(self, group_id, recipients):
+        self.calls += 1
+        return list(recipients)
+
+    def add_admins(self, group_id, recipients):
+        self.calls += 1
+        return list(recipients)
@@ -0,0 +1,226 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import FakeSignalDBus, write_fixtures  # noqa: E402
+from group_sync import (  # noqa: E402
+    apply_group_memberships,
+    get_existing_group_names,
+    get_group_id_by_name,
+    load_group_ids,
+    load_group_memberships,
+)
+from signal_dbus import SignalDBus  # noqa: E402
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+# Cases that scale quadratically are skipped above this many member rows
+QUADRATIC_LIMIT = 100000
+
+
+def bench_process_csv_file(member_csv_file_path, groups_created_file_path):
+    return lambda: SignalDBus.process_csv_file(member_csv_file_path)
+
+
+def bench_get_existing_group_names(member_csv_file_path, groups_created_file_path):
+    return lambda: get_existing_group_names(groups_created_file_path)
+
+
+def bench_get_group_id_by_name(member_csv_file_path, groups_created_file_path):
+    group_names = list(load_group_ids(groups_created_file_path))
+
+    def run():
+        for group_name in group_names:
+            get_group_id_by_name(groups_created_file_path, group_name)
+    return run
+
+
+def bench_load_group_memberships(member_csv_file_path, groups_created_file_path):
+    return lambda: load_group_memberships(FakeSignalDBus(), member_csv_file_path, groups_created_file_path)
+
+
+def bench_member_diff(member_csv_file_path, groups_created_file_path):
+    group_id_to_name = {group_id: group_name for group_name, group_id in load_group_ids(groups_created_file_path).items()}
+    group_members, group_admins = load_group_memberships(FakeSignalDBus(), member_csv_file_path, groups_created_file_path)
+    signal_dbus = FakeSignalDBus(group_members)
+    return lambda: apply_group_memberships(signal_dbus, group_members, group_admins, group_id_to_name)
+
+
+# (name, setup, quadratic) where setup returns the callable to time
+CASES = [
+    ('process_csv_file', bench_process_csv_file, False),
+    ('get_existing_group_names', bench_get_existing_group_names, False),
+    ('get_group_id_by_name', bench_get_group_id_by_name, True),
+    ('load_group_memberships', bench_load_group_memberships, False),
+    ('member_diff', bench_member_diff, True),
+]
+
+
+def measure(function, repeat):
+    """
+    Time a function and return the fastest of several runs.
+
+    Args:
+        function (callable): The function to time.
+        repeat (int): Number of runs.
+
+    Returns:
+        float: The fastest run in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        # The sync functions print progress, which would dominate the timings
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - started
+        best = min(best, elapsed)
+    return best
+
+
+def calibrate(repeat=5):
+    # A fixed workload of CSV parsing and dict building, used to scale the baseline to the current machine speed
+    rows = '\n'.join(f"{index},+4915{index:09d},Group {index % 97}" for index in range(20000))
+
+    def workload():
+        index = {}
+        for row in csv.reader(io.StringIO(rows)):
+            index.setdefault(row[2], []).append(row[1])
+        return index
+    return measure(workload, repeat)
+
+
+def run_benchmarks(sizes, fixtures_dir, repeat=5, cases=None):
+    """
+    Run the benchmark cases for each fixture size.
+
+    Args:
+        sizes (list): Numbers of member rows to generate fixtures for.
+        fixtures_dir (str): Directory for the generated fixtures.
+        repeat (int): Runs per case, the fastest one is reported.
+        cases (list): Optional names of the cases to run.
+
+    Returns:
+        dict: Seconds per run keyed by "case[size]".
+    """
+    results = {}
+    for size in sizes:
+        member_csv_file_path, groups_created_file_path = write_fixtures(fixtures_dir, size)
+        for name, setup, quadratic in CASES:
+            if cases and name not in cases:
+                continue
+            if quadratic and size > QUADRATIC_LIMIT:
+                continue
+            key = f"{name}[{size}]"
+            # Large fixtures are only timed once, they take long enough to be stable
+            results[key] = measure(setup(member_csv_file_path, groups_created_file_path), repeat if size <= 100000 else 1)
+            print(f"{key:40} {results[key] * 1000:12.2f} ms")
+    return results
+
+
+def load_baseline(baseline_path):
+    if not os.path.exists(baseline_path):
+        return None
+    with open(baseline_path, 'r', encoding='UTF-8') as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(baseline_path, results, calibration):
+    baseline = {
+        'python': platform.python_version(),
+        'machine': platform.node(),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'calibration': calibration,
+        'results': results,
+    }
+    with open(baseline_path, 'w', encoding='UTF-8') as baseline_file:
+        json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+
+
+def compare(results, calibration, baseline, tolerance=0.25, min_delta=0.002):
+    """
+    Compare results against a baseline.
+
+    The baseline timings are scaled by the ratio of the current calibration
+    run to the one stored with the baseline, which absorbs differences in
+    machine speed and load. A case regresses when it is slower than the
+    scaled baseline by more than tolerance and by more than min_delta
+    seconds, so that noise on the fastest cases is not reported.
+
+    Args:
+        results (dict): Seconds per run keyed by "case[size]".
+        calibration (float): Seconds of the current calibration run.
+        baseline (dict): A baseline as written by save_baseline.
+        tolerance (float): Allowed relative slowdown.
+        min_delta (float): Allowed absolute slowdown in seconds.
+
+    Returns:
+        list: Keys of the cases that regressed.
+    """
+    if baseline.get('machine') != platform.node() or baseline.get('python') != platform.python_version():
+        print(f"Note: the baseline was recorded on {baseline.get('machine')} with Python {baseline.get('python')}.")
+    scale = calibration / baseline['calibration'] if baseline.get('calibration') else 1.0
+    print(f"Machine speed relative to the baseline: {1 / scale:.2f}x")
+    regressions = []
+    for key, seconds in results.items():
+        previous = baseline['results'].get(key)
+        if previous is None:
+            continue
+        previous *= scale
+        change = (seconds - previous) / previous if previous else 0.0
+        marker = ''
+        if seconds - previous > min_delta and change > tolerance:
+            marker = '  REGRESSION'
+            regressions.append(key)
+        print(f"{key:40} {previous * 1000:12.2f} ms -> {seconds * 1000:12.2f} ms  {change:+7.1%}{marker}")
+    return regressions
+
+
+def main():
+    """
+    Run the benchmarks and compare them with the stored baseline.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the local computation of group_sync.")
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma separated numbers of member rows.")
+    parser.add_argument('--cases', help="Comma separated case names to run, defaults to all.")
+    parser.add_argument('--repeat', type=int, default=5, help="Runs per case, the fastest one is reported.")
+    parser.add_argument('--fixtures', help="Directory to keep generated fixtures in, defaults to a temporary directory.")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help="Path to the baseline JSON file.")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown before a case counts as a regression.")
+    parser.add_argument('--save', action='store_true', help="Store the results as the new baseline.")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    cases = args.cases.split(',') if args.cases else None
+    if args.fixtures:
+        results = run_benchmarks(sizes, args.fixtures, args.repeat, cases)
+    else:
+        with tempfile.TemporaryDirectory() as fixtures_dir:
+            results = run_benchmarks(sizes, fixtures_dir, args.repeat, cases)
+
+    calibration = calibrate()
+    baseline = load_baseline(args.baseline)
+    if args.save or baseline is None:
+        save_baseline(args.baseline, results, calibration)
+        print(f"Saved baseline to {args.baseline}")
+        return
+    regressions = compare(results, calibration, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} cases regressed: {', '.join(regressions)}")
+        sys.exit(1)
+    print("No regressions.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+
+# Per-method D-Bus timeouts in seconds; 'default' applies to every other method
+DEFAULT_TIMEOUTS = {
+    'default': 25.0,
+    'version': 5.0,
+    'getSelfNumber': 5.0,
+    'isRegistered': 10.0,
+    'getGroup': 10.0,
+    'Get': 15.0,
+    'GetAll': 15.0,
+    'Set': 30.0,
+    'listGroups': 60.0,
+    'createGroup': 60.0,
+    'addMembers': 90.0,
+    'removeMembers': 90.0,
+    'addAdmins': 60.0,
+    'removeAdmins': 60.0,
+    'sendMessage': 120.0,
+    'sendGroupMessage': 120.0,
+}
+
+# Error names that mean the daemon itself is unhealthy rather than the request being invalid
+DAEMON_ERRORS = (
+    'Timeout',
+    'NoReply',
+    'ServiceUnknown',
+    'NameHasNoOwner',
+    'Disconnected',
+)
+
+
+class CallAborted(BaseException):
+    """
+    Base class for errors that stop a run instead of failing a single call.
+
+    Like asyncio.CancelledError it derives from BaseException, so the
+    'except Exception' handlers that report and skip individual failed calls
+    do not swallow it.
+    """
+
+
+class DeadlineExceeded(CallAborted):
+    pass
+
+
+class CircuitOpenError(CallAborted):
+    pass
+
+
+def load_timeouts(spec=None):
+    """
+    Build the per-method timeout table.
+
+    Args:
+        spec (str): Overrides in the form 'addMembers=60,isRegistered=5,default=20',
+            defaults to the SIGNAL_DBUS_TIMEOUTS environment variable.
+
+    Returns:
+        dict: Timeouts in seconds keyed by method name.
+    """
+    timeouts = dict(DEFAULT_TIMEOUTS)
+    spec = os.getenv('SIGNAL_DBUS_TIMEOUTS', '') if spec is None else spec
+    for item in spec.split(','):
+        if '=' in item:
+            method, value = item.split('=', 1)
+            timeouts[method.strip()] = float(value)
+    return timeouts
+
+
+def is_daemon_error(error):
+    return any(name in str(error) for name in DAEMON_ERRORS)
+
+
+class Deadline:
+    """
+    Overall time budget for a run. Calls are cut short to the remaining time
+    and no new call starts once the deadline has passed or the run was cancelled.
+    """
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+        self._cancelled = threading.Event()
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise DeadlineExceeded("Run was cancelled")
+        if self.remaining() <= 0:
+            raise DeadlineExceeded("Run deadline exceeded")
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after consecutive daemon errors.
+
+    After failure_threshold consecutive daemon errors the circuit opens and
+    every call fails immediately with CircuitOpenError. Once reset_timeout
+    seconds have passed the next call first runs the probe; if the probe
+    succeeds the circuit closes again, otherwise it stays open for another
+    reset_timeout.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, probe=None):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"signal-cli daemon unavailable after {self.failures} consecutive errors")
+            try:
+                if self.probe is not None:
+                    self.probe()
+            except Exception as e:
+                self.opened_at = time.monotonic()
+                raise CircuitOpenError(f"signal-cli daemon still unavailable: {str(e)}")
+            self.opened_at = None
+            self.failures = 0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold and self.opened_at is None:
+                self.opened_at = time.monotonic()
+                print(f"Circuit opened after {self.failures} consecutive daemon errors.")
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import deque
+
+from call_policy import CallAborted
+
+
+class AdaptiveChunker:
+    """
+    Chooses the batch size for membership mutations from observed behaviour.
+
+    Successful batches that finish within target_latency grow the size
+    additively, slow batches shrink it proportionally to how far they overshot
+    and failed batches halve it.
+    """
+
+    def __init__(self, initial=50, minimum=1, maximum=500, target_latency=5.0):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self._lock = threading.Lock()
+
+    def record(self, chunk_size, latency, ok):
+        with self._lock:
+            if not ok:
+                self.size = max(self.minimum, min(self.size, chunk_size) // 2)
+            elif latency > self.target_latency:
+                self.size = max(self.minimum, int(chunk_size * self.target_latency / latency))
+            elif chunk_size >= self.size:
+                # Only grow when the full size was actually exercised
+                self.size = min(self.maximum, self.size + max(1, self.size // 4))
+
+
+def apply_in_chunks(call, items, chunker, retries=1):
+    """
+    Apply a batch operation to items in adaptively sized chunks.
+
+    A failed chunk is split in half and both halves are retried, so a bad item
+    is narrowed down to itself without losing the good ones. A single item is
+    retried up to retries times before it is reported as failed.
+
+    Args:
+        call (callable): Called with a list of items, raises on failure.
+        items (list): The items to apply.
+        chunker (AdaptiveChunker): Provides and adapts the chunk size.
+        retries (int): Retries for a single failing item.
+
+    Returns:
+        tuple: (succeeded, failed) where failed is a list of (item, error) tuples.
+    """
+    succeeded = []
+    failed = []
+    pending = deque()
+    remaining = list(items)
+    attempts = {}
+
+    while pending or remaining:
+        if pending:
+            chunk = pending.popleft()
+        else:
+            chunk, remaining = remaining[:chunker.size], remaining[chunker.size:]
+
+        started = time.monotonic()
+        try:
+            call(chunk)
+        except CallAborted:
+            raise
+        except Exception as e:
+            chunker.record(len(chunk), time.monotonic() - started, ok=False)
+            if len(chunk) > 1:
+                middle = len(chunk) // 2
+                pending.extendleft([chunk[middle:], chunk[:middle]])
+                continue
+            item = chunk[0]
+            attempts[item] = attempts.get(item, 0) + 1
+            if attempts[item] <= retries:
+                pending.appendleft(chunk)
+            else:
+                failed.append((item, str(e)))
+            continue
+        chunker.record(len(chunk), time.monotonic() - started, ok=True)
+        succeeded.extend(chunk)
+
+    return succeeded, failed
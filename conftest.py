@@ -0,0 +1,2 @@
+# tests/test_dbus.py is a manual script that sends a real message when imported
+collect_ignore = ['tests/test_dbus.py']
@@ -0,0 +1,120 @@
+import csv
+import hashlib
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_STATE_PATH = 'env/contact_names.json'
+
+
+def name_hash(name):
+    return hashlib.sha1(name.encode('utf-8')).hexdigest()[:16]
+
+
+def load_state(state_file_path):
+    """
+    Load the hashes of the last pushed contact names.
+
+    Args:
+        state_file_path (str): Path to the JSON state file.
+
+    Returns:
+        dict: Name hashes keyed by phone number.
+    """
+    if not os.path.exists(state_file_path):
+        return {}
+    with open(state_file_path, 'r', encoding='UTF-8') as state_file:
+        return json.load(state_file)
+
+
+def save_state(state_file_path, state):
+    """
+    Atomically write the contact name state.
+
+    Args:
+        state_file_path (str): Path to the JSON state file.
+        state (dict): Name hashes keyed by phone number.
+    """
+    temp_path = state_file_path + '.tmp'
+    with open(temp_path, 'w', encoding='UTF-8') as state_file:
+        json.dump(state, state_file, separators=(',', ':'))
+    os.replace(temp_path, state_file_path)
+
+
+def changed_contact_names(member_csv_file_path, state):
+    """
+    Yield the contacts whose name in the members CSV differs from the last pushed name.
+
+    Args:
+        member_csv_file_path (str): Path to the CSV file containing member information.
+        state (dict): Name hashes keyed by phone number.
+
+    Yields:
+        tuple: (phone_number, name, name_hash)
+    """
+    seen = set()
+    with open(member_csv_file_path, 'r', encoding='UTF-8') as member_csv_file:
+        for row in csv.DictReader(member_csv_file):
+            phone_number = row['Phone Number']
+            name = (row.get('Name') or '').strip()
+            if not name or phone_number in seen:
+                continue
+            seen.add(phone_number)
+            digest = name_hash(name)
+            if state.get(phone_number) != digest:
+                yield phone_number, name, digest
+
+
+def sync_contact_names(signal_dbus, member_csv_file_path, state_file_path=DEFAULT_STATE_PATH, max_workers=4, checkpoint_every=500):
+    """
+    Push the names from the members CSV into signal-cli's contact store.
+
+    Only new or changed names are pushed. At most twice max_workers calls are
+    submitted at a time and the state file is updated as calls succeed, so an
+    interrupted run stops after the calls in flight and the next run
+    continues where it stopped.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        member_csv_file_path (str): Path to the CSV file containing member information.
+        state_file_path (str): Path to the JSON file with the last pushed name hashes.
+        max_workers (int): Number of concurrent setContactName calls.
+        checkpoint_every (int): Save the state after this many updates.
+
+    Returns:
+        int: Number of names pushed.
+    """
+    state = load_state(state_file_path)
+    changes = list(changed_contact_names(member_csv_file_path, state))
+    if not changes:
+        print("Contact names are up to date.")
+        return 0
+
+    pushed = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = deque()
+            position = 0
+            try:
+                while position < len(changes) or in_flight:
+                    while position < len(changes) and len(in_flight) < max_workers * 2:
+                        phone_number, name, digest = changes[position]
+                        in_flight.append((phone_number, digest, executor.submit(signal_dbus.set_contact_name, phone_number, name)))
+                        position += 1
+                    phone_number, digest, future = in_flight.popleft()
+                    if not future.result():
+                        continue
+                    state[phone_number] = digest
+                    pushed += 1
+                    if pushed % checkpoint_every == 0:
+                        save_state(state_file_path, state)
+            finally:
+                # Calls that have not started yet are not sent after an error or interrupt
+                for _, _, future in in_flight:
+                    future.cancel()
+    finally:
+        # Keep the names pushed since the last checkpoint when a call raises or the run is interrupted
+        save_state(state_file_path, state)
+    print(f"Updated {pushed} of {len(changes)} changed contact names.")
+    return pushed
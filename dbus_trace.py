@@ -0,0 +1,364 @@
+import argparse
+import csv
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+from dotenv import load_dotenv
+
+load_dotenv()
+REGISTERED_NUMBER = os.getenv("REGISTERED_NUMBER")
+
+TRACE_VERSION = 1
+NUMBER_PATTERN = re.compile(r'^\+\d{6,15}$')
+ACCOUNT_SEGMENT_PATTERN = re.compile(r'^(/org/asamk/Signal/)_(\d{6,15})')
+
+
+class Anonymizer:
+    """
+    Replaces phone numbers with stable pseudonyms derived from a secret key.
+
+    With the same key, the same number always maps to the same pseudonym, which
+    lets a replay match live calls against the recorded ones without the trace
+    containing any real number.
+    """
+
+    def __init__(self, key):
+        self.key = key.encode('utf-8')
+        # Pseudonyms handed back on replay that have no known number, they are passed on as they are
+        self.unchanged = set()
+
+    def fingerprint(self):
+        # Stored in the trace header so a replay can tell whether it uses the recording key
+        return hmac.new(self.key, b'signal-trace-key', hashlib.sha256).hexdigest()[:16]
+
+    def number(self, number):
+        if number in self.unchanged:
+            return number
+        digest = hmac.new(self.key, number.encode('utf-8'), hashlib.sha256).hexdigest()
+        return '+999' + str(int(digest[:16], 16))[:11].zfill(11)
+
+    def value(self, value):
+        if isinstance(value, str):
+            if NUMBER_PATTERN.match(value):
+                return self.number(value)
+            match = ACCOUNT_SEGMENT_PATTERN.match(value)
+            if match:
+                return match.group(1) + '_' + self.number('+' + match.group(2))[1:] + value[match.end():]
+            return value
+        if isinstance(value, (bytes, bytearray)):
+            return list(value)
+        if isinstance(value, (list, tuple)):
+            return [self.value(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.value(item) for key, item in value.items()}
+        if hasattr(value, 'unpack'):
+            return self.value(value.unpack())
+        return value
+
+
+def trace_key():
+    # Without SIGNAL_TRACE_KEY a random key is used and the trace can be summarized but not replayed
+    key = os.getenv('SIGNAL_TRACE_KEY')
+    return (key, True) if key else (secrets.token_hex(16), False)
+
+
+class TraceRecorder:
+    """
+    Writes every D-Bus call made by SignalDBus to a gzip compressed JSONL trace.
+    """
+
+    def __init__(self, path):
+        key, keyed = trace_key()
+        self.anonymizer = Anonymizer(key)
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, 'wt', encoding='UTF-8')
+        header = {'version': TRACE_VERSION, 'started': time.time(), 'keyed': keyed}
+        if keyed:
+            header['key_check'] = self.anonymizer.fingerprint()
+        else:
+            print("SIGNAL_TRACE_KEY is not set, the trace can be summarized but not replayed.")
+        self._write(header)
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def record(self, object_path, method, args, latency, result=None, error=None):
+        record = {
+            't': round(time.monotonic() - self.started - latency, 6),
+            'p': self.anonymizer.value(object_path),
+            'm': method,
+            'a': self.anonymizer.value(list(args)),
+            'l': round(latency, 6),
+        }
+        if error is not None:
+            record['e'] = str(error)
+        else:
+            record['r'] = self.anonymizer.value(result)
+        with self._lock:
+            self._write(record)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def read_trace(path):
+    with gzip.open(path, 'rt', encoding='UTF-8') as trace_file:
+        header = json.loads(trace_file.readline())
+        if header.get('version') != TRACE_VERSION:
+            raise ValueError(f"Unsupported trace version {header.get('version')}")
+        records = [json.loads(line) for line in trace_file]
+    return header, records
+
+
+class ReplayError(Exception):
+    pass
+
+
+class TraceReplayer:
+    """
+    Answers D-Bus calls from a recorded trace.
+
+    Calls are matched by object path, method and arguments anonymized with
+    SIGNAL_TRACE_KEY, which has to be the key the trace was recorded with.
+    Calls without an exact match are answered by call order per method and
+    counted in unmatched. Pseudonyms in the recorded answers are turned back
+    into the phone numbers given with numbers, so the code under replay sees
+    the same numbers as its input files. Each answer is delayed by the
+    recorded latency divided by speed.
+    """
+
+    def __init__(self, path, speed=1.0, numbers=()):
+        header, records = read_trace(path)
+        if not header.get('keyed'):
+            raise ReplayError("The trace was recorded without SIGNAL_TRACE_KEY, its calls cannot be matched on replay")
+        key = os.getenv('SIGNAL_TRACE_KEY')
+        if not key:
+            raise ReplayError("Set SIGNAL_TRACE_KEY to the key the trace was recorded with")
+        self.anonymizer = Anonymizer(key)
+        if header.get('key_check', self.anonymizer.fingerprint()) != self.anonymizer.fingerprint():
+            raise ReplayError("SIGNAL_TRACE_KEY is not the key the trace was recorded with")
+        self.numbers = {}
+        self.learn_numbers(numbers)
+        self.speed = speed
+        self.records = records
+        self.by_call = defaultdict(deque)
+        self.by_method = defaultdict(deque)
+        for record in records:
+            self.by_call[self._key(record['p'], record['m'], record['a'])].append(record)
+            self.by_method[record['m']].append(record)
+        self.used = set()
+        self.unmatched = 0
+        self._lock = threading.Lock()
+
+    def learn_numbers(self, numbers):
+        for number in numbers:
+            self.numbers[self.anonymizer.number(number)] = number
+
+    def _restore(self, value):
+        if isinstance(value, str):
+            if NUMBER_PATTERN.match(value):
+                number = self.numbers.get(value)
+                if number is None:
+                    # An unknown number, for example a member missing from the CSV files, stays a pseudonym
+                    self.anonymizer.unchanged.add(value)
+                    return value
+                return number
+            match = ACCOUNT_SEGMENT_PATTERN.match(value)
+            if match:
+                number = self.numbers.get('+' + match.group(2))
+                if number is not None:
+                    return match.group(1) + '_' + number[1:] + value[match.end():]
+            return value
+        if isinstance(value, list):
+            return [self._restore(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self._restore(item) for key, item in value.items()}
+        return value
+
+    @staticmethod
+    def _key(object_path, method, args):
+        return object_path, method, json.dumps(args, sort_keys=True)
+
+    def _take(self, queue):
+        while queue:
+            record = queue.popleft()
+            if id(record) not in self.used:
+                self.used.add(id(record))
+                return record
+        return None
+
+    def answer(self, object_path, method, args):
+        with self._lock:
+            key = self._key(self.anonymizer.value(object_path), method, self.anonymizer.value(list(args)))
+            record = self._take(self.by_call[key])
+            if record is None:
+                record = self._take(self.by_method[method])
+                self.unmatched += 1
+            result = self._restore(record['r']) if record is not None and 'r' in record else None
+        if record is None:
+            raise ReplayError(f"No recorded response left for {method}")
+        if self.speed:
+            time.sleep(record['l'] / self.speed)
+        if 'e' in record:
+            raise ReplayError(record['e'])
+        return result
+
+    @property
+    def recorded_duration(self):
+        if not self.records:
+            return 0.0
+        last = max(self.records, key=lambda record: record['t'] + record['l'])
+        return last['t'] + last['l'] - self.records[0]['t']
+
+
+class ReplayProxy:
+    def __init__(self, replayer, object_path):
+        self._replayer = replayer
+        self._object_path = object_path
+
+    def __getattr__(self, method):
+        def call(*args, timeout=None):
+            return self._replayer.answer(self._object_path, method, args)
+        return call
+
+
+class ReplayBus:
+    """
+    Stand-in for pydbus.SystemBus that hands out proxies answering from a trace.
+    """
+
+    def __init__(self, replayer):
+        self.replayer = replayer
+
+    def get(self, bus_name, object_path=None, timeout=None):
+        return ReplayProxy(self.replayer, object_path)
+
+
+def summarize(path):
+    """
+    Print the call counts and latency distribution of a trace.
+
+    Args:
+        path (str): Path to the trace file.
+    """
+    header, records = read_trace(path)
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    for record in records:
+        latencies[record['m']].append(record['l'])
+        if 'e' in record:
+            errors[record['m']] += 1
+    duration = max((record['t'] + record['l'] for record in records), default=0.0)
+    print(f"Recorded {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(header['started']))}, "
+          f"{len(records)} calls over {duration:.1f}s")
+    for method, values in sorted(latencies.items(), key=lambda item: -sum(item[1])):
+        print(f"{method:20} calls {len(values):6}  total {sum(values):8.2f}s  "
+              f"median {statistics.median(values) * 1000:8.1f} ms  max {max(values) * 1000:8.1f} ms  errors {errors[method]}")
+
+
+def env_numbers(env_dir):
+    """
+    Collect the phone numbers in the CSV files of a directory.
+
+    Args:
+        env_dir (str): Directory with the CSV files.
+
+    Returns:
+        set: The phone numbers.
+    """
+    numbers = set()
+    for file_name in os.listdir(env_dir):
+        if not file_name.endswith('.csv'):
+            continue
+        with open(os.path.join(env_dir, file_name), 'r', encoding='UTF-8') as csv_file:
+            for row in csv.reader(csv_file):
+                for cell in row:
+                    for value in re.split(r'[;,\s]+', cell):
+                        if NUMBER_PATTERN.match(value):
+                            numbers.add(value)
+    return numbers
+
+
+def replay(path, speed=1.0, env_dir='env'):
+    """
+    Run group_sync against a recorded trace instead of the daemon.
+
+    The sync runs in a temporary copy of env_dir, so the files it writes
+    (groups_created.csv, contact name state) are left untouched.
+
+    Args:
+        path (str): Path to the trace file.
+        speed (float): Replay speed factor, 0 answers without delay.
+        env_dir (str): Directory with the CSV files the trace was recorded with.
+    """
+    from group_sync import run
+    from signal_dbus import SignalDBus
+
+    # Replayed calls did not happen, keep them out of the audit log and the message archive
+    os.environ.pop('SIGNAL_AUDIT_LOG', None)
+    os.environ.pop('SIGNAL_MESSAGE_ARCHIVE', None)
+    numbers = env_numbers(env_dir)
+    if REGISTERED_NUMBER:
+        numbers.add(REGISTERED_NUMBER)
+    replayer = TraceReplayer(os.path.abspath(path), speed, numbers)
+    signal_dbus = SignalDBus(REGISTERED_NUMBER, bus=ReplayBus(replayer))
+    args = SimpleNamespace(watch=False, warm_up=False, enqueue=False, skip_contact_names=False, debounce=0,
+                           approve_requests=False, reject_unknown=False, source=None, full=False,
+                           memory_budget=None, memory_report=False, concurrency=4)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        shutil.copytree(env_dir, os.path.join(work_dir, 'env'))
+        os.chdir(work_dir)
+        try:
+            started = time.monotonic()
+            run(signal_dbus, args, 'env/groups.csv', 'env/groups_created.csv', 'env/members.csv')
+            duration = time.monotonic() - started
+        finally:
+            os.chdir(cwd)
+    print(f"Replayed in {duration:.1f}s (recorded {replayer.recorded_duration:.1f}s, speed {speed}x).")
+    if replayer.unmatched:
+        print(f"Warning: {replayer.unmatched} calls differed from the recording and were answered by call order, "
+              f"check that --env holds the files the trace was recorded with.")
+
+
+def main():
+    """
+    Inspect and replay D-Bus traces.
+    """
+    parser = argparse.ArgumentParser(description="Inspect and replay recorded D-Bus traces.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    summary_parser = subparsers.add_parser('summary', help="Show call counts and latencies of a trace.")
+    summary_parser.add_argument('trace', help="Path to the trace file.")
+    replay_parser = subparsers.add_parser('replay', help="Run group_sync against a trace.")
+    replay_parser.add_argument('trace', help="Path to the trace file.")
+    replay_parser.add_argument('--speed', type=float, default=1.0, help="Speed factor, 0 for no delays.")
+    replay_parser.add_argument('--env', default='env', help="Directory with the CSV files the trace was recorded with.")
+    args = parser.parse_args()
+
+    if args.command == 'summary':
+        summarize(args.trace)
+    else:
+        try:
+            replay(args.trace, args.speed, args.env)
+        except ReplayError as e:
+            print(f"Error replaying trace: {str(e)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
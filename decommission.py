@@ -0,0 +1,171 @@
+import argparse
+import fnmatch
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from call_policy import CallAborted
+from dotenv import load_dotenv
+from signal_dbus import SignalDBus
+from utils import encode_group_id
+
+load_dotenv()
+REGISTERED_NUMBER = os.getenv("REGISTERED_NUMBER")
+
+DEFAULT_CHECKPOINT_PATH = 'env/decommission.json'
+
+
+def load_checkpoint(checkpoint_file_path):
+    """
+    Load the groups already decommissioned by earlier runs.
+
+    Args:
+        checkpoint_file_path (str): Path to the JSON checkpoint file.
+
+    Returns:
+        dict: Group names keyed by encoded group ID.
+    """
+    if not os.path.exists(checkpoint_file_path):
+        return {}
+    with open(checkpoint_file_path, 'r', encoding='UTF-8') as checkpoint_file:
+        return json.load(checkpoint_file)
+
+
+def save_checkpoint(checkpoint_file_path, done):
+    """
+    Atomically write the checkpoint.
+
+    Args:
+        checkpoint_file_path (str): Path to the JSON checkpoint file.
+        done (dict): Group names keyed by encoded group ID.
+    """
+    temp_path = checkpoint_file_path + '.tmp'
+    with open(temp_path, 'w', encoding='UTF-8') as checkpoint_file:
+        json.dump(done, checkpoint_file, indent=2)
+    os.replace(temp_path, checkpoint_file_path)
+
+
+def select_groups(signal_dbus, names=None, patterns=None):
+    """
+    Select groups by exact name or by shell-style name pattern.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        names (list): Exact group names.
+        patterns (list): Shell-style group name patterns.
+
+    Returns:
+        list: (group_id, group_name) tuples.
+    """
+    names = set(names or [])
+    patterns = patterns or []
+    groups = [
+        (group_id, group_name) for group_id, group_name in signal_dbus.list_groups()
+        if group_name in names or any(fnmatch.fnmatch(group_name or '', pattern) for pattern in patterns)
+    ]
+    missing = names - {group_name for _, group_name in groups}
+    for group_name in sorted(missing):
+        print(f"Group not found: {group_name}")
+    return groups
+
+
+def decommission_groups(signal_dbus, groups, checkpoint_file_path=DEFAULT_CHECKPOINT_PATH, max_workers=4, disable_link=False):
+    """
+    Remove all members from the groups and leave them, several groups at a time.
+
+    Finished groups are recorded in the checkpoint file as they complete, so
+    an interrupted run skips them when it is started again.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        groups (list): (group_id, group_name) tuples.
+        checkpoint_file_path (str): Path to the JSON checkpoint file.
+        max_workers (int): Number of groups torn down concurrently.
+        disable_link (bool): Disable the invite link of each group first.
+
+    Returns:
+        list: Names of the groups that could not be fully decommissioned.
+    """
+    done = load_checkpoint(checkpoint_file_path)
+    pending = [(group_id, group_name) for group_id, group_name in groups if encode_group_id(group_id) not in done]
+    if len(pending) < len(groups):
+        print(f"Skipping {len(groups) - len(pending)} groups decommissioned by an earlier run.")
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(signal_dbus.remove_group, group_id, disable_link): (group_id, group_name)
+            for group_id, group_name in pending
+        }
+        try:
+            for future in as_completed(futures):
+                group_id, group_name = futures[future]
+                if not future.result():
+                    failed.append(group_name)
+                    continue
+                done[encode_group_id(group_id)] = group_name
+                save_checkpoint(checkpoint_file_path, done)
+                print(f"Decommissioned group: {group_name}")
+        except CallAborted:
+            # Do not start the queued groups once the daemon is unavailable or the deadline passed
+            for future in futures:
+                future.cancel()
+            raise
+
+    print(f"Decommissioned {len(pending) - len(failed)} of {len(pending)} groups.")
+    return failed
+
+
+def read_names(names_file_path):
+    with open(names_file_path, 'r', encoding='UTF-8') as names_file:
+        return [line.strip() for line in names_file if line.strip()]
+
+
+def main():
+    """
+    Decommission groups selected by name or pattern.
+    """
+    parser = argparse.ArgumentParser(description="Remove all members from Signal groups and leave them.")
+    parser.add_argument('names', nargs='*', help="Exact group names.")
+    parser.add_argument('--names-file', help="File with one group name per line.")
+    parser.add_argument('--pattern', action='append', default=[], help="Shell-style group name pattern, may be repeated.")
+    parser.add_argument('--workers', type=int, default=4, help="Number of groups torn down concurrently.")
+    parser.add_argument('--disable-link', action='store_true', help="Disable the invite link of each group first.")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT_PATH, help="Path to the checkpoint file.")
+    parser.add_argument('--deadline', type=float, default=None, help="Abort after this many seconds.")
+    parser.add_argument('--yes', action='store_true', help="Do not ask for confirmation.")
+    args = parser.parse_args()
+
+    names = args.names + (read_names(args.names_file) if args.names_file else [])
+    if not names and not args.pattern:
+        parser.error("Select groups by name, --names-file or --pattern.")
+
+    signal_dbus = SignalDBus(REGISTERED_NUMBER)
+    groups = select_groups(signal_dbus, names, args.pattern)
+    if not groups:
+        print("No groups selected.")
+        return
+
+    print(f"Selected {len(groups)} groups:")
+    for _, group_name in groups[:20]:
+        print(f"  {group_name}")
+    if len(groups) > 20:
+        print(f"  ... and {len(groups) - 20} more")
+    if not args.yes and input(f"Remove all members from these {len(groups)} groups and leave them? [y/N] ").strip().lower() != 'y':
+        print("Decommissioning canceled.")
+        return
+
+    signal_dbus.set_deadline(args.deadline)
+    try:
+        failed = decommission_groups(signal_dbus, groups, args.checkpoint, args.workers, args.disable_link)
+    except CallAborted as e:
+        print(f"Decommissioning aborted, run again to resume: {str(e)}")
+        sys.exit(1)
+    if failed:
+        print(f"Could not decommission: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
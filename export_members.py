@@ -0,0 +1,195 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from signal_dbus import SignalDBus
+
+load_dotenv()
+REGISTERED_NUMBER = os.getenv("REGISTERED_NUMBER")
+
+# Same columns as templates/members.csv so exports can be diffed against the source of truth
+MEMBER_FIELDNAMES = ['Name', 'Phone Number', 'Group Name', 'Group Admin']
+
+
+def fetch_group_members(signal_dbus, groups, max_workers=4):
+    """
+    Fetch members, admins and pending members of each group with bounded parallelism.
+
+    At most twice max_workers groups are in flight at any time and results are
+    yielded in the order of the input, so memory use does not grow with the
+    number of groups.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        groups (iterable): (group_id, group_name) tuples.
+        max_workers (int): Number of concurrent D-Bus calls.
+
+    Yields:
+        tuple: (group_name, properties) where properties is the GetAll result or None.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = deque()
+        for group_id, group_name in groups:
+            in_flight.append((group_name, executor.submit(signal_dbus.get_all_group_properties, group_id)))
+            if len(in_flight) >= max_workers * 2:
+                group_name, future = in_flight.popleft()
+                yield group_name, future.result()
+        while in_flight:
+            group_name, future = in_flight.popleft()
+            yield group_name, future.result()
+
+
+def membership_rows(signal_dbus, max_workers=4, include_pending=False):
+    """
+    Generate one row per group membership.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        max_workers (int): Number of concurrent D-Bus calls.
+        include_pending (bool): Also emit rows for pending members.
+
+    Yields:
+        dict: Rows with the members.csv columns plus 'Status'.
+    """
+    groups = (group for group in signal_dbus.list_groups() if group[1])
+    for group_name, properties in fetch_group_members(signal_dbus, groups, max_workers):
+        if properties is None:
+            print(f"Skipping group '{group_name}', its members could not be read.", file=sys.stderr)
+            continue
+        admins = set(properties.get('Admins', []))
+        for member in properties.get('Members', []):
+            yield {
+                'Name': '',
+                'Phone Number': member,
+                'Group Name': group_name,
+                'Group Admin': group_name if member in admins else '',
+                'Status': 'member',
+            }
+        if include_pending:
+            for member in properties.get('PendingMembers', []):
+                yield {'Name': '', 'Phone Number': member, 'Group Name': group_name, 'Group Admin': '', 'Status': 'pending'}
+
+
+def person_rows(memberships, include_pending=False):
+    """
+    Aggregate membership rows into one row per phone number, like members.csv.
+
+    The memberships are spilled into a temporary SQLite database and read
+    back sorted by phone number, so memory use does not grow with the number
+    of members.
+
+    Args:
+        memberships (iterable): Rows as generated by membership_rows.
+        include_pending (bool): Add a 'Pending Group' column with the groups the number is pending in.
+
+    Yields:
+        dict: Rows with the members.csv columns, groups joined with ';' and sorted by name.
+    """
+    with tempfile.TemporaryDirectory(prefix='export_members-') as spill_dir:
+        connection = sqlite3.connect(os.path.join(spill_dir, 'memberships.sqlite3'))
+        try:
+            connection.execute('CREATE TABLE memberships (phone TEXT, group_name TEXT, admin INTEGER, pending INTEGER)')
+            with connection:
+                connection.executemany('INSERT INTO memberships VALUES (?, ?, ?, ?)', (
+                    (row['Phone Number'], row['Group Name'], bool(row['Group Admin']), row['Status'] == 'pending')
+                    for row in memberships
+                ))
+            person = None
+            for phone_number, group_name, admin, pending in connection.execute(
+                'SELECT phone, group_name, admin, pending FROM memberships ORDER BY phone, group_name'
+            ):
+                if person is None or person[0] != phone_number:
+                    if person is not None:
+                        yield person_row(*person, include_pending)
+                    person = (phone_number, [], [], [])
+                if pending:
+                    person[3].append(group_name)
+                else:
+                    person[1].append(group_name)
+                    if admin:
+                        person[2].append(group_name)
+            if person is not None:
+                yield person_row(*person, include_pending)
+        finally:
+            connection.close()
+
+
+def person_row(phone_number, groups, admin_groups, pending_groups, include_pending):
+    row = {'Name': '', 'Phone Number': phone_number, 'Group Name': ';'.join(groups), 'Group Admin': ';'.join(admin_groups)}
+    if include_pending:
+        row['Pending Group'] = ';'.join(pending_groups)
+    return row
+
+
+def export_memberships(signal_dbus, output_file, output_format='csv', max_workers=4, include_pending=False, long_format=False):
+    """
+    Stream the membership of all groups to a file.
+
+    By default there is one row per phone number in the members.csv format,
+    so the export can be diffed against members.csv. With long_format there
+    is one row per membership instead.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        output_file: A writable text file.
+        output_format (str): 'csv' or 'jsonl'.
+        max_workers (int): Number of concurrent D-Bus calls.
+        include_pending (bool): Also export pending members (adds a 'Pending Group' column, or a
+            'Status' column in the long format).
+        long_format (bool): Write one row per membership.
+
+    Returns:
+        int: Number of rows written.
+    """
+    count = 0
+    rows = membership_rows(signal_dbus, max_workers, include_pending)
+    if long_format:
+        extra_fieldnames = ['Status'] if include_pending else []
+    else:
+        rows = person_rows(rows, include_pending)
+        extra_fieldnames = ['Pending Group'] if include_pending else []
+    if output_format == 'jsonl':
+        for row in rows:
+            output_file.write(json.dumps(row, ensure_ascii=False) + '\n')
+            count += 1
+        return count
+
+    fieldnames = MEMBER_FIELDNAMES + extra_fieldnames
+    writer = csv.DictWriter(output_file, fieldnames=fieldnames, extrasaction='ignore')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def main():
+    """
+    Export the members of all groups.
+    """
+    parser = argparse.ArgumentParser(description="Export the members of all groups in members.csv format.")
+    parser.add_argument('--output', help="Output file, defaults to stdout.")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv', help="Output format.")
+    parser.add_argument('--workers', type=int, default=4, help="Number of concurrent D-Bus calls.")
+    parser.add_argument('--include-pending', action='store_true', help="Also export pending members.")
+    parser.add_argument('--long', action='store_true', help="Write one row per membership instead of one row per person.")
+    args = parser.parse_args()
+
+    signal_dbus = SignalDBus(REGISTERED_NUMBER)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF-8', newline='') as output_file:
+            count = export_memberships(signal_dbus, output_file, args.format, args.workers, args.include_pending, args.long)
+        print(f"Exported {count} rows to '{args.output}'.")
+    else:
+        export_memberships(signal_dbus, sys.stdout, args.format, args.workers, args.include_pending, args.long)
+
+
+if __name__ == '__main__':
+    main()
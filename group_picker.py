@@ -0,0 +1,149 @@
+import bisect
+import re
+from collections import defaultdict
+
+import inquirer
+
+from utils import encode_group_id
+
+SEARCH_AGAIN = object()
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class GroupIndex:
+    """
+    Search index over group names and IDs.
+
+    Prefixes of names, words and base64 IDs are looked up in sorted lists with
+    bisect, substrings and misspelled names through a trigram index. When a
+    query extends the previous one, only the previous exact matches are
+    searched again, so typing a query character by character stays cheap.
+    """
+
+    def __init__(self, groups):
+        self.groups = [
+            (group_id, group_name, group_id if isinstance(group_id, str) else encode_group_id(group_id) or '')
+            for group_id, group_name in groups if group_name
+        ]
+        self.names = [group_name.lower() for _, group_name, _ in self.groups]
+        self.ids = [encoded_id.lower() for _, _, encoded_id in self.groups]
+        self.prefixes = sorted(
+            [(key, position) for position, name in enumerate(self.names)
+             for key in {name} | set(re.findall(r'\w+', name))]
+            + [(encoded_id, position) for position, encoded_id in enumerate(self.ids)]
+        )
+        self.trigrams = defaultdict(set)
+        for position, name in enumerate(self.names):
+            for trigram in trigrams(name):
+                self.trigrams[trigram].add(position)
+        self._last_query = None
+        self._last_exact = None
+
+    def _prefix_matches(self, query):
+        matches = set()
+        start = bisect.bisect_left(self.prefixes, (query, -1))
+        for key, position in self.prefixes[start:]:
+            if not key.startswith(query):
+                break
+            matches.add(position)
+        return matches
+
+    def _exact_matches(self, query):
+        matches = self._prefix_matches(query)
+        # Every name containing the query contains its first trigram as well
+        positions = self.trigrams.get(query[:3], ()) if len(query) >= 3 else range(len(self.names))
+        matches |= {position for position in positions if query in self.names[position]}
+        return matches
+
+    def _fuzzy_matches(self, query):
+        if len(query) < 3:
+            return set()
+        query_trigrams = trigrams(query)
+        counts = defaultdict(int)
+        for trigram in query_trigrams:
+            for position in self.trigrams.get(trigram, ()):
+                counts[position] += 1
+        # Require half of the trigrams to match so typos and swapped letters still find the group
+        threshold = max(1, len(query_trigrams) // 2)
+        return {position for position, count in counts.items() if count >= threshold}
+
+    def _candidates(self, query):
+        if self._last_query and query.startswith(self._last_query):
+            # Every exact match of the longer query is an exact match of the previous query as well
+            exact = {position for position in self._last_exact
+                     if query in self.names[position] or self.ids[position].startswith(query)}
+        else:
+            exact = self._exact_matches(query)
+        self._last_query, self._last_exact = query, exact
+        # Fuzzy matches of the longer query need not match the previous one, so they are looked up again
+        return exact | self._fuzzy_matches(query)
+
+    def _score(self, query, position):
+        name = self.names[position]
+        if name == query:
+            return 0
+        if name.startswith(query):
+            return 1
+        if any(word.startswith(query) for word in re.findall(r'\w+', name)):
+            return 2
+        if query in name:
+            return 3
+        if self.ids[position].startswith(query):
+            return 4
+        return 5
+
+    def search(self, query, limit=20):
+        """
+        Returns up to limit (group_id, group_name, encoded_id) tuples ranked by relevance.
+        """
+        query = query.strip().lower()
+        if not query:
+            self._last_query = None
+            return self.groups[:limit]
+        candidates = self._candidates(query)
+        ranked = sorted(candidates, key=lambda position: (self._score(query, position), self.names[position]))
+        return [self.groups[position] for position in ranked[:limit]]
+
+
+def pick_group(signal_manager, message, limit=20):
+    """
+    Lets the admin search for a group by name or ID and pick one of the ranked matches.
+
+    Args:
+        signal_manager: An instance of the Signal Manager.
+        message (str): The prompt shown to the admin.
+        limit (int): Maximum number of matches to show.
+
+    Returns:
+        tuple: (group_id, group_name) of the selected group, or None if there are no groups.
+    """
+    groups = signal_manager.list_groups()
+    index = GroupIndex(groups)
+    if not index.groups:
+        print("No groups found.")
+        return None
+
+    # Names that occur more than once are shown with their ID so they can be told apart
+    name_counts = defaultdict(int)
+    for _, group_name, _ in index.groups:
+        name_counts[group_name] += 1
+
+    while True:
+        query = inquirer.text(f"{message} Type part of the name or ID (empty to list all):")
+        matches = index.search(query or '', limit)
+        if not matches:
+            print("No matching groups.")
+            continue
+
+        choices = []
+        for group_id, group_name, encoded_id in matches:
+            label = f"{group_name}  [{encoded_id[:8]}]" if name_counts[group_name] > 1 else group_name
+            choices.append((label, (group_id, group_name)))
+        choices.append(("Search again", SEARCH_AGAIN))
+        selected = inquirer.list_input(message, choices=choices)
+        if selected is not SEARCH_AGAIN:
+            return selected
@@ -1,13 +1,61 @@
+import argparse
 import csv
+import hashlib
 import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from call_policy import CallAborted
+from contact_sync import sync_contact_names
 from dotenv import load_dotenv
+from gi.repository import GLib, Gio
+from job_queue import JobQueue
+from memory_budget import DiskCache, MemoryReport, needs_spilling, partition_count, read_partition, spill_rows
+from probe import wait_until_ready, warm_up
+from scheduler import load_group_priorities, schedule_deltas
 from signal_dbus import SignalDBus
+from sources import DEFAULT_CURSOR_PATH, CSVSource, CursorInvalid, load_cursors, open_source, save_cursor
 
 load_dotenv()
 REGISTERED_NUMBER = os.getenv("REGISTERED_NUMBER")
 
 
+# Group properties managed through groups.csv, keyed by CSV column. The
+# D-Bus names of the permissions are singular, unlike the CSV columns.
+GROUP_PROPERTY_COLUMNS = {
+    'Group Name': 'Name',
+    'Group Description': 'Description',
+    'PermissionAddMembers': 'PermissionAddMember',
+    'PermissionEditDetails': 'PermissionEditDetails',
+    'PermissionSendMessages': 'PermissionSendMessage',
+}
+
+
+def group_property_changes(row, current):
+    """
+    Compare a row of the groups CSV file with the current properties of its group.
+
+    Args:
+        row (dict): A row of the groups CSV file.
+        current (dict): The group's properties as returned by GetAll, keyed by D-Bus property name.
+
+    Returns:
+        dict: The properties that differ, keyed by D-Bus property name.
+    """
+    changes = {}
+    for column, property_name in GROUP_PROPERTY_COLUMNS.items():
+        desired = row.get(column)
+        # Empty permission cells leave the current setting alone
+        if desired is None or (not desired and column.startswith('Permission')):
+            continue
+        if current.get(property_name) != desired:
+            changes[property_name] = desired
+    return changes
+
+
 def create_groups_from_csv(signal_dbus, group_csv_file_path, groups_created_file_path):
     """
     Create Signal groups from a CSV file.
@@ -26,18 +74,11 @@ def create_groups_from_csv(signal_dbus, group_csv_file_path, groups_created_file
     created_rows = []
     for row in rows:
         group_name = row['Group Name']
-        group_description = row['Group Description']
-        permission_add_members = row['PermissionAddMembers']
-        permission_edit_details = row['PermissionEditDetails']
-        permission_send_messages = row['PermissionSendMessages']
-        
+
         if group_name not in existing_group_names:
             # Create the group if it doesn't exist and add it to the groups_created.csv file
             group_id = signal_dbus.create_group(group_name, [])
-            signal_dbus.set_group_property(group_id, 'Description', group_description)
-            signal_dbus.set_group_property(group_id, 'PermissionAddMembers', permission_add_members)
-            signal_dbus.set_group_property(group_id, 'PermissionEditDetails', permission_edit_details)
-            signal_dbus.set_group_property(group_id, 'PermissionSendMessages', permission_send_messages)
+            signal_dbus.set_group_properties(group_id, group_property_changes(row, {'Name': group_name}))
             created_rows.append({'Group ID': str(group_id), 'Group Name': group_name})
             print(f"Created group: {group_name}")
         else:
@@ -52,6 +93,43 @@ def create_groups_from_csv(signal_dbus, group_csv_file_path, groups_created_file
             writer.writeheader()
         writer.writerows(created_rows)
 
+def reconcile_groups_from_csv(signal_dbus, group_csv_file_path, groups_created_file_path):
+    """
+    Correct drift between the groups in Signal and the groups CSV file.
+
+    Each group's current state is read with a single GetAll call and only the
+    properties that differ from the CSV are written.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        group_csv_file_path (str): Path to the CSV file containing group information.
+        groups_created_file_path (str): Path to the CSV file containing created group information.
+    """
+    if not os.path.exists(groups_created_file_path):
+        return
+    group_name_to_id = load_group_ids(groups_created_file_path)
+
+    with open(group_csv_file_path, 'r', encoding='UTF-8') as group_csv_file:
+        reader = csv.DictReader(group_csv_file)
+        rows = list(reader)
+
+    updated_groups = 0
+    for row in rows:
+        group_id = group_name_to_id.get(row['Group Name'])
+        if not group_id:
+            continue
+        current = signal_dbus.get_all_group_properties(eval(group_id))
+        if current is None:
+            continue
+
+        changes = group_property_changes(row, current)
+        if changes:
+            print(f"Updating {', '.join(changes)} for group: {row['Group Name']}")
+            signal_dbus.set_group_properties(eval(group_id), changes)
+            updated_groups += 1
+    print(f"Reconciled {len(rows)} groups, {updated_groups} needed changes.")
+
+
 def get_existing_group_names(groups_created_file_path):
     """
     Retrieve the existing group names from the groups_created.csv file.
@@ -90,80 +168,756 @@ def get_group_id_by_name(groups_created_file_path, group_name):
     return None
 
 
-def sync_group_members_from_csv(signal_dbus, member_csv_file_path, groups_created_file_path):
+def load_group_ids(groups_created_file_path):
     """
-    Synchronize Signal group members from a CSV file.
+    Load the group name to group ID mapping from the groups_created.csv file.
 
     Args:
-        signal_dbus (SignalDBus): An instance of the SignalDBus class.
-        member_csv_file_path (str): Path to the CSV file containing member information.
         groups_created_file_path (str): Path to the CSV file containing created group information.
+
+    Returns:
+        dict: Group IDs (as strings) keyed by group name.
     """
-    group_id_to_name = {}
+    group_name_to_id = {}
     with open(groups_created_file_path, 'r', encoding='UTF-8') as groups_created_file:
         reader = csv.DictReader(groups_created_file)
         for row in reader:
-            group_id_to_name[row['Group ID']] = row['Group Name']
+            group_name_to_id.setdefault(row['Group Name'], row['Group ID'])
+    return group_name_to_id
 
-    with open(member_csv_file_path, 'r', encoding='UTF-8') as member_csv_file:
-        reader = csv.DictReader(member_csv_file)
-        group_members = {}
-        group_admins = {}
-        for row in reader:
-            phone_number = row['Phone Number']
-            group_names = row['Group Name'].split(';')
-            admin_groups = row['Group Admin'].split(';') if row['Group Admin'] else []
-            
-            if not signal_dbus.is_registered(phone_number):
+
+class RegistrationCache:
+    """
+    Dictionary-like cache of registration results that forgets unregistered
+    numbers after negative_ttl seconds, so numbers that register later are
+    picked up by long-running processes. Registered numbers are kept.
+    """
+
+    def __init__(self, negative_ttl=300):
+        self.negative_ttl = negative_ttl
+        self.results = {}
+
+    def __contains__(self, key):
+        if key not in self.results:
+            return False
+        registered, checked = self.results[key]
+        if not registered and time.monotonic() - checked >= self.negative_ttl:
+            del self.results[key]
+            return False
+        return True
+
+    def __getitem__(self, key):
+        return self.results[key][0]
+
+    def __setitem__(self, key, value):
+        self.results[key] = (bool(value), time.monotonic())
+
+
+def load_group_memberships(signal_dbus, member_csv_file_path, groups_created_file_path, registration_cache=None):
+    """
+    Read the desired members and admins of every group from the members CSV file.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        member_csv_file_path (str): Path to the CSV file containing member information.
+        groups_created_file_path (str): Path to the CSV file containing created group information.
+        registration_cache (dict): Optional cache of registration results keyed by phone number,
+            reused between calls to avoid repeated isRegistered lookups.
+
+    Returns:
+        tuple: (group_members, group_admins) dicts mapping group IDs to lists of phone numbers.
+    """
+    return load_group_memberships_from_rows(signal_dbus, CSVSource(member_csv_file_path).rows(), groups_created_file_path, registration_cache)
+
+
+def load_group_memberships_from_rows(signal_dbus, rows, groups_created_file_path, registration_cache=None):
+    """
+    Collect the desired members and admins of every group from rows in the members CSV format.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        rows (iterable): Dicts with the 'Phone Number', 'Group Name' and 'Group Admin' columns.
+        groups_created_file_path (str): Path to the CSV file containing created group information.
+        registration_cache (dict): Optional cache of registration results keyed by phone number.
+
+    Returns:
+        tuple: (group_members, group_admins) dicts mapping group IDs to lists of phone numbers.
+    """
+    if registration_cache is None:
+        registration_cache = {}
+    group_name_to_id = load_group_ids(groups_created_file_path)
+
+    group_members = {}
+    group_admins = {}
+    for row in rows:
+        phone_number = row['Phone Number']
+        group_names = row['Group Name'].split(';')
+        admin_groups = row['Group Admin'].split(';') if row['Group Admin'] else []
+
+        if phone_number not in registration_cache:
+            registration_cache[phone_number] = signal_dbus.is_registered(phone_number)
+        if not registration_cache[phone_number]:
+            print(f"Skipping unregistered member: {phone_number}")
+            continue
+
+        for group_name in group_names:
+            group_id = group_name_to_id.get(group_name.strip())
+            if group_id:
+                if group_id not in group_members:
+                    group_members[group_id] = []
+                group_members[group_id].append(phone_number)
+
+        for admin_group in admin_groups:
+            group_id = group_name_to_id.get(admin_group.strip())
+            if group_id:
+                if group_id not in group_admins:
+                    group_admins[group_id] = []
+                group_admins[group_id].append(phone_number)
+
+    return group_members, group_admins
+
+
+def diff_group_memberships(signal_dbus, group_members, group_admins, group_id_to_name, group_ids=None, max_workers=1):
+    """
+    Compare the desired members of Signal groups with their current members.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        group_members (dict): Desired members per group ID.
+        group_admins (dict): Desired admins per group ID.
+        group_id_to_name (dict): Group names keyed by group ID.
+        group_ids (iterable): Optional subset of group IDs to compare, defaults to all groups in group_members.
+        max_workers (int): Number of groups whose current members are read concurrently.
+
+    Returns:
+        list: One dict per group with the keys 'group_id', 'group_name', 'add', 'remove' and 'admins'.
+    """
+    if group_ids is None:
+        group_ids = list(group_members)
+
+    groups = []
+    for group_id in group_ids:
+        if not group_members.get(group_id):
+            continue
+        if not group_id_to_name.get(group_id):
+            print(f"Group not found: {group_id}")
+            continue
+        groups.append(group_id)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        current_members = executor.map(lambda group_id: signal_dbus.get_group_property(eval(group_id), 'Members'), groups)
+        deltas = []
+        for group_id, existing_members in zip(groups, current_members):
+            members = group_members[group_id]
+            group_name = group_id_to_name[group_id]
+            if existing_members is None:
+                print(f"Skipping group '{group_name}', its members could not be read.")
+                continue
+            desired = set(members)
+            existing = set(existing_members)
+            deltas.append({
+                'group_id': group_id,
+                'group_name': group_name,
+                'add': [member for member in members if member not in existing],
+                'remove': [member for member in existing_members if member not in desired],
+                'admins': group_admins.get(group_id, []),
+            })
+    return deltas
+
+
+def apply_membership_deltas(signal_dbus, deltas, priorities=None, max_workers=1):
+    """
+    Apply the per-group differences computed by diff_group_memberships.
+
+    The work is ordered and interleaved by scheduler.schedule_deltas.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        deltas (list): Group deltas as returned by diff_group_memberships.
+        priorities (dict): Optional priorities keyed by group name, higher runs first.
+        max_workers (int): Number of groups changed concurrently.
+
+    Returns:
+        int: Number of member changes that failed.
+    """
+    return schedule_deltas(signal_dbus, deltas, priorities, max_workers)
+
+
+def apply_group_memberships(signal_dbus, group_members, group_admins, group_id_to_name, group_ids=None):
+    """
+    Bring the members and admins of Signal groups in line with the desired state.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        group_members (dict): Desired members per group ID.
+        group_admins (dict): Desired admins per group ID.
+        group_id_to_name (dict): Group names keyed by group ID.
+        group_ids (iterable): Optional subset of group IDs to apply, defaults to all groups in group_members.
+
+    Returns:
+        int: Number of member changes that failed, counting a group whose members could not be read as one.
+    """
+    deltas = diff_group_memberships(signal_dbus, group_members, group_admins, group_id_to_name, group_ids)
+    failed = apply_membership_deltas(signal_dbus, deltas)
+    if group_ids is not None:
+        group_members = {group_id: group_members.get(group_id) for group_id in group_ids}
+    return failed + unread_groups(group_members, group_id_to_name, deltas)
+
+
+def unread_groups(group_members, group_id_to_name, deltas):
+    # Groups diff_group_memberships skipped because their current members could not be read
+    return sum(1 for group_id, members in group_members.items() if members and group_id_to_name.get(group_id)) - len(deltas)
+
+
+def sync_snapshot(signal_dbus, rows, groups_created_file_path, input_bytes=0, memory_budget=None, report=None,
+                  priorities=None, max_workers=1):
+    """
+    Bring all groups in line with a full snapshot of the desired memberships.
+
+    When the input is expected to exceed memory_budget, the rows are streamed
+    into partition files by group, and the partitions are resolved, compared
+    and applied one at a time with the registration results kept on disk.
+    Otherwise everything is held in memory.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        rows (iterable): Rows in the members CSV format.
+        groups_created_file_path (str): Path to the CSV file containing created group information.
+        input_bytes (int): Size of the input, used to decide whether to spill.
+        memory_budget (int): Memory budget in bytes, None for no budget.
+        report (MemoryReport): Optional report of the peak memory per phase.
+        priorities (dict): Optional priorities keyed by group name, higher runs first.
+        max_workers (int): Number of groups read and changed concurrently.
+
+    Returns:
+        int: Number of member changes that failed, counting a group whose members could not be read as one.
+    """
+    report = report or MemoryReport(enabled=False)
+    group_id_to_name = {group_id: group_name for group_name, group_id in load_group_ids(groups_created_file_path).items()}
+
+    if not needs_spilling(input_bytes, memory_budget):
+        with report.phase('load'):
+            # Only materialize the rows when the load phase is measured on its own
+            if report.enabled:
+                rows = list(rows)
+        with report.phase('resolve'):
+            group_members, group_admins = load_group_memberships_from_rows(signal_dbus, rows, groups_created_file_path)
+            rows = None
+        with report.phase('diff'):
+            deltas = diff_group_memberships(signal_dbus, group_members, group_admins, group_id_to_name, max_workers=max_workers)
+        with report.phase('apply'):
+            failed = apply_membership_deltas(signal_dbus, deltas, priorities, max_workers)
+        return failed + unread_groups(group_members, group_id_to_name, deltas)
+
+    partitions = partition_count(input_bytes, memory_budget)
+    print(f"Input of {input_bytes / 1024 / 1024:.0f} MiB exceeds the memory budget, syncing in {partitions} partitions.")
+    with tempfile.TemporaryDirectory(prefix='group_sync-') as spill_dir:
+        with report.phase('load'):
+            paths = spill_rows(rows, spill_dir, partitions)
+        registration_cache = DiskCache(os.path.join(spill_dir, 'registration.sqlite3'))
+        failed = 0
+        try:
+            for path in paths:
+                with report.phase('resolve'):
+                    group_members, group_admins = load_group_memberships_from_rows(
+                        signal_dbus, read_partition(path), groups_created_file_path, registration_cache
+                    )
+                with report.phase('diff'):
+                    deltas = diff_group_memberships(signal_dbus, group_members, group_admins, group_id_to_name, max_workers=max_workers)
+                    failed += unread_groups(group_members, group_id_to_name, deltas)
+                    group_members = group_admins = None
+                with report.phase('apply'):
+                    failed += apply_membership_deltas(signal_dbus, deltas, priorities, max_workers)
+                os.remove(path)
+        finally:
+            registration_cache.close()
+    return failed
+
+
+def sync_group_members_from_csv(signal_dbus, member_csv_file_path, groups_created_file_path, memory_budget=None, report=None,
+                                priorities=None, max_workers=1):
+    """
+    Synchronize Signal group members from a CSV file.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        member_csv_file_path (str): Path to the CSV file containing member information.
+        groups_created_file_path (str): Path to the CSV file containing created group information.
+        memory_budget (int): Optional memory budget in bytes, see sync_snapshot.
+        report (MemoryReport): Optional report of the peak memory per phase.
+        priorities (dict): Optional priorities keyed by group name, higher runs first.
+        max_workers (int): Number of groups read and changed concurrently.
+
+    Returns:
+        int: Number of member changes that failed.
+    """
+    source = CSVSource(member_csv_file_path)
+    return sync_snapshot(signal_dbus, source.rows(), groups_created_file_path, source.size(), memory_budget, report,
+                  priorities, max_workers)
+
+
+def apply_membership_changes(signal_dbus, changes, groups_created_file_path, registration_cache=None):
+    """
+    Apply the changes of a change feed to the Signal groups.
+
+    Changes to the same member and group are folded so only the last one
+    counts, then each group's additions and removals are sent as batches.
+    Changes for unknown groups and unregistered numbers are skipped, like in
+    a snapshot sync.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        changes (list): Change dicts as built by sources.membership_change.
+        groups_created_file_path (str): Path to the CSV file containing created group information.
+        registration_cache (dict): Optional cache of registration results keyed by phone number.
+
+    Returns:
+        tuple: (applied, failed) numbers of member changes.
+    """
+    if registration_cache is None:
+        registration_cache = {}
+    group_name_to_id = load_group_ids(groups_created_file_path)
+
+    # (group ID, phone number) -> [member, admin] where None means unchanged
+    states = {}
+    for change in changes:
+        group_id = group_name_to_id.get(change['Group Name'].strip())
+        if not group_id:
+            print(f"Group not found: {change['Group Name']}")
+            continue
+        state = states.setdefault((group_id, change['Phone Number']), [None, None])
+        if change['op'] == 'add':
+            state[0] = True
+            if change['Admin']:
+                state[1] = True
+        elif change['Admin']:
+            state[1] = False
+        else:
+            state[0] = state[1] = False
+
+    batches = {}
+    for (group_id, phone_number), (member, admin) in states.items():
+        if member or admin:
+            if phone_number not in registration_cache:
+                registration_cache[phone_number] = signal_dbus.is_registered(phone_number)
+            if not registration_cache[phone_number]:
                 print(f"Skipping unregistered member: {phone_number}")
                 continue
-            
-            for group_name in group_names:
-                group_id = get_group_id_by_name(groups_created_file_path, group_name.strip())
-                if group_id:
-                    if group_id not in group_members:
-                        group_members[group_id] = []
-                    group_members[group_id].append(phone_number)
-            
-            for admin_group in admin_groups:
-                group_id = get_group_id_by_name(groups_created_file_path, admin_group.strip())
+        batch = batches.setdefault(group_id, {'add': [], 'remove': [], 'add_admins': [], 'remove_admins': []})
+        if member is True:
+            batch['add'].append(phone_number)
+        elif member is False:
+            batch['remove'].append(phone_number)
+        if admin is True:
+            batch['add_admins'].append(phone_number)
+        elif admin is False and member is not False:
+            batch['remove_admins'].append(phone_number)
+
+    operations = (
+        ('add', signal_dbus.add_members),
+        ('remove', signal_dbus.remove_members),
+        ('add_admins', signal_dbus.add_admins),
+        ('remove_admins', signal_dbus.remove_admins),
+    )
+    group_id_to_name = {group_id: group_name for group_name, group_id in group_name_to_id.items()}
+    applied = failed = 0
+    for group_id, batch in batches.items():
+        print(f"Applying {sum(len(members) for members in batch.values())} changes to group: {group_id_to_name[group_id]}")
+        for operation, apply in operations:
+            if batch[operation]:
+                succeeded = apply(eval(group_id), batch[operation])
+                applied += len(succeeded)
+                failed += len(batch[operation]) - len(succeeded)
+    return applied, failed
+
+
+def sync_from_source(signal_dbus, source, groups_created_file_path, full=False, cursor_file_path=DEFAULT_CURSOR_PATH,
+                     memory_budget=None, report=None, priorities=None, max_workers=1):
+    """
+    Synchronize Signal group members from a membership source.
+
+    Sources with a change feed only apply the changes since the cursor saved
+    by the previous run. Other sources, the first run and runs with full set
+    compare the complete snapshot with every group.
+
+    The cursor is only saved when every change was applied, otherwise the
+    next run reads the same changes again, or syncs the full snapshot again
+    when there was no cursor yet.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        source (MembershipSource): The membership source.
+        groups_created_file_path (str): Path to the CSV file containing created group information.
+        full (bool): Ignore the saved cursor and sync the full snapshot.
+        cursor_file_path (str): Path to the JSON file with the saved cursors.
+        memory_budget (int): Optional memory budget in bytes for a full sync, see sync_snapshot.
+        report (MemoryReport): Optional report of the peak memory per phase.
+        priorities (dict): Optional priorities keyed by group name, higher runs first.
+        max_workers (int): Number of groups read and changed concurrently in a full sync.
+    """
+    cursor = None if full or not source.supports_changes else load_cursors(cursor_file_path).get(source.key)
+    if cursor is not None:
+        try:
+            changes, cursor = source.changes(cursor)
+        except CursorInvalid as e:
+            print(f"{str(e)}, running a full sync.")
+        else:
+            applied, failed = apply_membership_changes(signal_dbus, changes, groups_created_file_path)
+            print(f"Applied {applied} membership changes from {len(changes)} change records.")
+            if failed:
+                # Keeping the old cursor makes the next run read these changes again, applying them twice is harmless
+                print(f"{failed} membership changes failed, they are retried on the next run.")
+                return
+            save_cursor(source, cursor, cursor_file_path)
+            return
+
+    # The cursor is taken before the snapshot is read, so changes made meanwhile are applied again next time
+    cursor = source.current_cursor() if source.supports_changes else None
+    failed = sync_snapshot(signal_dbus, source.rows(), groups_created_file_path, source.size(), memory_budget, report,
+                           priorities, max_workers)
+    if failed:
+        print(f"{failed} membership changes failed, they are retried on the next run.")
+    elif cursor is not None:
+        save_cursor(source, cursor, cursor_file_path)
+
+
+def load_desired_members(member_csv_file_path, group_name_to_id):
+    """
+    Read the phone numbers listed for each group in the members CSV file.
+
+    Unlike load_group_memberships this does not check registration, which is
+    not needed for numbers that asked to join a group themselves.
+
+    Args:
+        member_csv_file_path (str): Path to the CSV file containing member information.
+        group_name_to_id (dict): Group IDs (as strings) keyed by group name.
+
+    Returns:
+        dict: Sets of phone numbers keyed by group ID.
+    """
+    desired_members = {}
+    with open(member_csv_file_path, 'r', encoding='UTF-8') as member_csv_file:
+        for row in csv.DictReader(member_csv_file):
+            for group_name in row['Group Name'].split(';'):
+                group_id = group_name_to_id.get(group_name.strip())
                 if group_id:
-                    if group_id not in group_admins:
-                        group_admins[group_id] = []
-                    group_admins[group_id].append(phone_number)
+                    desired_members.setdefault(group_id, set()).add(row['Phone Number'])
+    return desired_members
+
+
+def approve_join_requests(signal_dbus, member_csv_file_path, groups_created_file_path, reject_unknown=False, max_workers=4):
+    """
+    Approve pending join requests from numbers listed for the group in the members CSV file.
+
+    The requesting members of all groups are read in one parallel sweep. The
+    approvals and rejections of each group are then applied in batched calls,
+    several groups at a time.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        member_csv_file_path (str): Path to the CSV file containing member information.
+        groups_created_file_path (str): Path to the CSV file containing created group information.
+        reject_unknown (bool): Refuse the requests of numbers not listed for the group.
+        max_workers (int): Number of groups handled concurrently.
+
+    Returns:
+        tuple: (approved, rejected) counts.
+    """
+    if not os.path.exists(groups_created_file_path):
+        return 0, 0
+    group_name_to_id = load_group_ids(groups_created_file_path)
+    group_id_to_name = {group_id: group_name for group_name, group_id in group_name_to_id.items()}
+    desired_members = load_desired_members(member_csv_file_path, group_name_to_id)
+    group_ids = list(group_id_to_name)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        requesting = dict(zip(group_ids, executor.map(lambda group_id: signal_dbus.get_requesting_members(eval(group_id)), group_ids)))
+
+        def handle_group(group_id):
+            members = desired_members.get(group_id, set())
+            to_approve = [member for member in requesting[group_id] if member in members]
+            to_reject = [member for member in requesting[group_id] if member not in members] if reject_unknown else []
+            approved = signal_dbus.approve_requesting_members(eval(group_id), to_approve) if to_approve else []
+            rejected = signal_dbus.refuse_requesting_members(eval(group_id), to_reject) if to_reject else []
+            if approved or rejected:
+                print(f"Approved {len(approved)} and rejected {len(rejected)} join requests for group: {group_id_to_name[group_id]}")
+            return len(approved), len(rejected)
+
+        results = list(executor.map(handle_group, [group_id for group_id in group_ids if requesting[group_id]]))
+
+    approved = sum(result[0] for result in results)
+    rejected = sum(result[1] for result in results)
+    pending = sum(len(members) for members in requesting.values())
+    print(f"Handled {pending} join requests: {approved} approved, {rejected} rejected.")
+    return approved, rejected
 
+
+def enqueue_group_memberships(job_queue, group_members, group_admins, group_id_to_name):
+    """
+    Queue one sync job per group instead of applying the changes inline.
+
+    Args:
+        job_queue (JobQueue): The job queue.
+        group_members (dict): Desired members per group ID.
+        group_admins (dict): Desired admins per group ID.
+        group_id_to_name (dict): Group names keyed by group ID.
+    """
+    queued = 0
     for group_id, members in group_members.items():
         group_name = group_id_to_name.get(group_id)
-        if group_name:
-            print(f"Syncing members for group: {group_name}")
-            existing_members = signal_dbus.get_group_property(eval(group_id), 'Members')
-            members_to_add = [member for member in members if member not in existing_members]
-            members_to_remove = [member for member in existing_members if member not in members]
-            if members_to_add:
-                signal_dbus.add_members(eval(group_id), members_to_add)
-            if members_to_remove:
-                signal_dbus.remove_members(eval(group_id), members_to_remove)
-            
-            if group_id in group_admins:
-                admins = group_admins[group_id]
-                print(f"Setting {admins} as admins for group: {group_name}")
-                signal_dbus.add_admins(eval(group_id), admins)
-        else:
-            print(f"Group not found: {group_id}")
+        if not members or not group_name:
+            continue
+        job_queue.enqueue('sync_group', {
+            'group_id': group_id,
+            'group_name': group_name,
+            'members': members,
+            'admins': group_admins.get(group_id, []),
+        })
+        queued += 1
+    print(f"Queued sync jobs for {queued} groups.")
+
+
+def file_digest(file_path):
+    """
+    Compute the SHA-256 digest of a file's content.
+
+    Args:
+        file_path (str): Path to the file.
+
+    Returns:
+        str: The hex digest, or None if the file does not exist.
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def watch(signal_dbus, group_csv_file_path, groups_created_file_path, member_csv_file_path, debounce=2.0, negative_ttl=300,
+          max_workers=1):
+    """
+    Watch the groups and members CSV files and apply changes as they happen.
+
+    File changes are reported by inotify through Gio file monitors. Bursts of
+    events are debounced, files whose content did not change are ignored and
+    only groups whose desired members or admins changed are synchronized. The
+    D-Bus connection and the registration cache stay warm between runs.
+    Changes that failed are left out of the remembered state, so they are
+    retried on the next change. The group priorities are re-read from the
+    groups CSV file on every run.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        group_csv_file_path (str): Path to the CSV file containing group information.
+        groups_created_file_path (str): Path to the CSV file containing created group information.
+        member_csv_file_path (str): Path to the CSV file containing member information.
+        debounce (float): Seconds to wait after the last change before applying.
+        negative_ttl (float): Seconds an unregistered number is remembered before it is checked again.
+        max_workers (int): Number of groups read and changed concurrently.
+    """
+    registration_cache = RegistrationCache(negative_ttl)
+    digests = {group_csv_file_path: None, member_csv_file_path: None}
+    state = {'members': {}, 'admins': {}, 'timer': None}
+
+    def apply_changes():
+        state['timer'] = None
+        changed = [path for path in digests if file_digest(path) != digests[path]]
+        for path in changed:
+            digests[path] = file_digest(path)
+        if not changed:
+            return False
+
+        try:
+            if group_csv_file_path in changed:
+                create_groups_from_csv(signal_dbus, group_csv_file_path, groups_created_file_path)
+                reconcile_groups_from_csv(signal_dbus, group_csv_file_path, groups_created_file_path)
+
+            # New groups can change the name resolution, so members are re-resolved in both cases
+            group_id_to_name = {group_id: group_name for group_name, group_id in load_group_ids(groups_created_file_path).items()}
+            group_members, group_admins = load_group_memberships(
+                signal_dbus, member_csv_file_path, groups_created_file_path, registration_cache)
+            changed_groups = [
+                group_id for group_id in set(group_members) | set(state['members'])
+                if set(group_members.get(group_id, [])) != set(state['members'].get(group_id, []))
+                or set(group_admins.get(group_id, [])) != set(state['admins'].get(group_id, []))
+            ]
+            deltas = diff_group_memberships(signal_dbus, group_members, group_admins, group_id_to_name, changed_groups,
+                                            max_workers)
+            failed = apply_membership_deltas(signal_dbus, deltas, load_group_priorities(group_csv_file_path), max_workers)
+            applied = {delta['group_id']: delta for delta in deltas}
+            members_state, admins_state = dict(group_members), dict(group_admins)
+            for group_id in changed_groups:
+                delta = applied.get(group_id)
+                if delta is None:
+                    if group_members.get(group_id) and group_id_to_name.get(group_id):
+                        # The members could not be read, keep the old state so the group is compared again
+                        members_state[group_id] = state['members'].get(group_id, [])
+                        admins_state[group_id] = state['admins'].get(group_id, [])
+                        failed += 1
+                    continue
+                # Only remember the changes that were applied
+                members_state[group_id] = [
+                    member for member in group_members[group_id] if member not in delta['failed']['add']
+                ] + delta['failed']['remove']
+                admins_state[group_id] = [
+                    admin for admin in group_admins.get(group_id, []) if admin not in delta['failed']['admins']
+                ]
+            state['members'], state['admins'] = members_state, admins_state
+            print(f"Applied changes to {len(changed_groups)} groups.")
+            if failed:
+                print(f"{failed} membership changes failed, they are retried on the next change.")
+        except (Exception, CallAborted) as e:
+            # Forget the file digests so the next change retries everything that was not applied
+            for path in changed:
+                digests[path] = None
+            print(f"Error applying changes: {str(e)}")
+        return False
+
+    def on_changed(monitor, file, other_file, event_type):
+        if event_type not in (Gio.FileMonitorEvent.CHANGES_DONE_HINT, Gio.FileMonitorEvent.CREATED,
+                              Gio.FileMonitorEvent.MOVED_IN, Gio.FileMonitorEvent.RENAMED,
+                              Gio.FileMonitorEvent.DELETED):
+            return
+        if state['timer'] is not None:
+            GLib.source_remove(state['timer'])
+        state['timer'] = GLib.timeout_add(int(debounce * 1000), apply_changes)
+
+    monitors = []
+    for path in digests:
+        monitor = Gio.File.new_for_path(path).monitor_file(Gio.FileMonitorFlags.WATCH_MOVES, None)
+        monitor.connect('changed', on_changed)
+        monitors.append(monitor)
+
+    # Start with a full sync so the watcher has a baseline to compare against
+    apply_changes()
+    print(f"Watching {group_csv_file_path} and {member_csv_file_path} for changes...")
+    try:
+        GLib.MainLoop().run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for monitor in monitors:
+            monitor.cancel()
+
+
+def parse_args():
+    """
+    Parse the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Create Signal groups and sync their members from CSV files.")
+    parser.add_argument('--watch', action='store_true', help="Keep running and apply changes to the CSV files as they happen.")
+    parser.add_argument('--debounce', type=float, default=2.0, help="Seconds to wait for further edits before applying changes in watch mode.")
+    parser.add_argument('--negative-ttl', type=float, default=300, help="Seconds an unregistered number is remembered in watch mode before it is checked again.")
+    parser.add_argument('--ready-timeout', type=float, default=120.0, help="Seconds to wait for the signal-cli daemon to become ready.")
+    parser.add_argument('--warm-up', action='store_true', help="Read the group list once before syncing to warm up the daemon.")
+    parser.add_argument('--skip-contact-names', action='store_true', help="Do not push the Name column into signal-cli's contacts.")
+    parser.add_argument('--deadline', type=float, default=None, help="Abort a one-shot sync after this many seconds.")
+    parser.add_argument('--approve-requests', action='store_true', help="Approve join requests from numbers listed for the group in members.csv.")
+    parser.add_argument('--reject-unknown', action='store_true', help="With --approve-requests, refuse join requests from all other numbers.")
+    parser.add_argument('--record', metavar='TRACE', help="Record all D-Bus calls to a trace file (see dbus_trace.py).")
+    parser.add_argument('--enqueue', action='store_true', help="Queue the membership changes as background jobs (see job_queue.py) instead of applying them inline.")
+    parser.add_argument('--source', help="Membership source instead of env/members.csv, as kind:path with kind csv, json, jsonl or sqlite (see sources.py).")
+    parser.add_argument('--concurrency', type=int, default=4, help="Number of groups read and changed at the same time.")
+    parser.add_argument('--memory-budget', type=int, metavar='MIB', help="Sync in partitions spilled to disk when the input would not fit into this many MiB.")
+    parser.add_argument('--memory-report', action='store_true', help="Report the peak Python memory of each sync phase (load, resolve, diff, apply).")
+    parser.add_argument('--full', action='store_true', help="Sync the full snapshot of --source even if it has a change feed.")
+    args = parser.parse_args()
+    if args.watch and args.source:
+        parser.error("--watch only works with env/members.csv, not with --source.")
+    return args
 
 
 def main():
     """
     The main function to run the group synchronization.
     """
+    args = parse_args()
     registered_number = REGISTERED_NUMBER
     group_csv_file_path = 'env/groups.csv'
     groups_created_file_path = 'env/groups_created.csv'
     member_csv_file_path = 'env/members.csv'
 
+    readiness = wait_until_ready(registered_number, args.ready_timeout)
+    if not readiness['ready']:
+        print(f"signal-cli daemon not ready after {readiness['waited']:.0f}s: {readiness['error']}")
+        sys.exit(1)
+    print(f"signal-cli {readiness['version']} ready after {readiness['waited']:.1f}s "
+          f"(account latency {readiness['account_latency'] * 1000:.0f} ms)")
+
     signal_dbus = SignalDBus(registered_number)
+    if not args.watch:
+        signal_dbus.set_deadline(args.deadline)
+    if args.record:
+        signal_dbus.start_recording(args.record)
+    try:
+        run(signal_dbus, args, group_csv_file_path, groups_created_file_path, member_csv_file_path)
+    except CallAborted as e:
+        print(f"Sync aborted: {str(e)}")
+        sys.exit(1)
+    finally:
+        signal_dbus.stop_recording()
+
+
+def run(signal_dbus, args, group_csv_file_path, groups_created_file_path, member_csv_file_path):
+    """
+    Run the synchronization with an existing SignalDBus instance.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        args (argparse.Namespace): The parsed command line arguments.
+        group_csv_file_path (str): Path to the CSV file containing group information.
+        groups_created_file_path (str): Path to the CSV file containing created group information.
+        member_csv_file_path (str): Path to the CSV file containing member information.
+    """
+    if args.warm_up:
+        print(f"Warm-up took {warm_up(signal_dbus):.2f}s")
+    if args.watch:
+        watch(signal_dbus, group_csv_file_path, groups_created_file_path, member_csv_file_path, args.debounce, args.negative_ttl,
+              args.concurrency)
+        return
     create_groups_from_csv(signal_dbus, group_csv_file_path, groups_created_file_path)
-    sync_group_members_from_csv(signal_dbus, member_csv_file_path, groups_created_file_path)
+    reconcile_groups_from_csv(signal_dbus, group_csv_file_path, groups_created_file_path)
+    if args.approve_requests:
+        approve_join_requests(signal_dbus, member_csv_file_path, groups_created_file_path, args.reject_unknown)
+    source = open_source(args.source) if args.source else CSVSource(member_csv_file_path)
+    if args.enqueue:
+        group_id_to_name = {group_id: group_name for group_name, group_id in load_group_ids(groups_created_file_path).items()}
+        group_members, group_admins = load_group_memberships_from_rows(signal_dbus, source.rows(), groups_created_file_path)
+        job_queue = JobQueue()
+        enqueue_group_memberships(job_queue, group_members, group_admins, group_id_to_name)
+        job_queue.close()
+        return
+
+    # Contact names are independent of group membership, so they are pushed alongside the membership sync
+    contact_errors = []
+    contact_thread = None
+    # Contact names are only read from members.csv files
+    if not args.skip_contact_names and source.kind == 'csv':
+        def push_contact_names():
+            try:
+                sync_contact_names(signal_dbus, source.path)
+            except (Exception, CallAborted) as e:
+                contact_errors.append(e)
+        contact_thread = threading.Thread(target=push_contact_names, name='contact-names')
+        contact_thread.start()
+
+    report = MemoryReport(enabled=args.memory_report)
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget else None
+    priorities = load_group_priorities(group_csv_file_path)
+    try:
+        if args.source:
+            sync_from_source(signal_dbus, source, groups_created_file_path, args.full,
+                             memory_budget=memory_budget, report=report, priorities=priorities, max_workers=args.concurrency)
+        else:
+            sync_group_members_from_csv(signal_dbus, member_csv_file_path, groups_created_file_path, memory_budget, report,
+                                        priorities, args.concurrency)
+        report.print()
+    finally:
+        if contact_thread is not None:
+            contact_thread.join()
+    if contact_errors:
+        print(f"Error syncing contact names: {str(contact_errors[0])}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,159 @@
+import argparse
+import csv
+import fnmatch
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+from signal_dbus import SignalDBus
+from utils import encode_group_id, render_qr_code
+
+load_dotenv()
+REGISTERED_NUMBER = os.getenv("REGISTERED_NUMBER")
+
+INDEX_FIELDNAMES = ['Group ID', 'Group Name', 'Invite Link', 'QR File']
+
+
+def qr_file_name(group_id, group_name):
+    """
+    Build a stable file name for a group's QR code.
+
+    Args:
+        group_id (list): The group ID.
+        group_name (str): The group name.
+
+    Returns:
+        str: A file name made of the sanitized group name and a short ID suffix.
+    """
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', group_name or '').strip('-').lower() or 'group'
+    suffix = re.sub(r'[^A-Za-z0-9]', '', encode_group_id(group_id) or '')[:8]
+    return f"{slug}-{suffix}.png"
+
+
+def read_index(index_file_path):
+    """
+    Read a previously written index CSV.
+
+    Args:
+        index_file_path (str): Path to the index CSV.
+
+    Returns:
+        dict: The index rows keyed by encoded group ID.
+    """
+    index = {}
+    if os.path.exists(index_file_path):
+        with open(index_file_path, 'r', encoding='UTF-8') as index_file:
+            for row in csv.DictReader(index_file):
+                index[row['Group ID']] = row
+    return index
+
+
+def fetch_invite_links(signal_dbus, groups, enable=False, reset=False, requires_approval=False):
+    """
+    Optionally enable or reset the invite links and read the current link of each group.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        groups (list): (group_id, group_name) tuples.
+        enable (bool): Enable the invite link before reading it.
+        reset (bool): Reset the invite link before reading it.
+        requires_approval (bool): Whether joining through an enabled link requires admin approval.
+
+    Returns:
+        list: (group_id, group_name, invite_link) tuples for groups that have a link.
+    """
+    links = []
+    for group_id, group_name in groups:
+        if enable:
+            signal_dbus.enable_link(group_id, requires_approval)
+        if reset:
+            signal_dbus.reset_link(group_id)
+        invite_link = signal_dbus.get_group_property(group_id, 'GroupInviteLink')
+        if invite_link:
+            links.append((group_id, group_name, invite_link))
+        else:
+            print(f"Group '{group_name}' has no invite link.")
+    return links
+
+
+def export_invite_links(signal_dbus, output_dir, patterns=None, enable=False, reset=False,
+                        requires_approval=False, max_workers=None):
+    """
+    Export the invite links of all matching groups as QR code images plus an index CSV.
+
+    Images are rendered in a process pool. A group's image is only rendered
+    again if its link changed since the last export or the file is missing.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        output_dir (str): Directory for the QR code images and index.csv.
+        patterns (list): Optional shell-style patterns to select groups by name.
+        enable (bool): Enable the invite link of each group first.
+        reset (bool): Reset the invite link of each group first.
+        requires_approval (bool): Whether joining through an enabled link requires admin approval.
+        max_workers (int): Number of rendering processes, defaults to the CPU count.
+
+    Returns:
+        str: Path of the written index CSV.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    index_file_path = os.path.join(output_dir, 'index.csv')
+    previous_index = read_index(index_file_path)
+
+    groups = [(group_id, group_name) for group_id, group_name in signal_dbus.list_groups() if group_name]
+    if patterns:
+        groups = [group for group in groups if any(fnmatch.fnmatch(group[1], pattern) for pattern in patterns)]
+
+    rows = []
+    to_render = []
+    for group_id, group_name, invite_link in fetch_invite_links(signal_dbus, groups, enable, reset, requires_approval):
+        encoded_id = encode_group_id(group_id)
+        file_name = qr_file_name(group_id, group_name)
+        previous = previous_index.get(encoded_id)
+        unchanged = (previous and previous['Invite Link'] == invite_link and previous['QR File'] == file_name
+                     and os.path.exists(os.path.join(output_dir, file_name)))
+        if not unchanged:
+            to_render.append((invite_link, os.path.join(output_dir, file_name)))
+        rows.append({'Group ID': encoded_id, 'Group Name': group_name, 'Invite Link': invite_link, 'QR File': file_name})
+
+    if to_render:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(render_qr_code, link, path) for link, path in to_render]
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error generating QR code: {str(e)}")
+
+    temp_index_path = index_file_path + '.tmp'
+    with open(temp_index_path, 'w', encoding='UTF-8', newline='') as index_file:
+        writer = csv.DictWriter(index_file, fieldnames=INDEX_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(temp_index_path, index_file_path)
+
+    print(f"Exported {len(rows)} invite links to '{output_dir}' ({len(to_render)} rendered, {len(rows) - len(to_render)} unchanged).")
+    return index_file_path
+
+
+def main():
+    """
+    Export group invite links as QR codes.
+    """
+    parser = argparse.ArgumentParser(description="Export group invite links as QR code images and an index CSV.")
+    parser.add_argument('patterns', nargs='*', help="Shell-style group name patterns, all groups if omitted.")
+    parser.add_argument('--output', default='env/invite_links', help="Output directory.")
+    parser.add_argument('--enable', action='store_true', help="Enable the invite link of each group first.")
+    parser.add_argument('--reset', action='store_true', help="Reset the invite link of each group first.")
+    parser.add_argument('--requires-approval', action='store_true', help="Require admin approval when enabling links.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of rendering processes.")
+    args = parser.parse_args()
+
+    signal_dbus = SignalDBus(REGISTERED_NUMBER)
+    export_invite_links(signal_dbus, args.output, args.patterns, args.enable, args.reset,
+                        args.requires_approval, args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,405 @@
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from call_policy import CallAborted
+from dotenv import load_dotenv
+from signal_dbus import SignalDBus
+
+load_dotenv()
+REGISTERED_NUMBER = os.getenv("REGISTERED_NUMBER")
+DEFAULT_QUEUE_PATH = os.getenv('SIGNAL_JOB_QUEUE', 'env/jobs.sqlite3')
+
+PRIORITY_INTERACTIVE = 10
+PRIORITY_BULK = 0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    operation TEXT NOT NULL,
+    args TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after REAL NOT NULL,
+    lease_until REAL,
+    worker TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority DESC, run_after, id);
+"""
+
+
+def require_all(operation, requested, succeeded):
+    # SignalDBus prints errors instead of raising them, so jobs compare what was requested with what was done
+    done = set(succeeded or [])
+    failed = [member for member in requested if member not in done]
+    if failed:
+        raise RuntimeError(f"{operation} failed for {len(failed)} of {len(requested)} members: {', '.join(failed)}")
+
+
+def member_operation(method):
+    def run(signal_dbus, group_id, members):
+        require_all(method, members, getattr(signal_dbus, method)(group_id, members))
+    return run
+
+
+def create_group(signal_dbus, group_name, members):
+    if signal_dbus.create_group(group_name, members) is None:
+        raise RuntimeError(f"Creating group '{group_name}' failed")
+
+
+def update_group(signal_dbus, group_id, members, remove_members=False):
+    # Unregistered numbers are skipped like in SignalDBus.update_group, they are not a failure of the job
+    registered = [member for member, is_registered in zip(members, signal_dbus.is_registered_batch(members)) if is_registered]
+    if registered:
+        method = 'remove_members' if remove_members else 'add_members'
+        require_all(method, registered, getattr(signal_dbus, method)(group_id, registered))
+
+
+def remove_group(signal_dbus, group_id):
+    if not signal_dbus.remove_group(group_id):
+        raise RuntimeError("Removing the group failed")
+
+
+def set_group_property(signal_dbus, group_id, property_name, property_value):
+    if not signal_dbus.set_group_property(group_id, property_name, property_value):
+        raise RuntimeError(f"Setting group property '{property_name}' failed")
+
+
+def sync_group(signal_dbus, group_id, group_name, members, admins):
+    # Imported here because group_sync imports this module for --enqueue
+    from group_sync import apply_group_memberships
+    failed = apply_group_memberships(signal_dbus, {group_id: members}, {group_id: admins} if admins else {}, {group_id: group_name})
+    if failed:
+        raise RuntimeError(f"Syncing group '{group_name}' failed for {failed} member changes")
+
+
+# Operations a job may run, mapped to functions taking the worker's SignalDBus first.
+# Each raises when the change was not fully applied, so the job is retried.
+OPERATIONS = {
+    'create_group': create_group,
+    'update_group': update_group,
+    'remove_group': remove_group,
+    'add_members': member_operation('add_members'),
+    'remove_members': member_operation('remove_members'),
+    'add_admins': member_operation('add_admins'),
+    'remove_admins': member_operation('remove_admins'),
+    'set_group_property': set_group_property,
+    'sync_group': sync_group,
+}
+
+
+class JobQueue:
+    """
+    Durable job queue for admin operations backed by SQLite.
+
+    Workers lease the highest priority job that is due and renew the lease
+    while the job runs. A lease expires if the worker dies, after which the
+    job becomes available again, unless it has used up max_attempts. Failed
+    jobs are retried with exponential backoff until max_attempts is reached.
+    Jobs interrupted because the daemon was unavailable are requeued without
+    using up an attempt. Only the worker holding the lease can complete, fail
+    or requeue a job.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, lease_seconds=300, retry_delay=5.0):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def enqueue(self, operation, args, priority=PRIORITY_BULK, max_attempts=3):
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown operation '{operation}'")
+        now = time.time()
+        cursor = self.connection.execute(
+            'INSERT INTO jobs (operation, args, priority, max_attempts, run_after, created_at, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (operation, json.dumps(args), priority, max_attempts, now, now, now)
+        )
+        return cursor.lastrowid
+
+    def lease(self, worker):
+        now = time.time()
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            # A job whose worker died on its last attempt is not run again
+            self.connection.execute(
+                "UPDATE jobs SET status = 'failed', lease_until = NULL, error = 'Lease expired on the last attempt', updated_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts",
+                (now, now)
+            )
+            row = self.connection.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' AND run_after <= ?) "
+                "OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY priority DESC, run_after, id LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                self.connection.execute('COMMIT')
+                return None
+            self.connection.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, worker = ?, updated_at = ? "
+                "WHERE id = ?",
+                (now + self.lease_seconds, worker, now, row['id'])
+            )
+            self.connection.execute('COMMIT')
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+        job = dict(row)
+        job['attempts'] += 1
+        job['args'] = json.loads(job['args'])
+        return job
+
+    def renew(self, job_id, worker):
+        """
+        Extend the lease of a running job.
+
+        Returns:
+            bool: False if the worker no longer holds the lease.
+        """
+        now = time.time()
+        cursor = self.connection.execute(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (now + self.lease_seconds, now, job_id, worker)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker):
+        """
+        Mark a job as done.
+
+        Returns:
+            bool: False if the worker no longer holds the lease, the job is then left alone.
+        """
+        cursor = self.connection.execute(
+            "UPDATE jobs SET status = 'done', lease_until = NULL, error = NULL, updated_at = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time(), job_id, worker)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id, error, worker):
+        """
+        Record a failed attempt, queueing a retry unless max_attempts is reached.
+
+        Returns:
+            bool: False if the worker no longer holds the lease, the job is then left alone.
+        """
+        now = time.time()
+        row = self.connection.execute(
+            "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker = ? AND status = 'running'", (job_id, worker)
+        ).fetchone()
+        if row is None:
+            return False
+        if row['attempts'] < row['max_attempts']:
+            delay = self.retry_delay * 2 ** (row['attempts'] - 1)
+            cursor = self.connection.execute(
+                "UPDATE jobs SET status = 'queued', lease_until = NULL, run_after = ?, error = ?, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (now + delay, error, now, job_id, worker)
+            )
+        else:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET status = 'failed', lease_until = NULL, error = ?, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (error, now, job_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def requeue(self, job_id, worker, run_after, error=None):
+        """
+        Put a running job back into the queue without counting the attempt, for
+        runs that were aborted because the daemon was unavailable.
+
+        Returns:
+            bool: False if the worker no longer holds the lease, the job is then left alone.
+        """
+        cursor = self.connection.execute(
+            "UPDATE jobs SET status = 'queued', attempts = attempts - 1, lease_until = NULL, run_after = ?, error = ?, "
+            "updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (run_after, error, time.time(), job_id, worker)
+        )
+        return cursor.rowcount == 1
+
+    def get(self, job_id):
+        row = self.connection.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def counts(self):
+        rows = self.connection.execute('SELECT status, COUNT(*) AS count FROM jobs GROUP BY status').fetchall()
+        return {row['status']: row['count'] for row in rows}
+
+    def recent(self, limit=20):
+        rows = self.connection.execute('SELECT * FROM jobs ORDER BY updated_at DESC LIMIT ?', (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+
+def renew_lease(queue_path, job_id, worker, stop, lease_seconds):
+    """
+    Renew the lease of a running job every third of the lease time until stop is set.
+
+    Args:
+        queue_path (str): Path to the SQLite job queue.
+        job_id (int): The running job.
+        worker (str): The worker holding the lease.
+        stop (threading.Event): Set when the job has finished.
+        lease_seconds (float): Length of the lease.
+    """
+    # SQLite connections cannot be shared between threads, so the heartbeat uses its own
+    job_queue = JobQueue(queue_path, lease_seconds)
+    try:
+        while not stop.wait(lease_seconds / 3):
+            if not job_queue.renew(job_id, worker):
+                print(f"[{worker}] Lost the lease of job {job_id}.")
+                return
+    finally:
+        job_queue.close()
+
+
+def run_worker(queue_path, registered_number, poll_interval=1.0):
+    """
+    Lease and run jobs until interrupted.
+
+    Args:
+        queue_path (str): Path to the SQLite job queue.
+        registered_number (str): The registered Signal number.
+        poll_interval (float): Seconds to sleep when no job is due.
+    """
+    job_queue = JobQueue(queue_path)
+    signal_dbus = SignalDBus(registered_number)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    try:
+        while True:
+            job = job_queue.lease(worker)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            print(f"[{worker}] Running job {job['id']} ({job['operation']}, attempt {job['attempts']})")
+            stop = threading.Event()
+            heartbeat = threading.Thread(
+                target=renew_lease, args=(queue_path, job['id'], worker, stop, job_queue.lease_seconds), daemon=True
+            )
+            heartbeat.start()
+            error = None
+            try:
+                OPERATIONS[job['operation']](signal_dbus, **job['args'])
+            except (Exception, CallAborted) as e:
+                error = e
+            finally:
+                stop.set()
+                heartbeat.join()
+            if error is None:
+                recorded = job_queue.complete(job['id'], worker)
+            elif isinstance(error, CallAborted):
+                # The daemon is unavailable, which is not the job's fault
+                print(f"[{worker}] Job {job['id']} was aborted and requeued: {str(error)}")
+                recorded = job_queue.requeue(
+                    job['id'], worker, time.time() + signal_dbus.breaker.reset_timeout, str(error)
+                )
+            else:
+                print(f"[{worker}] Job {job['id']} failed: {str(error)}")
+                recorded = job_queue.fail(job['id'], str(error), worker)
+            if not recorded:
+                print(f"[{worker}] Job {job['id']} was leased by another worker, its result is discarded.")
+            if isinstance(error, CallAborted):
+                # The daemon is unavailable, back off before leasing the next job
+                time.sleep(signal_dbus.breaker.reset_timeout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        job_queue.close()
+
+
+def run_worker_pool(queue_path, registered_number, processes=2, poll_interval=1.0):
+    """
+    Run a pool of worker processes, each with its own D-Bus connection.
+
+    Args:
+        queue_path (str): Path to the SQLite job queue.
+        registered_number (str): The registered Signal number.
+        processes (int): Number of worker processes.
+        poll_interval (float): Seconds a worker sleeps when no job is due.
+    """
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(queue_path, registered_number, poll_interval), daemon=True)
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    print(f"Started {processes} workers on '{queue_path}'.")
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+
+def print_status(job_queue, job_id=None):
+    """
+    Print the status of one job or a summary of the queue.
+
+    Args:
+        job_queue (JobQueue): The job queue.
+        job_id (int): Optional job ID.
+    """
+    if job_id is not None:
+        job = job_queue.get(job_id)
+        if job is None:
+            print(f"Job {job_id} not found.")
+            return
+        for key, value in job.items():
+            print(f"{key}: {value}")
+        return
+
+    counts = job_queue.counts()
+    print(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())) or "Queue is empty.")
+    for job in job_queue.recent():
+        error = f" - {job['error']}" if job['error'] else ""
+        print(f"#{job['id']} {job['operation']} [{job['status']}] priority={job['priority']} attempts={job['attempts']}{error}")
+
+
+def main():
+    """
+    Command line interface for the job queue.
+    """
+    parser = argparse.ArgumentParser(description="Durable job queue for Signal admin operations.")
+    parser.add_argument('--queue', default=DEFAULT_QUEUE_PATH, help="Path to the SQLite job queue.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    worker_parser = subparsers.add_parser('worker', help="Run worker processes.")
+    worker_parser.add_argument('--processes', type=int, default=2, help="Number of worker processes.")
+    worker_parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+    status_parser = subparsers.add_parser('status', help="Show the queue or a single job.")
+    status_parser.add_argument('job_id', type=int, nargs='?', help="Job ID.")
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        run_worker_pool(args.queue, REGISTERED_NUMBER, args.processes, args.poll_interval)
+    else:
+        job_queue = JobQueue(args.queue)
+        print_status(job_queue, args.job_id)
+        job_queue.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from call_policy import CallAborted
+from dotenv import load_dotenv
+from export_members import fetch_group_members
+from signal_dbus import SignalDBus
+from utils import decode_group_id, encode_group_id
+
+load_dotenv()
+REGISTERED_NUMBER = os.getenv("REGISTERED_NUMBER")
+
+DEFAULT_INDEX_PATH = 'env/member_index.json'
+
+
+class MemberIndex:
+    """
+    Reverse index from phone numbers to the groups they are a member or admin of.
+
+    The index is built from one GetAll sweep over all groups. Once attached to
+    a SignalDBus instance it follows that instance's membership changes through
+    its mutation listener hook, so it stays current without another sweep.
+    """
+
+    def __init__(self):
+        self.groups = {}
+        self.paths = {}
+        self.members = defaultdict(set)
+        self.admins = defaultdict(set)
+        self.built = None
+        self.signal_dbus = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, signal_dbus, max_workers=8):
+        index = cls()
+        groups = [(group_id, group_name) for group_id, group_name in signal_dbus.list_groups() if group_name]
+        for (group_id, _), (group_name, properties) in zip(groups, fetch_group_members(signal_dbus, groups, max_workers)):
+            if properties is None:
+                print(f"Skipping group '{group_name}', its members could not be read.", file=sys.stderr)
+                continue
+            encoded_id = encode_group_id(group_id)
+            index.groups[encoded_id] = group_name
+            index.paths[signal_dbus.get_group_object_path(group_id)] = encoded_id
+            for member in properties.get('Members', []):
+                index.members[member].add(encoded_id)
+            for admin in properties.get('Admins', []):
+                index.admins[admin].add(encoded_id)
+        index.built = time.time()
+        return index
+
+    @classmethod
+    def load(cls, index_file_path):
+        with open(index_file_path, 'r', encoding='UTF-8') as index_file:
+            data = json.load(index_file)
+        index = cls()
+        index.groups = data['groups']
+        index.paths = data['paths']
+        index.members.update({number: set(group_ids) for number, group_ids in data['members'].items()})
+        index.admins.update({number: set(group_ids) for number, group_ids in data['admins'].items()})
+        index.built = data['built']
+        return index
+
+    def save(self, index_file_path):
+        with self._lock:
+            data = {
+                'built': self.built,
+                'groups': self.groups,
+                'paths': self.paths,
+                'members': {number: sorted(group_ids) for number, group_ids in self.members.items() if group_ids},
+                'admins': {number: sorted(group_ids) for number, group_ids in self.admins.items() if group_ids},
+            }
+        temp_path = index_file_path + '.tmp'
+        with open(temp_path, 'w', encoding='UTF-8') as index_file:
+            json.dump(data, index_file, separators=(',', ':'))
+        os.replace(temp_path, index_file_path)
+
+    def refresh(self, signal_dbus, max_workers=8):
+        # Rebuilt in place so an attached index keeps its mutation listener
+        fresh = MemberIndex.build(signal_dbus, max_workers)
+        with self._lock:
+            self.groups = fresh.groups
+            self.paths = fresh.paths
+            self.members = fresh.members
+            self.admins = fresh.admins
+            self.built = fresh.built
+
+    def attach(self, signal_dbus):
+        self.signal_dbus = signal_dbus
+        signal_dbus.add_mutation_listener(self.on_mutation)
+
+    def detach(self):
+        if self.signal_dbus is not None:
+            self.signal_dbus.remove_mutation_listener(self.on_mutation)
+            self.signal_dbus = None
+
+    def _group_for_path(self, object_path):
+        encoded_id = self.paths.get(object_path)
+        if encoded_id is None and self.signal_dbus is not None:
+            # Groups created after the sweep are only known by ID until their path is resolved
+            encoded_id = encode_group_id(self.signal_dbus.group_id_for_path(object_path))
+            if encoded_id in self.groups:
+                self.paths[object_path] = encoded_id
+        return encoded_id if encoded_id in self.groups else None
+
+    def on_mutation(self, object_path, method, args, result, error, latency):
+        if error is not None:
+            return
+        with self._lock:
+            if method == 'createGroup':
+                group_name, members = args[0], args[1]
+                encoded_id = encode_group_id(result)
+                self.groups[encoded_id] = group_name
+                for member in members:
+                    self.members[member].add(encoded_id)
+                return
+            encoded_id = self._group_for_path(object_path)
+            if encoded_id is None:
+                return
+            if method == 'addMembers':
+                for member in args[0]:
+                    self.members[member].add(encoded_id)
+            elif method == 'removeMembers':
+                for member in args[0]:
+                    self.members[member].discard(encoded_id)
+                    self.admins[member].discard(encoded_id)
+            elif method == 'addAdmins':
+                for admin in args[0]:
+                    self.admins[admin].add(encoded_id)
+            elif method == 'removeAdmins':
+                for admin in args[0]:
+                    self.admins[admin].discard(encoded_id)
+            elif method == 'quitGroup':
+                # Groups we left can no longer be managed, so they are dropped from the index
+                del self.groups[encoded_id]
+                for group_ids in list(self.members.values()) + list(self.admins.values()):
+                    group_ids.discard(encoded_id)
+
+    def where_is(self, number):
+        """
+        Look up the groups of a phone number.
+
+        Args:
+            number (str): The phone number.
+
+        Returns:
+            list: (group_id, group_name, is_admin) tuples sorted by group name.
+        """
+        with self._lock:
+            group_ids = self.members.get(number, set()) | self.admins.get(number, set())
+            admin_ids = self.admins.get(number, set())
+            return sorted(
+                ((decode_group_id(encoded_id), self.groups[encoded_id], encoded_id in admin_ids)
+                 for encoded_id in group_ids if encoded_id in self.groups),
+                key=lambda group: group[1]
+            )
+
+
+def load_or_build_index(signal_dbus, index_file_path=DEFAULT_INDEX_PATH, max_age=600, refresh=False, max_workers=8):
+    """
+    Load the saved index if it is recent enough, otherwise build and save a new one.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        index_file_path (str): Path to the saved index.
+        max_age (float): Maximum age of the saved index in seconds.
+        refresh (bool): Always rebuild the index.
+        max_workers (int): Number of concurrent GetAll calls when building.
+
+    Returns:
+        MemberIndex: The index, attached to signal_dbus.
+    """
+    index = None
+    if not refresh and os.path.exists(index_file_path):
+        index = MemberIndex.load(index_file_path)
+        if time.time() - index.built > max_age:
+            index = None
+    if index is None:
+        started = time.monotonic()
+        index = MemberIndex.build(signal_dbus, max_workers)
+        print(f"Indexed {len(index.groups)} groups in {time.monotonic() - started:.1f}s.")
+        index.save(index_file_path)
+    index.attach(signal_dbus)
+    return index
+
+
+def offboard(signal_dbus, index, number, max_workers=8, refresh=True):
+    """
+    Remove a phone number and its admin role from every group it is in.
+
+    The index only follows changes made through its own connection, so by
+    default it is rebuilt from the live groups first. Otherwise groups the
+    number joined through another tool would be missed.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        index (MemberIndex): The member index, attached to signal_dbus.
+        number (str): The phone number to remove.
+        max_workers (int): Number of groups handled concurrently.
+        refresh (bool): Rebuild the index before removing, only pass False for an index that was just built.
+
+    Returns:
+        list: Names of the groups the number could not be removed from.
+    """
+    def remove_from_group(group_id, is_admin):
+        if is_admin:
+            signal_dbus.remove_admins(group_id, [number])
+        return number in signal_dbus.remove_members(group_id, [number])
+
+    if refresh:
+        index.refresh(signal_dbus, max_workers)
+    groups = index.where_is(number)
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(remove_from_group, group_id, is_admin): group_name
+            for group_id, group_name, is_admin in groups
+        }
+        for future in as_completed(futures):
+            group_name = futures[future]
+            try:
+                removed = future.result()
+            except Exception as e:
+                print(f"Error removing {number} from '{group_name}': {str(e)}")
+                removed = False
+            if removed:
+                print(f"Removed {number} from '{group_name}'")
+            else:
+                failed.append(group_name)
+    print(f"Removed {number} from {len(groups) - len(failed)} of {len(groups)} groups.")
+    return failed
+
+
+def main():
+    """
+    Look up and offboard members using the member index.
+    """
+    parser = argparse.ArgumentParser(description="Find and remove a member across all groups.")
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help="Path to the saved member index.")
+    parser.add_argument('--max-age', type=float, default=600, help="Rebuild the saved index when it is older than this many seconds.")
+    parser.add_argument('--refresh', action='store_true', help="Rebuild the index before running the command.")
+    parser.add_argument('--workers', type=int, default=8, help="Number of concurrent D-Bus calls.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    where_is_parser = subparsers.add_parser('where-is', help="List the groups of a phone number.")
+    where_is_parser.add_argument('number', help="Phone number.")
+    offboard_parser = subparsers.add_parser('offboard', help="Remove a phone number and its admin role from all groups.")
+    offboard_parser.add_argument('number', help="Phone number.")
+    offboard_parser.add_argument('--yes', action='store_true', help="Do not ask for confirmation.")
+    args = parser.parse_args()
+
+    signal_dbus = SignalDBus(REGISTERED_NUMBER)
+    try:
+        # Offboarding always works on a fresh sweep, a saved index may miss groups joined since it was built
+        refresh = args.refresh or args.command == 'offboard'
+        index = load_or_build_index(signal_dbus, args.index, args.max_age, refresh, args.workers)
+        groups = index.where_is(args.number)
+        if not groups:
+            print(f"{args.number} is not in any group.")
+            return
+        for _, group_name, is_admin in groups:
+            print(f"{group_name}{' (admin)' if is_admin else ''}")
+        if args.command == 'where-is':
+            return
+
+        if not args.yes and input(f"Remove {args.number} from these {len(groups)} groups? [y/N] ").strip().lower() != 'y':
+            print("Offboarding canceled.")
+            return
+        failed = offboard(signal_dbus, index, args.number, args.workers, refresh=False)
+        index.save(args.index)
+    except CallAborted as e:
+        print(f"Aborted: {str(e)}")
+        sys.exit(1)
+    if failed:
+        print(f"Could not remove {args.number} from: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import contextlib
+import csv
+import math
+import os
+import sqlite3
+import time
+import tracemalloc
+import zlib
+
+# Rough ratio of the memory used by parsed rows and per-group lists to the size of the input file
+ROW_MEMORY_FACTOR = 10
+
+
+def needs_spilling(input_bytes, memory_budget):
+    """
+    Tell whether an input is expected to exceed the memory budget when held in memory.
+
+    Args:
+        input_bytes (int): Size of the membership input in bytes.
+        memory_budget (int): Memory budget in bytes, None for no budget.
+
+    Returns:
+        bool: True if the input should be processed in partitions.
+    """
+    return bool(memory_budget) and input_bytes * ROW_MEMORY_FACTOR > memory_budget
+
+
+def partition_count(input_bytes, memory_budget):
+    # Each partition gets at most half of the budget, the rest is left for the D-Bus results and caches
+    return max(2, math.ceil(input_bytes * ROW_MEMORY_FACTOR / (memory_budget / 2)))
+
+
+class MemoryReport:
+    """
+    Peak Python memory per sync phase, measured with tracemalloc.
+
+    A disabled report measures nothing, so phases can be wrapped
+    unconditionally. A phase entered several times (once per partition)
+    reports the largest peak and the total time.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = {}
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        tracemalloc.reset_peak()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            peak = tracemalloc.get_traced_memory()[1]
+            previous_peak, previous_seconds = self.phases.get(name, (0, 0.0))
+            self.phases[name] = (max(previous_peak, peak), previous_seconds + time.monotonic() - started)
+
+    def print(self):
+        if not self.enabled:
+            return
+        print("Peak memory per phase:")
+        for name, (peak, seconds) in self.phases.items():
+            print(f"  {name:8} {peak / 1024 / 1024:10.1f} MiB {seconds:10.1f}s")
+
+
+class DiskCache:
+    """
+    Dictionary-like cache of strings to booleans kept in a SQLite file, used
+    for the registration results when they would not fit into the budget.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+
+    def __contains__(self, key):
+        return self.connection.execute('SELECT 1 FROM cache WHERE key = ?', (key,)).fetchone() is not None
+
+    def __getitem__(self, key):
+        row = self.connection.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return bool(row[0])
+
+    def __setitem__(self, key, value):
+        self.connection.execute('INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)', (key, int(bool(value))))
+
+    def close(self):
+        self.connection.close()
+
+
+def spill_rows(rows, directory, partitions):
+    """
+    Split membership rows into partition files by group name.
+
+    Every membership of a row becomes its own record, and all records of a
+    group end up in the same partition, so each partition can be synced on
+    its own.
+
+    Args:
+        rows (iterable): Dicts with the 'Phone Number', 'Group Name' and 'Group Admin' columns.
+        directory (str): Directory for the partition files.
+        partitions (int): Number of partitions.
+
+    Returns:
+        list: Paths of the partition files.
+    """
+    paths = [os.path.join(directory, f"partition-{index:04d}.csv") for index in range(partitions)]
+    files = [open(path, 'w', encoding='UTF-8', newline='') for path in paths]
+    writers = [csv.writer(partition_file) for partition_file in files]
+    try:
+        for row in rows:
+            group_names = {group_name.strip() for group_name in row['Group Name'].split(';')}
+            admin_groups = {group_name.strip() for group_name in row['Group Admin'].split(';')} if row['Group Admin'] else set()
+            for group_name in group_names | admin_groups:
+                index = zlib.crc32(group_name.encode('utf-8')) % partitions
+                writers[index].writerow([
+                    row['Phone Number'],
+                    group_name if group_name in group_names else '',
+                    group_name if group_name in admin_groups else '',
+                ])
+    finally:
+        for partition_file in files:
+            partition_file.close()
+    return paths
+
+
+def read_partition(path):
+    """
+    Read a partition file back as rows in the members CSV format.
+
+    Args:
+        path (str): Path of the partition file.
+
+    Yields:
+        dict: Rows with one group each.
+    """
+    with open(path, 'r', encoding='UTF-8', newline='') as partition_file:
+        for phone_number, group_name, admin_group in csv.reader(partition_file):
+            yield {'Phone Number': phone_number, 'Group Name': group_name, 'Group Admin': admin_group}
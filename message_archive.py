@@ -0,0 +1,351 @@
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+from dotenv import load_dotenv
+from utils import encode_group_id
+
+load_dotenv()
+REGISTERED_NUMBER = os.getenv("REGISTERED_NUMBER")
+
+DEFAULT_ARCHIVE_PATH = 'env/messages.sqlite3'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    timestamp INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    sender TEXT,
+    destination TEXT,
+    group_id TEXT,
+    body TEXT,
+    attachments TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_group ON messages (group_id, timestamp);
+CREATE INDEX IF NOT EXISTS messages_sender ON messages (sender, timestamp);
+CREATE INDEX IF NOT EXISTS messages_timestamp ON messages (timestamp);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    body, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, body) VALUES (new.id, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, body) VALUES ('delete', old.id, old.body);
+END;
+CREATE TABLE IF NOT EXISTS groups (
+    group_id TEXT PRIMARY KEY,
+    name TEXT
+);
+"""
+
+# Unique indexes treat NULLs as distinct, so the nullable columns are compared as empty strings
+IDENTITY_INDEX = """
+CREATE UNIQUE INDEX messages_identity ON messages (IFNULL(sender, ''), timestamp, IFNULL(group_id, ''), IFNULL(destination, ''))
+"""
+
+INSERT_MESSAGE = """
+INSERT OR IGNORE INTO messages (timestamp, type, sender, destination, group_id, body, attachments)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def open_archive(archive_path=DEFAULT_ARCHIVE_PATH, check_same_thread=True):
+    """
+    Open the archive database, creating its tables and indexes if needed.
+
+    Args:
+        archive_path (str): Path to the SQLite database.
+        check_same_thread (bool): Passed on to sqlite3.connect.
+
+    Returns:
+        sqlite3.Connection: The connection.
+    """
+    directory = os.path.dirname(archive_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(archive_path, check_same_thread=check_same_thread)
+    # WAL lets searches run while messages are being ingested
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    try:
+        connection.executescript(SCHEMA)
+    except sqlite3.OperationalError as e:
+        connection.close()
+        if 'fts5' in str(e):
+            raise RuntimeError("The SQLite library of this Python does not support FTS5") from e
+        raise
+    upgrade_archive(connection)
+    return connection
+
+
+def upgrade_archive(connection):
+    """
+    Create the index that identifies messages, or replace the one of older
+    archives that let messages without a sender be archived twice. Empty
+    group IDs are stored as NULL and duplicates are removed first.
+
+    Args:
+        connection (sqlite3.Connection): The archive connection.
+    """
+    row = connection.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = 'messages_identity'").fetchone()
+    if row and 'IFNULL(sender' in row[0]:
+        return
+    with connection:
+        connection.execute('DROP INDEX IF EXISTS messages_identity')
+        connection.execute("UPDATE messages SET group_id = NULL WHERE group_id = ''")
+        connection.execute(
+            "DELETE FROM messages WHERE id NOT IN (SELECT MIN(id) FROM messages "
+            "GROUP BY IFNULL(sender, ''), timestamp, IFNULL(group_id, ''), IFNULL(destination, ''))"
+        )
+        connection.execute(IDENTITY_INDEX)
+
+
+def store_group_names(connection, groups):
+    """
+    Store the names of groups, so searches can show and filter by group name.
+
+    Args:
+        connection (sqlite3.Connection): The archive connection.
+        groups (list): (group_id, group_name) tuples as returned by SignalDBus.list_groups.
+    """
+    with connection:
+        connection.executemany(
+            'INSERT OR REPLACE INTO groups (group_id, name) VALUES (?, ?)',
+            [(encode_group_id(group_id), group_name) for group_id, group_name in groups if group_name]
+        )
+
+
+def message_row(record):
+    return (
+        record['timestamp'],
+        record['type'],
+        record.get('sender'),
+        record.get('destination'),
+        # Imported records may have '' instead of None for messages outside of groups
+        record.get('group_id') or None,
+        record.get('message'),
+        json.dumps(record['attachments']) if record.get('attachments') else None,
+    )
+
+
+class MessageArchive:
+    """
+    Writes message records, as yielded by MessageStream, into the archive database.
+
+    Records are handed to a background thread through a bounded queue and
+    written in batches, one transaction per batch. Everything queued while a
+    batch is written goes into the next one, so batches grow with the load and
+    a quiet stream is still written right away. add() blocks while the queue
+    is full, which slows down a blocking MessageStream instead of dropping
+    messages. Messages already in the archive are ignored.
+    """
+
+    def __init__(self, archive_path=DEFAULT_ARCHIVE_PATH, batch_size=1000, max_queue=10000):
+        self.archive_path = archive_path
+        self.batch_size = batch_size
+        self.signal_dbus = None
+        self.added = 0
+        self.written = 0
+        self._connection = open_archive(archive_path, check_same_thread=False)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='message-archive', daemon=True)
+        self._thread.start()
+
+    def attach(self, signal_dbus):
+        self.signal_dbus = signal_dbus
+        signal_dbus.add_sent_listener(self.add)
+
+    def add(self, record):
+        self._queue.put(message_row(record))
+        self.added += 1
+
+    def _write_batch(self, batch):
+        # Row IDs then follow the message time, which lets text searches return the newest matches without sorting
+        batch.sort(key=lambda row: row[0])
+        with self._connection:
+            cursor = self._connection.executemany(INSERT_MESSAGE, batch)
+        self.written += cursor.rowcount
+
+    def _run(self):
+        while True:
+            row = self._queue.get()
+            batch = []
+            while row is not None:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    row = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    print(f"Error writing message archive: {str(e)}", file=sys.stderr)
+            if row is None:
+                break
+        self._connection.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.signal_dbus is not None:
+            self.signal_dbus.remove_sent_listener(self.add)
+        self._queue.put(None)
+        self._thread.join()
+
+
+def search(connection, text=None, group_id=None, sender=None, since=None, until=None, limit=50):
+    """
+    Search the archive, newest messages first.
+
+    Text searches order by archive order instead, which is the same unless
+    older messages were imported after newer ones.
+
+    Args:
+        connection (sqlite3.Connection): The archive connection.
+        text (str): Optional FTS5 query on the message body, for example 'refund' or '"bank transfer" OR iban*'.
+        group_id (str): Optional base64 encoded group ID.
+        sender (str): Optional sender phone number.
+        since (int): Optional lower bound of the timestamp in milliseconds.
+        until (int): Optional upper bound (exclusive) of the timestamp in milliseconds.
+        limit (int): Maximum number of messages returned.
+
+    Returns:
+        list: Dicts with the keys 'timestamp', 'type', 'sender', 'destination', 'group_id', 'group_name', 'message' and 'attachments'.
+    """
+    query = ['SELECT m.timestamp, m.type, m.sender, m.destination, m.group_id, g.name, m.body, m.attachments']
+    clauses = []
+    parameters = []
+    if text:
+        query.append('FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid')
+        clauses.append('messages_fts MATCH ?')
+        parameters.append(text)
+    else:
+        query.append('FROM messages m')
+    query.append('LEFT JOIN groups g ON g.group_id = m.group_id')
+    for clause, value in (('m.group_id = ?', group_id), ('m.sender = ?', sender), ('m.timestamp >= ?', since), ('m.timestamp < ?', until)):
+        if value is not None:
+            clauses.append(clause)
+            parameters.append(value)
+    if clauses:
+        query.append('WHERE ' + ' AND '.join(clauses))
+    # The full-text index returns matches by row ID, so ordering by it stops after limit matches instead of sorting all of them
+    query.append('ORDER BY messages_fts.rowid DESC LIMIT ?' if text else 'ORDER BY m.timestamp DESC LIMIT ?')
+    parameters.append(limit)
+
+    keys = ('timestamp', 'type', 'sender', 'destination', 'group_id', 'group_name', 'message', 'attachments')
+    messages = []
+    for row in connection.execute(' '.join(query), parameters):
+        message = dict(zip(keys, row))
+        message['attachments'] = json.loads(message['attachments']) if message['attachments'] else []
+        messages.append(message)
+    return messages
+
+
+def resolve_group(connection, group):
+    # Groups can be given by name or by their base64 encoded ID
+    row = connection.execute('SELECT group_id FROM groups WHERE name = ?', (group,)).fetchone()
+    return row[0] if row else group
+
+
+def parse_time(value):
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+def format_message(message):
+    when = datetime.fromtimestamp(message['timestamp'] / 1000).strftime('%Y-%m-%d %H:%M:%S')
+    where = message['group_name'] or message['group_id'] or message['destination'] or ''
+    attachments = f" [{len(message['attachments'])} attachments]" if message['attachments'] else ''
+    return f"{when}  {where}  {message['sender']}: {message['message'] or ''}{attachments}"
+
+
+def main():
+    """
+    Ingest messages into the archive and search it.
+    """
+    parser = argparse.ArgumentParser(description="Archive Signal messages in SQLite and search them.")
+    parser.add_argument('--archive', default=DEFAULT_ARCHIVE_PATH, help="Path to the archive database.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = subparsers.add_parser('ingest', help="Archive messages received by the daemon until interrupted.")
+    ingest_parser.add_argument('--batch-size', type=int, default=1000, help="Maximum number of messages written per transaction.")
+    ingest_parser.add_argument('--max-queue', type=int, default=10000, help="Maximum number of buffered messages.")
+    import_parser = subparsers.add_parser('import', help="Archive messages from JSONL files written by message_stream.py.")
+    import_parser.add_argument('files', nargs='+', help="JSONL files.")
+    search_parser = subparsers.add_parser('search', help="Search archived messages, newest first.")
+    search_parser.add_argument('text', nargs='?', help="FTS5 query on the message text.")
+    search_parser.add_argument('--group', help="Group name or base64 encoded group ID.")
+    search_parser.add_argument('--sender', help="Sender phone number.")
+    search_parser.add_argument('--since', help="Only messages at or after this ISO date or time.")
+    search_parser.add_argument('--until', help="Only messages before this ISO date or time.")
+    search_parser.add_argument('--limit', type=int, default=50, help="Maximum number of messages shown.")
+    search_parser.add_argument('--json', action='store_true', help="Print the messages as JSON lines.")
+    args = parser.parse_args()
+
+    if args.command == 'search':
+        connection = open_archive(args.archive)
+        try:
+            messages = search(
+                connection,
+                text=args.text,
+                group_id=resolve_group(connection, args.group) if args.group else None,
+                sender=args.sender,
+                since=parse_time(args.since) if args.since else None,
+                until=parse_time(args.until) if args.until else None,
+                limit=args.limit,
+            )
+        except sqlite3.OperationalError as e:
+            print(f"Error searching messages: {str(e)}")
+            sys.exit(1)
+        finally:
+            connection.close()
+        for message in messages:
+            print(json.dumps(message, ensure_ascii=False) if args.json else format_message(message))
+        return
+
+    if args.command == 'import':
+        archive = MessageArchive(args.archive)
+        try:
+            for file_path in args.files:
+                with open(file_path, 'r', encoding='UTF-8') as jsonl_file:
+                    for line in jsonl_file:
+                        if line.strip():
+                            archive.add(json.loads(line))
+        finally:
+            archive.close()
+        print(f"Archived {archive.written} of {archive.added} messages, the rest were already archived.")
+        return
+
+    from signal_dbus import SignalDBus
+
+    signal_dbus = SignalDBus(REGISTERED_NUMBER)
+    connection = open_archive(args.archive)
+    try:
+        store_group_names(connection, signal_dbus.list_groups())
+    finally:
+        connection.close()
+    archive = MessageArchive(args.archive, batch_size=args.batch_size, max_queue=args.max_queue)
+    archive.attach(signal_dbus)
+    stream = signal_dbus.receive_messages(overflow='block')
+    try:
+        with stream:
+            for record in stream:
+                archive.add(record)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        archive.close()
+    print(f"Archived {archive.written} messages.")
+
+
+if __name__ == '__main__':
+    main()
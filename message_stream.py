@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+
+from dotenv import load_dotenv
+from gi.repository import GLib
+
+from utils import encode_group_id
+
+OVERFLOW_POLICIES = ('block', 'drop_newest', 'drop_oldest')
+
+_STOP = object()
+
+
+class MessageStream:
+    """
+    Iterator over messages received by the signal-cli daemon.
+
+    The daemon's MessageReceived and SyncMessageReceived signals are dispatched
+    by a GLib main loop running in a background thread and handed over to the
+    consumer through a bounded queue. When the queue is full the overflow policy
+    decides what happens:
+
+    - 'block': the GLib thread waits for the consumer. Signals that arrive in
+      the meantime are buffered by libdbus inside this process, so they still
+      use its memory. Use a drop policy to bound memory under sustained load.
+    - 'drop_newest': the incoming message is discarded.
+    - 'drop_oldest': the oldest queued message is discarded.
+    """
+
+    def __init__(self, signal_object, max_queue=1000, overflow='block', include_sync=True):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}', expected one of {OVERFLOW_POLICIES}")
+        self.signal_object = signal_object
+        self.overflow = overflow
+        self.include_sync = include_sync
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.received = 0
+        self.dropped = 0
+        self._loop = None
+        self._thread = None
+        self._subscriptions = []
+        self._closed = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._subscriptions.append(self.signal_object.MessageReceived.connect(self._on_message))
+        if self.include_sync:
+            self._subscriptions.append(self.signal_object.SyncMessageReceived.connect(self._on_sync_message))
+        self._loop = GLib.MainLoop()
+        self._thread = threading.Thread(target=self._loop.run, name='signal-message-stream', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        for subscription in self._subscriptions:
+            subscription.disconnect()
+        self._subscriptions = []
+        if self._loop is not None:
+            self._loop.quit()
+        # Make room for the sentinel so a blocked consumer always wakes up
+        while True:
+            try:
+                self.queue.put_nowait(_STOP)
+                break
+            except queue.Full:
+                self._discard_oldest()
+
+    def get(self, timeout=None):
+        """
+        Returns the next message record, or None when the stream is closed or
+        the timeout expires.
+        """
+        try:
+            record = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if record is _STOP:
+            # Leave the sentinel in place for other consumers
+            self.queue.put(_STOP)
+            return None
+        return record
+
+    def __iter__(self):
+        self.start()
+        while True:
+            record = self.get()
+            if record is None:
+                return
+            yield record
+
+    def __aiter__(self):
+        self.start()
+        return self
+
+    async def __anext__(self):
+        record = await asyncio.get_running_loop().run_in_executor(None, self.get)
+        if record is None:
+            raise StopAsyncIteration
+        return record
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _on_message(self, timestamp, sender, group_id, message, attachments):
+        self._enqueue({
+            'type': 'message',
+            'timestamp': timestamp,
+            'sender': sender,
+            'destination': None,
+            'group_id': encode_group_id(group_id),
+            'message': message,
+            'attachments': list(attachments),
+        })
+
+    def _on_sync_message(self, timestamp, source, destination, group_id, message, attachments):
+        self._enqueue({
+            'type': 'sync',
+            'timestamp': timestamp,
+            'sender': source,
+            'destination': destination or None,
+            'group_id': encode_group_id(group_id),
+            'message': message,
+            'attachments': list(attachments),
+        })
+
+    def _enqueue(self, record):
+        if self._closed.is_set():
+            return
+        self.received += 1
+        if self.overflow == 'block':
+            while not self._closed.is_set():
+                try:
+                    self.queue.put(record, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == 'drop_oldest':
+                self._discard_oldest()
+                try:
+                    self.queue.put_nowait(record)
+                    return
+                except queue.Full:
+                    pass
+            self.dropped += 1
+
+    def _discard_oldest(self):
+        try:
+            self.queue.get_nowait()
+            self.dropped += 1
+        except queue.Empty:
+            pass
+
+
+class JsonlSink:
+    """
+    Appends message records to JSON Lines files, starting a new file once the
+    current one exceeds max_bytes and keeping at most max_files of them.
+    """
+
+    def __init__(self, directory, prefix='messages', max_bytes=64 * 1024 * 1024, max_files=None, flush_every=100):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.flush_every = flush_every
+        self._file = None
+        self._size = 0
+        self._pending = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        if self._file is None or self._size >= self.max_bytes:
+            self._rotate()
+        self._file.write(line)
+        self._size += len(line.encode('utf-8'))
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+        self._pending = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _rotate(self):
+        self.close()
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self.directory, f"{self.prefix}-{stamp}.jsonl")
+        counter = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f"{self.prefix}-{stamp}-{counter}.jsonl")
+            counter += 1
+        self._file = open(path, 'a', encoding='UTF-8')
+        self._size = 0
+        self._prune()
+
+    def _prune(self):
+        if not self.max_files:
+            return
+        files = sorted(
+            (os.path.join(self.directory, name) for name in os.listdir(self.directory)
+             if name.startswith(f"{self.prefix}-") and name.endswith('.jsonl')),
+            key=os.path.getmtime
+        )
+        for path in files[:-self.max_files]:
+            os.remove(path)
+
+
+def main():
+    """
+    Streams incoming messages of the registered account into rotating JSONL files.
+    """
+    from signal_dbus import SignalDBus
+
+    parser = argparse.ArgumentParser(description="Write received Signal messages to rotating JSONL files.")
+    parser.add_argument('--output', default='env/messages', help="Directory for the JSONL files.")
+    parser.add_argument('--max-queue', type=int, default=1000, help="Maximum number of buffered messages.")
+    parser.add_argument('--overflow', choices=OVERFLOW_POLICIES, default='block', help="What to do when the buffer is full.")
+    parser.add_argument('--max-bytes', type=int, default=64 * 1024 * 1024, help="Size at which a new file is started.")
+    parser.add_argument('--max-files', type=int, default=None, help="Number of files to keep.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    signal_dbus = SignalDBus(os.getenv("REGISTERED_NUMBER"))
+    stream = signal_dbus.receive_messages(max_queue=args.max_queue, overflow=args.overflow)
+    with stream, JsonlSink(args.output, max_bytes=args.max_bytes, max_files=args.max_files) as sink:
+        try:
+            for record in stream:
+                sink.write(record)
+        except KeyboardInterrupt:
+            pass
+    print(f"Received {stream.received} messages, dropped {stream.dropped}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+from pydbus import SystemBus  # type: ignore
+
+from signal_dbus import SignalDBus, account_object_path
+
+load_dotenv()
+REGISTERED_NUMBER = os.getenv("REGISTERED_NUMBER")
+
+
+def probe(registered_number, bus=None, timeout=5.0):
+    """
+    Measure the round-trip latency to the signal-cli base and account objects.
+
+    Args:
+        registered_number (str): The registered Signal number.
+        bus: An existing system bus connection, a new one is opened if omitted.
+        timeout (float): Timeout in seconds for each call.
+
+    Returns:
+        dict: 'ready', 'version', 'base_latency' and 'account_latency' (seconds) and 'error'.
+    """
+    result = {'ready': False, 'version': None, 'base_latency': None, 'account_latency': None, 'error': None}
+    try:
+        bus = bus or SystemBus()
+        started = time.perf_counter()
+        base_object = bus.get('org.asamk.Signal', object_path='/org/asamk/Signal')
+        result['version'] = base_object.version(timeout=timeout)
+        result['base_latency'] = time.perf_counter() - started
+
+        # The account object only answers once the daemon has loaded the account
+        started = time.perf_counter()
+        account_object = bus.get('org.asamk.Signal', object_path=account_object_path(registered_number))
+        account_object.getSelfNumber(timeout=timeout)
+        result['account_latency'] = time.perf_counter() - started
+        result['ready'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    return result
+
+
+def wait_until_ready(registered_number, timeout=120.0, interval=1.0, bus=None):
+    """
+    Probe the daemon until it is ready or the timeout expires.
+
+    Args:
+        registered_number (str): The registered Signal number.
+        timeout (float): Maximum number of seconds to wait.
+        interval (float): Seconds between probes.
+        bus: An existing system bus connection.
+
+    Returns:
+        dict: The last probe result, with 'waited' set to the seconds spent waiting.
+    """
+    started = time.monotonic()
+    while True:
+        remaining = timeout - (time.monotonic() - started)
+        result = probe(registered_number, bus, timeout=max(1.0, min(remaining, 10.0)))
+        if result['ready'] or remaining <= interval:
+            result['waited'] = time.monotonic() - started
+            return result
+        time.sleep(interval)
+
+
+def warm_up(signal_dbus, group_count=10):
+    """
+    Issue a few representative calls so the daemon has loaded its group store before a sync.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        group_count (int): Number of groups to read all properties from.
+
+    Returns:
+        float: Seconds spent warming up.
+    """
+    started = time.perf_counter()
+    groups = signal_dbus.list_groups()
+    for group_id, _ in groups[:group_count]:
+        signal_dbus.get_all_group_properties(group_id)
+    return time.perf_counter() - started
+
+
+def format_latency(seconds):
+    return f"{seconds * 1000:.1f} ms" if seconds is not None else "-"
+
+
+def main():
+    """
+    Report daemon readiness, version and latency.
+    """
+    parser = argparse.ArgumentParser(description="Check whether the signal-cli daemon is ready and how fast it answers.")
+    parser.add_argument('--wait', type=float, default=0, help="Wait up to this many seconds for the daemon to become ready.")
+    parser.add_argument('--count', type=int, default=1, help="Number of probes to run for latency statistics.")
+    parser.add_argument('--warm-up', action='store_true', help="Read the group list and some groups after the daemon is ready.")
+    args = parser.parse_args()
+
+    bus = SystemBus()
+    result = wait_until_ready(REGISTERED_NUMBER, args.wait, bus=bus) if args.wait else probe(REGISTERED_NUMBER, bus)
+    if not result['ready']:
+        print(f"Daemon not ready: {result['error']}")
+        sys.exit(1)
+    print(f"Daemon ready, signal-cli version {result['version']}")
+
+    results = [result] + [probe(REGISTERED_NUMBER, bus) for _ in range(args.count - 1)]
+    for key, label in (('base_latency', 'Base object'), ('account_latency', 'Account object')):
+        latencies = [entry[key] for entry in results if entry[key] is not None]
+        print(f"{label} latency: min {format_latency(min(latencies))}, "
+              f"median {format_latency(statistics.median(latencies))}, max {format_latency(max(latencies))}")
+
+    if args.warm_up:
+        print(f"Warm-up took {warm_up(SignalDBus(REGISTERED_NUMBER)):.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import csv
+import heapq
+import itertools
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from call_policy import CallAborted
+
+# Steps of a group's sync in the order they run, removals first so revoked access goes away soonest
+STEP_ORDER = {'remove': 0, 'add': 1, 'admins': 2}
+
+
+def load_group_priorities(group_csv_file_path):
+    """
+    Read the optional Priority column of the groups CSV file.
+
+    Args:
+        group_csv_file_path (str): Path to the CSV file containing group information.
+
+    Returns:
+        dict: Priorities keyed by group name, higher runs first. Groups without one are left out.
+    """
+    priorities = {}
+    with open(group_csv_file_path, 'r', encoding='UTF-8') as group_csv_file:
+        for row in csv.DictReader(group_csv_file):
+            value = (row.get('Priority') or '').strip()
+            if value:
+                try:
+                    priorities[row['Group Name']] = int(value)
+                except ValueError:
+                    print(f"Ignoring invalid priority '{value}' for group: {row['Group Name']}")
+    return priorities
+
+
+class GroupWork:
+    """
+    The remaining steps of one group's sync, each applying at most slice_size members.
+
+    The members each step failed for are collected in delta['failed'], keyed by step.
+    """
+
+    def __init__(self, delta, priority=0, slice_size=100):
+        self.delta = delta
+        self.delta['failed'] = {step: [] for step in STEP_ORDER}
+        self.priority = priority
+        self.steps = deque()
+        for step in ('remove', 'add'):
+            members = delta[step]
+            for start in range(0, len(members), slice_size):
+                self.steps.append((step, members[start:start + slice_size]))
+        if delta['admins']:
+            self.steps.append(('admins', delta['admins']))
+        self.started = False
+        self.current = None
+        self.current_members = []
+
+    def key(self):
+        step = self.steps[0][0]
+        # Higher priority first, then removals before additions, then the smallest delta
+        return (-self.priority, STEP_ORDER[step], len(self.delta[step]))
+
+    def run_next(self, signal_dbus):
+        step, members = self.steps.popleft()
+        self.current = step
+        self.current_members = members
+        group_id = eval(self.delta['group_id'])
+        if not self.started:
+            self.started = True
+            print(f"Syncing members for group: {self.delta['group_name']}")
+        if step == 'remove':
+            succeeded = signal_dbus.remove_members(group_id, members)
+        elif step == 'add':
+            succeeded = signal_dbus.add_members(group_id, members)
+        else:
+            print(f"Setting {members} as admins for group: {self.delta['group_name']}")
+            succeeded = signal_dbus.add_admins(group_id, members)
+        succeeded = set(succeeded or [])
+        failed = [member for member in members if member not in succeeded]
+        self.delta['failed'][step].extend(failed)
+        # The number of members the step failed for
+        return len(failed)
+
+    def skip_rest(self):
+        """
+        Count the current and all remaining steps as failed and drop the remaining steps.
+
+        Returns:
+            int: The number of members skipped.
+        """
+        self.delta['failed'][self.current].extend(self.current_members)
+        for step, members in self.steps:
+            self.delta['failed'][step].extend(members)
+        skipped = len(self.current_members) + sum(len(members) for _, members in self.steps)
+        self.steps.clear()
+        return skipped
+
+
+def schedule_deltas(signal_dbus, deltas, priorities=None, max_workers=4, slice_size=100):
+    """
+    Apply group deltas in priority order, interleaving groups under a concurrency limit.
+
+    Work is ordered by group priority, then removals before additions, then
+    by the size of the group's removals or additions, smallest first. Each group has at most
+    one step in flight, and after every slice the group goes back into the
+    queue behind the groups of equal rank, so large groups do not hold back
+    the others.
+
+    Args:
+        signal_dbus (SignalDBus): An instance of the SignalDBus class.
+        deltas (list): Group deltas as returned by group_sync.diff_group_memberships.
+        priorities (dict): Optional priorities keyed by group name, higher runs first.
+        max_workers (int): Number of steps applied concurrently.
+        slice_size (int): Members applied per step.
+
+    Returns:
+        int: Number of member changes that failed. The failed members are
+        recorded in each delta's 'failed' dict, keyed by step.
+    """
+    priorities = priorities or {}
+    sequence = itertools.count()
+    queue = []
+    for delta in deltas:
+        work = GroupWork(delta, priorities.get(delta['group_name'], 0), slice_size)
+        if work.steps:
+            heapq.heappush(queue, (work.key(), next(sequence), work))
+    removals = sum(1 for _, _, work in queue for step, _ in work.steps if step == 'remove')
+
+    failed = 0
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+        try:
+            while queue or in_flight:
+                while queue and len(in_flight) < max_workers:
+                    _, _, work = heapq.heappop(queue)
+                    in_flight[executor.submit(work.run_next, signal_dbus)] = work
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    work = in_flight.pop(future)
+                    try:
+                        failed += future.result()
+                    except CallAborted:
+                        raise
+                    except Exception as e:
+                        print(f"Error syncing group '{work.delta['group_name']}': {str(e)}")
+                        # The rest of the group is skipped, including its remaining removals
+                        removals -= sum(1 for step, _ in work.steps if step == 'remove')
+                        failed += work.skip_rest()
+                    if work.current == 'remove':
+                        removals -= 1
+                        if removals == 0:
+                            print(f"All removals applied after {time.monotonic() - started:.1f}s")
+                    if work.steps:
+                        heapq.heappush(queue, (work.key(), next(sequence), work))
+        except CallAborted:
+            for future in in_flight:
+                future.cancel()
+            raise
+    return failed
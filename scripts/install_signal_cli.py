@@ -7,82 +7,145 @@ Signal CLI Install Script
 This script installs and configures Signal CLI on your system.
 It also creates an .env file and sets up the necessary environment for the Signal Admin Tool.
 
+Downloaded artifacts (release tarball, service and D-Bus policy files, Python wheels) are kept
+in an artifact cache together with a manifest of pinned versions and SHA-256 checksums. Once the
+cache is seeded ('--seed-cache'), further hosts can be provisioned with '--offline'.
+
 Run this script without 'sudo'.
 """
 
 import os
 import sys
 import re
+import json
+import hashlib
+import argparse
+import importlib.util
 import subprocess
 import logging
 import tempfile
 import shutil
 from pathlib import Path
 
-# Install system dependencies required for pycairo, PyGObject, pydbus
+# Import name of each required Python package, used to skip packages that are already installed
+PYTHON_PACKAGES = {
+    'qrcode': 'qrcode',
+    'Pillow': 'PIL',
+    'requests': 'requests',
+    'pycairo': 'cairo',
+    'PyGObject': 'gi',
+    'pydbus': 'pydbus',
+    'python-dotenv': 'dotenv',
+    'inquirer': 'inquirer',
+}
+SYSTEM_PACKAGES = [
+    'libgirepository1.0-dev', 'gcc', 'libcairo2-dev', 'pkg-config', 'python3-dev', 'gir1.2-gtk-4.0',
+    'libunixsocket-java',
+]
+DATA_FILES = ['signal-cli.service', 'org.asamk.Signal.conf', 'org.asamk.Signal.service']
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Install and configure Signal CLI.")
+    parser.add_argument('--cache-dir', default=os.getenv('SIGNAL_ARTIFACT_CACHE', str(Path.home() / '.cache' / 'signal-admin')),
+                        help="Directory for cached artifacts and the manifest.")
+    parser.add_argument('--offline', action='store_true', help="Only use artifacts from the cache.")
+    parser.add_argument('--seed-cache', action='store_true', help="Download all artifacts into the cache and exit.")
+    parser.add_argument('--version', help="Signal CLI version to install or seed, defaults to the pinned or latest version.")
+    return parser.parse_args()
+
+ARGS = parse_args()
+CACHE_DIR = Path(ARGS.cache_dir)
+MANIFEST_PATH = CACHE_DIR / 'manifest.json'
+WHEEL_DIR = CACHE_DIR / 'wheels'
+
+def load_manifest():
+    if MANIFEST_PATH.exists():
+        return json.loads(MANIFEST_PATH.read_text())
+    return {'signal_cli_version': None, 'checksums': {}}
+
+def save_manifest(manifest):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    temp_path = MANIFEST_PATH.with_name(MANIFEST_PATH.name + '.tmp')
+    temp_path.write_text(json.dumps(manifest, indent=2, sort_keys=True) + '\n')
+    os.replace(temp_path, MANIFEST_PATH)
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with Path(path).open('rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def cached_artifact(manifest, name):
+    # Returns the cached file if it exists and matches the checksum pinned in the manifest
+    path = CACHE_DIR / name
+    expected = manifest['checksums'].get(name)
+    if path.exists() and expected and file_sha256(path) == expected:
+        return path
+    return None
+
+def java_package_needed():
+    if shutil.which('java') is None:
+        return True
+    try:
+        java_version_output = subprocess.check_output(['java', '-version'], stderr=subprocess.STDOUT, text=True)
+    except subprocess.CalledProcessError:
+        return True
+    return not ('openjdk version "21' in java_version_output or ('OpenJDK Runtime Environment' in java_version_output and '21.' in java_version_output))
+
+def apt_package_installed(package):
+    result = subprocess.run(['dpkg-query', '-W', '-f=${Status}', package], capture_output=True, text=True)
+    return result.returncode == 0 and 'install ok installed' in result.stdout
+
+# Install system dependencies required for pycairo, PyGObject, pydbus and Signal CLI in one apt run
 def install_system_dependencies():
-    logging.info("Installing system dependencies for pycairo, PyGObject, and pydbus...")
+    packages = SYSTEM_PACKAGES + (['openjdk-21-jre'] if java_package_needed() else [])
+    missing = [package for package in packages if not apt_package_installed(package)]
+    if not missing:
+        logging.info("System dependencies are already installed.")
+        return
+    logging.info(f"Installing system dependencies: {' '.join(missing)}...")
     try:
-        subprocess.run(['sudo', 'apt', 'update'], check=True)
-        subprocess.run([
-            'sudo', 'apt', 'install', '-y', 'libgirepository1.0-dev', 'gcc', 'libcairo2-dev',
-            'pkg-config', 'python3-dev', 'gir1.2-gtk-4.0'
-        ], check=True)
+        if not ARGS.offline:
+            subprocess.run(['sudo', 'apt', 'update'], check=True)
+        subprocess.run(['sudo', 'apt', 'install', '-y'] + missing, check=True)
         logging.info("System dependencies installed successfully.")
     except subprocess.CalledProcessError:
         sys.exit("Failed to install system dependencies. Exiting.")
 
-# Install required Python libraries in the virtual environment
+# Install required Python libraries in the virtual environment with a single pip invocation
 def install_python_packages():
-    required_packages = ['qrcode', 'Pillow', 'requests', 'pycairo', 'PyGObject', 'pydbus', 'python-dotenv', 'inquirer']
-    for package in required_packages:
-        try:
-            __import__(package)
-        except ImportError:
-            subprocess.run([sys.executable, '-m', 'pip', 'install', package], check=True)
-
-# Call the function to install system dependencies first
-install_system_dependencies()
+    missing = [package for package, module in PYTHON_PACKAGES.items() if importlib.util.find_spec(module) is None]
+    if not missing:
+        return
+    command = [sys.executable, '-m', 'pip', 'install']
+    if ARGS.offline:
+        command += ['--no-index', '--find-links', str(WHEEL_DIR)]
+    elif WHEEL_DIR.exists():
+        command += ['--find-links', str(WHEEL_DIR)]
+    subprocess.run(command + missing, check=True)
+
+# Seeding the cache only downloads and builds artifacts, it does not install anything on this host
+if ARGS.seed_cache:
+    try:
+        import requests  # For fetching the latest version
+    except ImportError:
+        sys.exit("Seeding the artifact cache needs the 'requests' package. Install it with 'pip install requests'.")
+else:
+    # Call the function to install system dependencies first
+    install_system_dependencies()
 
-# Call the function to install required packages before importing them
-install_python_packages()
+    # Call the function to install required packages before importing them
+    install_python_packages()
 
-# Now import the external packages
-import requests  # For fetching the latest version
-import qrcode
-from PIL import Image
+    # Now import the external packages
+    import requests  # For fetching the latest version
+    import qrcode
+    from PIL import Image
 
 def setup_logging():
     logging.basicConfig(level=logging.INFO, format='%(message)s')
 
-def check_java():
-    if shutil.which('java') is not None:
-        try:
-            java_version_output = subprocess.check_output(['java', '-version'], stderr=subprocess.STDOUT, text=True)
-            if 'openjdk version "21' in java_version_output or ('OpenJDK Runtime Environment' in java_version_output and '21.' in java_version_output):
-                logging.info("OpenJDK 21 is already installed.")
-                return
-            else:
-                logging.info("A different version of Java is installed. Installing OpenJDK 21...")
-        except subprocess.CalledProcessError:
-            logging.info("Failed to get Java version. Installing OpenJDK 21...")
-    else:
-        logging.info("Java is not installed. Installing OpenJDK 21...")
-
-    # Install OpenJDK 21 using apt
-    subprocess.run(['sudo', 'apt', 'update'], check=True)
-    subprocess.run(['sudo', 'apt', 'install', '-y', 'openjdk-21-jre'], check=True)
-    logging.info("OpenJDK 21 installation completed.")
-
-def check_git():
-    if shutil.which('git') is not None:
-        logging.info("Git is already installed.")
-    else:
-        logging.info("Git is not installed. Installing Git...")
-        subprocess.run(['sudo', 'apt', 'update'], check=True)
-        subprocess.run(['sudo', 'apt', 'install', '-y', 'git'], check=True)
-        logging.info("Git installation completed.")
-
 def create_signal_cli_user():
     logging.info("Creating 'signal-cli' user and group...")
     try:
@@ -132,7 +195,15 @@ def get_latest_version():
         sys.exit("Exiting due to the above error.")
 
 def get_signal_version():
-    latest_version = get_latest_version()
+    if ARGS.version:
+        return ARGS.version
+    pinned_version = load_manifest()['signal_cli_version']
+    if ARGS.offline:
+        if not pinned_version:
+            sys.exit("The artifact cache has no pinned Signal CLI version. Seed it with '--seed-cache' first.")
+        logging.info(f"Using pinned version {pinned_version}.")
+        return pinned_version
+    latest_version = pinned_version or get_latest_version()
     while True:
         version = input(f"Enter the Signal CLI version to install [Default: {latest_version}]: ").strip()
         if not version:
@@ -143,16 +214,73 @@ def get_signal_version():
             logging.warning("Invalid version format. Please try again.")
 
 def download_signal_cli(version):
-    url = f"https://github.com/AsamK/signal-cli/releases/download/v{version}/signal-cli-{version}.tar.gz"
-    temp_dir = Path(tempfile.gettempdir())
-    tarball_path = temp_dir / f"signal-cli-{version}.tar.gz"
+    manifest = load_manifest()
+    name = f"signal-cli-{version}.tar.gz"
+    cached = cached_artifact(manifest, name)
+    if cached:
+        logging.info(f"Using cached Signal CLI {version} from {cached}.")
+        return cached
+    if ARGS.offline:
+        sys.exit(f"{name} is not in the artifact cache or does not match its checksum.")
+
+    url = f"https://github.com/AsamK/signal-cli/releases/download/v{version}/{name}"
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tarball_path = CACHE_DIR / name
+    partial_path = CACHE_DIR / (name + '.part')
     logging.info(f"Downloading Signal CLI version {version}...")
     try:
-        subprocess.run(['wget', url, '-O', str(tarball_path)], check=True)
-        logging.info("Download completed.")
-        return tarball_path
+        subprocess.run(['wget', url, '-O', str(partial_path)], check=True)
     except subprocess.CalledProcessError:
         sys.exit("Failed to download Signal CLI. Please check the version number and your internet connection.")
+    partial_path.replace(tarball_path)
+    manifest['checksums'][name] = file_sha256(tarball_path)
+    manifest['signal_cli_version'] = version
+    save_manifest(manifest)
+    logging.info("Download completed.")
+    return tarball_path
+
+def fetch_data_files(version):
+    # Only the three files from data/ are needed, so fetch them directly instead of cloning the repository
+    manifest = load_manifest()
+    data_files = {}
+    for file_name in DATA_FILES:
+        name = f"data/v{version}/{file_name}"
+        cached = cached_artifact(manifest, name)
+        if not cached:
+            if ARGS.offline:
+                sys.exit(f"{name} is not in the artifact cache or does not match its checksum.")
+            url = f"https://raw.githubusercontent.com/AsamK/signal-cli/v{version}/data/{file_name}"
+            logging.info(f"Downloading {file_name}...")
+            try:
+                response = requests.get(url, timeout=30)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                logging.error(f"Failed to download {file_name}: {e}")
+                sys.exit("Exiting due to the above error.")
+            cached = CACHE_DIR / name
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            cached.write_bytes(response.content)
+            manifest['checksums'][name] = file_sha256(cached)
+        data_files[file_name] = cached
+    save_manifest(manifest)
+    return data_files
+
+def seed_cache(version):
+    logging.info(f"Seeding the artifact cache in {CACHE_DIR}...")
+    download_signal_cli(version)
+    fetch_data_files(version)
+    WHEEL_DIR.mkdir(parents=True, exist_ok=True)
+    # pycairo and PyGObject only ship source distributions, so build wheels for them instead of
+    # downloading sdists that would need their build dependencies from the index on offline hosts
+    try:
+        subprocess.run([sys.executable, '-m', 'pip', 'wheel', '-w', str(WHEEL_DIR)] + list(PYTHON_PACKAGES), check=True)
+    except subprocess.CalledProcessError:
+        sys.exit("Failed to build the Python wheels. Building pycairo and PyGObject needs libgirepository1.0-dev, gcc, libcairo2-dev, pkg-config and python3-dev on this host.")
+    manifest = load_manifest()
+    manifest['signal_cli_version'] = version
+    manifest['python_packages'] = sorted(path.name for path in WHEEL_DIR.iterdir())
+    save_manifest(manifest)
+    logging.info("Artifact cache seeded. Copy it to other hosts and run the installer with '--offline'.")
 
 def install_signal_cli(version, tarball_path):
     install_dir = Path(f"/opt/signal-cli-{version}")
@@ -168,20 +296,20 @@ def install_signal_cli(version, tarball_path):
 def configure_signal_cli(version, number):
     logging.info("Configuring Signal CLI as a system service...")
 
+    data_files = fetch_data_files(version)
+
     # Use a unique temporary directory
     with tempfile.TemporaryDirectory() as temp_dir:
         temp_path = Path(temp_dir)
-        subprocess.run(['git', 'clone', 'https://github.com/AsamK/signal-cli.git', str(temp_path / 'signal-cli')], check=True)
-        data_dir = temp_path / 'signal-cli' / 'data'
 
         # Paths to temporary files
         temp_service_file = temp_path / 'signal-cli.service'
         temp_policy_file = temp_path / 'org.asamk.Signal.conf'
 
         # Copy configuration files to temporary directory
-        subprocess.run(['cp', str(data_dir / 'signal-cli.service'), str(temp_service_file)], check=True)
-        subprocess.run(['cp', str(data_dir / 'org.asamk.Signal.conf'), str(temp_policy_file)], check=True)
-        subprocess.run(['sudo', 'cp', str(data_dir / 'org.asamk.Signal.service'), '/usr/share/dbus-1/system-services/'], check=True)
+        subprocess.run(['cp', str(data_files['signal-cli.service']), str(temp_service_file)], check=True)
+        subprocess.run(['cp', str(data_files['org.asamk.Signal.conf']), str(temp_policy_file)], check=True)
+        subprocess.run(['sudo', 'cp', str(data_files['org.asamk.Signal.service']), '/usr/share/dbus-1/system-services/org.asamk.Signal.service'], check=True)
 
         # Update the service file
         with temp_service_file.open('r') as file:
@@ -298,7 +426,6 @@ def link_device():
 
 def finalize_installation():
     logging.info("Finalizing installation...")
-    subprocess.run(['sudo', 'apt', 'install', '-y', 'libunixsocket-java'], check=True)
     subprocess.run(['sudo', 'cp', '/usr/lib/jni/libunix-java.so', '/lib'], check=True)
     subprocess.run(['sudo', 'systemctl', 'daemon-reload'], check=True)
     subprocess.run(['sudo', 'systemctl', 'enable', 'signal-cli.service'], check=True)
@@ -336,8 +463,9 @@ def main():
     setup_logging()
     logging.info("Welcome to the Signal CLI install wizard.")
 
-    check_java()
-    check_git()
+    if ARGS.seed_cache:
+        seed_cache(ARGS.version or load_manifest()['signal_cli_version'] or get_latest_version())
+        return
 
     create_signal_cli_user()
     adjust_permissions()
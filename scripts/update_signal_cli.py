@@ -4,14 +4,16 @@
 """
 Signal CLI Update Script
 
-This script updates Signal CLI to the latest version by performing the following actions:
+This script updates Signal CLI to the latest version with a staged, zero-downtime upgrade:
 - Automatically retrieves the latest version from the official GitHub repository.
 - Prompts the user to confirm the update.
-- Downloads the new version.
-- Unpacks the archive into the /opt directory.
-- Updates the symbolic link in /usr/local/bin/.
-- Updates the system service file if necessary.
-- Reloads the system daemon and restarts the Signal CLI service.
+- Downloads the new version into a cache directory, reusing and checksum-verifying earlier downloads.
+- Unpacks the archive into /opt next to the running version.
+- Warms up the new version by running it once before switching.
+- Atomically switches the /opt/signal-cli-current and /usr/local/bin/signal-cli symlinks.
+- Points the system service at /opt/signal-cli-current (only needed once).
+- Restarts the Signal CLI service and waits until it answers on D-Bus.
+- Rolls back to the previous version if the daemon does not become ready.
 
 Run this script with superuser privileges ('sudo').
 """
@@ -19,11 +21,20 @@ Run this script with superuser privileges ('sudo').
 import os
 import sys
 import re
+import time
+import hashlib
+import shutil
 import subprocess
 import logging
 import requests
 from pathlib import Path
 
+CACHE_DIR = Path(os.getenv('SIGNAL_CLI_CACHE', '/var/cache/signal-cli'))
+CURRENT_LINK = Path('/opt/signal-cli-current')
+BIN_SYMLINK = Path('/usr/local/bin/signal-cli')
+SERVICE_FILE = Path('/etc/systemd/system/signal-cli.service')
+READY_TIMEOUT = 180
+
 def check_superuser():
     if os.geteuid() != 0:
         sys.exit("This script must be run with superuser privileges. Please run with 'sudo'.")
@@ -39,7 +50,7 @@ def get_installed_version():
     except subprocess.CalledProcessError:
         return None
 
-def get_latest_version():
+def get_latest_release():
     logging.info("Retrieving the latest Signal CLI version from GitHub...")
     api_url = "https://api.github.com/repos/AsamK/signal-cli/releases/latest"
     try:
@@ -48,7 +59,12 @@ def get_latest_version():
         latest_release = response.json()
         latest_version = latest_release['tag_name'].lstrip('v')
         logging.info(f"Latest version available: {latest_version}")
-        return latest_version
+        # GitHub publishes the SHA-256 digest of release assets as 'sha256:<hex>'
+        checksum = None
+        for asset in latest_release.get('assets', []):
+            if asset.get('name') == f"signal-cli-{latest_version}.tar.gz" and (asset.get('digest') or '').startswith('sha256:'):
+                checksum = asset['digest'].split(':', 1)[1]
+        return latest_version, checksum
     except requests.RequestException as e:
         logging.error(f"Failed to retrieve the latest version: {e}")
         sys.exit("Exiting due to the above error.")
@@ -65,64 +81,151 @@ def prompt_for_update(installed_version, latest_version):
         logging.info("Update canceled by the user.")
         return False
 
-def download_signal_cli(version):
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with path.open('rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def download_signal_cli(version, checksum=None):
     url = f"https://github.com/AsamK/signal-cli/releases/download/v{version}/signal-cli-{version}.tar.gz"
-    temp_dir = Path('/tmp')
-    tarball_path = temp_dir / f"signal-cli-{version}.tar.gz"
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tarball_path = CACHE_DIR / f"signal-cli-{version}.tar.gz"
+    checksum_path = CACHE_DIR / f"signal-cli-{version}.tar.gz.sha256"
+
+    if tarball_path.exists():
+        expected = checksum or (checksum_path.read_text().strip() if checksum_path.exists() else None)
+        if expected and file_sha256(tarball_path) == expected:
+            logging.info(f"Using cached download {tarball_path}.")
+            return tarball_path
+        logging.info("Cached download is missing a checksum or does not match it. Downloading again...")
+
     logging.info(f"Downloading Signal CLI version {version}...")
+    partial_path = tarball_path.with_name(tarball_path.name + '.part')
     try:
-        subprocess.run(['wget', url, '-O', str(tarball_path)], check=True)
-        logging.info("Download completed.")
-        return tarball_path
+        subprocess.run(['wget', url, '-O', str(partial_path)], check=True)
     except subprocess.CalledProcessError:
         sys.exit("Failed to download Signal CLI. Please check your internet connection.")
 
+    actual = file_sha256(partial_path)
+    if checksum and actual != checksum:
+        partial_path.unlink()
+        sys.exit(f"Checksum mismatch for the downloaded archive (expected {checksum}, got {actual}).")
+    partial_path.replace(tarball_path)
+    checksum_path.write_text(actual + '\n')
+    logging.info("Download completed and verified.")
+    return tarball_path
+
 def unpack_signal_cli(version, tarball_path):
     install_dir = Path(f"/opt/signal-cli-{version}")
+    if (install_dir / 'bin' / 'signal-cli').exists():
+        logging.info(f"Signal CLI {version} is already unpacked in {install_dir}.")
+        return install_dir
+
+    # Unpack into a staging directory so a failed unpack never leaves a half-written install_dir
+    staging_dir = Path(f"/opt/.signal-cli-{version}.staging")
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    staging_dir.mkdir(parents=True)
     logging.info("Unpacking Signal CLI...")
     try:
-        subprocess.run(['tar', 'xf', str(tarball_path), '-C', '/opt'], check=True)
+        subprocess.run(['tar', 'xf', str(tarball_path), '-C', str(staging_dir)], check=True)
+        (staging_dir / f"signal-cli-{version}").rename(install_dir)
         logging.info(f"Signal CLI unpacked to {install_dir}.")
         return install_dir
-    except subprocess.CalledProcessError:
+    except (subprocess.CalledProcessError, OSError):
         sys.exit("Failed to unpack the Signal CLI archive.")
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def warm_up(install_dir, version):
+    # Starting the JVM once loads the new jars into the page cache and catches broken installs before the switch
+    logging.info("Warming up the new version...")
+    try:
+        result = subprocess.run([str(install_dir / 'bin' / 'signal-cli'), '--version'],
+                                check=True, capture_output=True, text=True, timeout=120)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        sys.exit(f"The new version failed to start: {e}")
+    if result.stdout.strip().split()[-1] != version:
+        sys.exit(f"The new version reports '{result.stdout.strip()}' instead of {version}.")
+    logging.info("Warm-up completed.")
+
+def get_current_install_dir():
+    for link in (CURRENT_LINK, BIN_SYMLINK):
+        if link.is_symlink():
+            target = link.resolve()
+            return target if link == CURRENT_LINK else target.parent.parent
+    return None
 
-def update_symbolic_link(install_dir):
-    bin_symlink = Path('/usr/local/bin/signal-cli')
-    logging.info("Updating symbolic link for signal-cli...")
-    if bin_symlink.exists() or bin_symlink.is_symlink():
-        bin_symlink.unlink()
-    bin_symlink.symlink_to(install_dir / 'bin' / 'signal-cli')
-    logging.info(f"Symbolic link updated to point to {install_dir / 'bin' / 'signal-cli'}.")
-
-def update_service_file(version):
-    service_file = Path('/etc/systemd/system/signal-cli.service')
-    if not service_file.exists():
+def replace_symlink(link, target):
+    temp_link = link.with_name(f".{link.name}.tmp")
+    if temp_link.is_symlink() or temp_link.exists():
+        temp_link.unlink()
+    temp_link.symlink_to(target)
+    # rename() replaces the old link atomically, so there is no moment without a valid link
+    os.replace(temp_link, link)
+
+def switch_version(install_dir):
+    logging.info(f"Switching {CURRENT_LINK} to {install_dir}...")
+    replace_symlink(CURRENT_LINK, install_dir)
+    replace_symlink(BIN_SYMLINK, CURRENT_LINK / 'bin' / 'signal-cli')
+
+def update_service_file():
+    if not SERVICE_FILE.exists():
         logging.warning("Signal CLI service file does not exist. Skipping service file update.")
-        return
+        return False
 
-    logging.info("Updating the system service file with the new version...")
     try:
-        with service_file.open('r') as file:
-            content = file.read()
-        # Update the directory path to the new version
-        content = re.sub(r'/opt/signal-cli-\d+\.\d+\.\d+', f'/opt/signal-cli-{version}', content)
-        with service_file.open('w') as file:
-            file.write(content)
+        content = SERVICE_FILE.read_text()
+        # Point the service at the stable symlink so future upgrades only swap the link
+        updated = re.sub(r'/opt/signal-cli-\d+\.\d+\.\d+', str(CURRENT_LINK), content)
+        if updated == content:
+            return False
+        logging.info(f"Updating the system service file to use {CURRENT_LINK}...")
+        temp_file = SERVICE_FILE.with_name(SERVICE_FILE.name + '.tmp')
+        temp_file.write_text(updated)
+        os.replace(temp_file, SERVICE_FILE)
         logging.info("Service file updated.")
+        return True
     except Exception as e:
         logging.error(f"Failed to update the service file: {e}")
         sys.exit("Exiting due to the above error.")
 
-def reload_and_restart_service():
-    logging.info("Reloading system daemon and restarting Signal CLI service...")
+def restart_service(daemon_reload=False):
+    logging.info("Restarting Signal CLI service...")
     try:
-        subprocess.run(['systemctl', 'daemon-reload'], check=True)
+        if daemon_reload:
+            subprocess.run(['systemctl', 'daemon-reload'], check=True)
         subprocess.run(['systemctl', 'restart', 'signal-cli.service'], check=True)
-        logging.info("Signal CLI service restarted successfully.")
+        return True
     except subprocess.CalledProcessError as e:
-        logging.error(f"Failed to reload or restart the service: {e}")
-        sys.exit("Exiting due to the above error.")
+        logging.error(f"Failed to restart the service: {e}")
+        return False
+
+def wait_until_ready(timeout=READY_TIMEOUT):
+    logging.info("Waiting for the daemon to answer on D-Bus...")
+    started = time.monotonic()
+    while time.monotonic() - started < timeout:
+        result = subprocess.run(
+            ['dbus-send', '--system', '--print-reply', '--reply-timeout=5000', '--dest=org.asamk.Signal',
+             '/org/asamk/Signal', 'org.asamk.Signal.version'],
+            capture_output=True, text=True
+        )
+        if result.returncode == 0:
+            logging.info(f"Daemon ready after {time.monotonic() - started:.1f}s.")
+            return True
+        time.sleep(1)
+    logging.error(f"Daemon did not become ready within {timeout}s.")
+    return False
+
+def rollback(previous_dir):
+    if previous_dir is None or not previous_dir.exists():
+        sys.exit("The new version did not become ready and there is no previous version to roll back to.")
+    logging.warning(f"Rolling back to {previous_dir}...")
+    switch_version(previous_dir)
+    if restart_service() and wait_until_ready():
+        sys.exit("Update failed, rolled back to the previous version.")
+    sys.exit("Update failed and the rollback did not become ready either. Check 'journalctl -xeu signal-cli.service'.")
 
 def verify_update(version):
     logging.info("Verifying the Signal CLI update...")
@@ -143,16 +246,21 @@ def main():
     logging.info("Signal CLI Update Script")
 
     installed_version = get_installed_version()
-    latest_version = get_latest_version()
+    latest_version, checksum = get_latest_release()
 
     if not prompt_for_update(installed_version, latest_version):
         sys.exit()
 
-    tarball_path = download_signal_cli(latest_version)
+    # Everything up to the switch happens while the current version keeps running
+    tarball_path = download_signal_cli(latest_version, checksum)
     install_dir = unpack_signal_cli(latest_version, tarball_path)
-    update_symbolic_link(install_dir)
-    update_service_file(latest_version)
-    reload_and_restart_service()
+    warm_up(install_dir, latest_version)
+
+    previous_dir = get_current_install_dir()
+    switch_version(install_dir)
+    service_changed = update_service_file()
+    if not (restart_service(daemon_reload=service_changed) and wait_until_ready()):
+        rollback(previous_dir)
     verify_update(latest_version)
     logging.info("Update process completed successfully.")
 
@@ -1,32 +1,221 @@
+import atexit
 import csv
+import os
+import time
 from pydbus import SystemBus  # type: ignore
 from gi.repository import GLib
 
+from attachment_cache import AttachmentCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from call_policy import CircuitBreaker, Deadline, is_daemon_error, load_timeouts
+from chunking import AdaptiveChunker, apply_in_chunks
+from message_stream import MessageStream
+from utils import encode_group_id
+
+BASE_OBJECT_PATH = '/org/asamk/Signal'
+GROUP_INTERFACE = 'org.asamk.Signal.Group'
+
+# Methods that change a group, reported to mutation listeners
+MUTATING_METHODS = {
+    'createGroup', 'addMembers', 'removeMembers', 'addAdmins', 'removeAdmins',
+    'quitGroup', 'Set', 'enableLink', 'disableLink', 'resetLink',
+}
+
+
+def account_object_path(registered_number):
+    return f'/org/asamk/Signal/{registered_number.replace("+", "_")}'
+
+
+def to_variant(value):
+    if isinstance(value, bool):
+        return GLib.Variant('b', value)
+    if isinstance(value, int):
+        return GLib.Variant('i', value)
+    if isinstance(value, (list, tuple)):
+        return GLib.Variant('as', list(value))
+    return GLib.Variant('s', value)
+
+
 class SignalDBus:
-    def __init__(self, registered_number):
+    def __init__(self, registered_number, timeouts=None, breaker=None, bus=None):
         self.registered_number = registered_number
-        self.bus = SystemBus()
+        self.bus = bus or SystemBus()
+        self.timeouts = timeouts or load_timeouts()
+        self.breaker = breaker or CircuitBreaker(probe=self._probe_daemon)
+        self.deadline = None
+        self._proxies = {}
+        self._group_paths = {}
+        self.chunkers = {'addMembers': AdaptiveChunker(), 'removeMembers': AdaptiveChunker()}
         self.signal_bus = self.bus.get('org.asamk.Signal')
-        self.signal_base_object = self.bus.get('org.asamk.Signal', object_path='/org/asamk/Signal')
+        self.signal_base_object = self._proxy(BASE_OBJECT_PATH)
         self.signal_object = None
+        self.account_path = None
+        self.attachment_cache = None
+        self.recorder = None
+        self._mutation_listeners = []
+        self._sent_listeners = []
+        self.audit_log = None
+        self.message_archive = None
+        if os.getenv('SIGNAL_AUDIT_LOG'):
+            self.enable_audit_log(os.getenv('SIGNAL_AUDIT_LOG'))
+        if os.getenv('SIGNAL_MESSAGE_ARCHIVE'):
+            self.enable_message_archive(os.getenv('SIGNAL_MESSAGE_ARCHIVE'))
         if registered_number:
             self.set_registered_number(registered_number)
 
     def set_registered_number(self, registered_number):
         self.registered_number = registered_number
-        object_path = f'/org/asamk/Signal/{registered_number.replace("+", "_")}'
+        object_path = account_object_path(registered_number)
+        self._group_paths = {}
         try:
-            self.signal_object = self.bus.get('org.asamk.Signal', object_path=object_path)
+            self.signal_object = self._proxy(object_path)
+            self.account_path = object_path
         except GLib.GError as e:
             if 'UnknownObject' in str(e):
                 print(f"Signal object not found for registered number: {registered_number}")
                 self.signal_object = None
+                self.account_path = None
             else:
                 raise
 
+    def set_deadline(self, seconds):
+        self.deadline = Deadline(seconds) if seconds else None
+        return self.deadline
+
+    def start_recording(self, trace_path):
+        # Imported here so the trace module is only loaded when recording
+        from dbus_trace import TraceRecorder
+        self.recorder = TraceRecorder(trace_path)
+        return self.recorder
+
+    def stop_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def add_mutation_listener(self, listener):
+        # Listeners are called as listener(object_path, method, args, result, error, latency)
+        # after every call of a method in MUTATING_METHODS, successful or not
+        self._mutation_listeners.append(listener)
+
+    def remove_mutation_listener(self, listener):
+        self._mutation_listeners.remove(listener)
+
+    def add_sent_listener(self, listener):
+        # Listeners are called as listener(record) after every message sent successfully,
+        # with the record in the format yielded by MessageStream and the type 'sent'
+        self._sent_listeners.append(listener)
+
+    def remove_sent_listener(self, listener):
+        self._sent_listeners.remove(listener)
+
+    def _notify_sent(self, timestamp, destination, group_id, message, attachments):
+        if not self._sent_listeners or timestamp is None:
+            return
+        record = {
+            'type': 'sent',
+            'timestamp': timestamp,
+            'sender': self.registered_number,
+            'destination': destination,
+            'group_id': encode_group_id(group_id) if group_id else None,
+            'message': message,
+            'attachments': list(attachments or []),
+        }
+        for listener in list(self._sent_listeners):
+            try:
+                listener(record)
+            except Exception as e:
+                print(f"Error in sent listener: {str(e)}")
+
+    def enable_audit_log(self, directory):
+        # Imported here so the writer thread only exists when auditing is enabled
+        from audit_log import AuditLog
+        self.audit_log = AuditLog(directory)
+        self.audit_log.attach(self)
+        atexit.register(self.audit_log.close)
+        return self.audit_log
+
+    def enable_message_archive(self, archive_path):
+        # Imported here so the archive database is only opened when archiving is enabled
+        from message_archive import MessageArchive
+        self.message_archive = MessageArchive(archive_path)
+        self.message_archive.attach(self)
+        atexit.register(self.message_archive.close)
+        return self.message_archive
+
+    def group_id_for_path(self, object_path):
+        for key, group_path in list(self._group_paths.items()):
+            if group_path == object_path:
+                return list(key)
+        return None
+
+    def _notify_mutation(self, object_path, method, args, result, error, latency):
+        for listener in list(self._mutation_listeners):
+            try:
+                listener(object_path, method, args, result, error, latency)
+            except Exception as e:
+                print(f"Error in mutation listener: {str(e)}")
+
+    def _proxy(self, object_path):
+        # Proxies are cached because every bus.get() costs an introspection round-trip
+        proxy = self._proxies.get(object_path)
+        if proxy is None:
+            proxy = self.bus.get('org.asamk.Signal', object_path, timeout=self.timeouts['default'])
+            self._proxies[object_path] = proxy
+        return proxy
+
+    def _probe_daemon(self):
+        self.signal_base_object.version(timeout=self.timeouts.get('version', self.timeouts['default']))
+
+    def _call(self, object_path, method, *args):
+        if self.deadline is not None:
+            self.deadline.check()
+        self.breaker.before_call()
+
+        timeout = self.timeouts.get(method, self.timeouts['default'])
+        if self.deadline is not None:
+            timeout = max(0.1, min(timeout, self.deadline.remaining()))
+        started = time.monotonic()
+        try:
+            result = self._invoke(object_path, method, args, timeout)
+        except Exception as e:
+            latency = time.monotonic() - started
+            if self.recorder is not None:
+                self.recorder.record(object_path, method, args, latency, error=e)
+            if method in MUTATING_METHODS and self._mutation_listeners:
+                self._notify_mutation(object_path, method, args, None, e, latency)
+            if is_daemon_error(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        latency = time.monotonic() - started
+        if self.recorder is not None:
+            self.recorder.record(object_path, method, args, latency, result=result)
+        if method in MUTATING_METHODS and self._mutation_listeners:
+            self._notify_mutation(object_path, method, args, result, None, latency)
+        self.breaker.record_success()
+        return result
+
+    def _mutate_members(self, object_path, method, recipients):
+        # Large member lists are split into adaptive chunks and failing chunks are bisected,
+        # so one bad number does not fail the whole batch
+        succeeded, failed = apply_in_chunks(
+            lambda chunk: self._call(object_path, method, chunk), list(recipients), self.chunkers[method]
+        )
+        for member, error in failed:
+            print(f"Error applying {method} for {member}: {error}")
+        return succeeded
+
+    def _invoke(self, object_path, method, args, timeout):
+        if method == 'Set':
+            # Properties.Set takes a variant, everything else is converted by pydbus
+            interface, property_name, value = args
+            args = (interface, property_name, to_variant(value))
+        return getattr(self._proxy(object_path), method)(*args, timeout=timeout)
+
     def link(self, new_device_name="cli"):
         try:
-            device_link_uri = self.signal_base_object.link(new_device_name)
+            device_link_uri = self._call(BASE_OBJECT_PATH, 'link', new_device_name)
             return device_link_uri
         except Exception as e:
             print(f"Error linking device: {str(e)}")
@@ -34,21 +223,21 @@ class SignalDBus:
 
     def register(self, number, voice_verification=False):
         try:
-            self.signal_base_object.register(number, voice_verification)
+            self._call(BASE_OBJECT_PATH, 'register', number, voice_verification)
         except Exception as e:
             print(f"Error registering account: {str(e)}")
             raise
 
     def register_with_captcha(self, number, voice_verification=False, captcha=""):
         try:
-            self.signal_base_object.registerWithCaptcha(number, voice_verification, captcha)
+            self._call(BASE_OBJECT_PATH, 'registerWithCaptcha', number, voice_verification, captcha)
         except Exception as e:
             print(f"Error registering account with captcha: {str(e)}")
             raise
 
     def is_registered(self, number):
         try:
-            result = self.signal_object.isRegistered(number)
+            result = self._call(self.account_path, 'isRegistered', number)
             if not result:
                 with open('env/unregistered_numbers.txt', 'a') as file:
                     file.write(number + '\n')
@@ -64,7 +253,7 @@ class SignalDBus:
         results = []
         for number in numbers:
             try:
-                result = self.signal_object.isRegistered(number)
+                result = self._call(self.account_path, 'isRegistered', number)
                 if not result:
                     with open('env/unregistered_numbers.txt', 'a') as file:
                         file.write(number + '\n')
@@ -79,6 +268,14 @@ class SignalDBus:
                     #raise e
         return results
 
+    def set_contact_name(self, number, name):
+        try:
+            self._call(self.account_path, 'setContactName', number, name)
+            return True
+        except Exception as e:
+            print(f"Error setting contact name for {number}: {str(e)}")
+            return False
+
     def create_group(self, group_name, members):
         registered_members = []
         unregistered_members = []
@@ -93,7 +290,7 @@ class SignalDBus:
 
             if registered_members:
                 try:
-                    group_id = self.signal_object.createGroup(group_name, registered_members, "")
+                    group_id = self._call(self.account_path, 'createGroup', group_name, registered_members, "")
                     print(f"Created group '{group_name}' with {len(registered_members)} members")
                     return group_id
                 except Exception as e:
@@ -103,7 +300,7 @@ class SignalDBus:
                 print(f"The following phone numbers are not registered with Signal: {', '.join(unregistered_members)}")
         else:
             try:
-                group_id = self.signal_object.createGroup(group_name, [], "")
+                group_id = self._call(self.account_path, 'createGroup', group_name, [], "")
                 print(f"Created group '{group_name}'")
                 return group_id
             except Exception as e:
@@ -123,42 +320,90 @@ class SignalDBus:
 
         if remove_members:
             if registered_members:
-                try:
-                    self.bus.get('org.asamk.Signal', object_path).removeMembers(registered_members)
-                    print(f"Removed {len(registered_members)} members from the group")
-                except Exception as e:
-                    print(f"Error removing members from the group: {str(e)}")
+                removed = self._mutate_members(object_path, 'removeMembers', registered_members)
+                print(f"Removed {len(removed)} members from the group")
         else:
             if registered_members:
-                try:
-                    self.bus.get('org.asamk.Signal', object_path).addMembers(registered_members)
-                    print(f"Added {len(registered_members)} members to the group")
-                except Exception as e:
-                    print(f"Error adding members to the group: {str(e)}")
+                added = self._mutate_members(object_path, 'addMembers', registered_members)
+                print(f"Added {len(added)} members to the group")
 
     def list_groups(self):
         try:
-            groups = self.signal_object.listGroups()
+            groups = self._call(self.account_path, 'listGroups')
             return [(group[1], group[2]) for group in groups]
         except Exception as e:
             print(f"Error listing groups: {str(e)}")
             return []
         
-    def remove_group(self, group_id):
-        object_path = self.get_group_object_path(group_id)
+    def remove_group(self, group_id, disable_link=False):
         try:
-            # Get the list of members in the group
-            members = self.get_group_property(group_id, 'Members')
+            object_path = self.get_group_object_path(group_id)
+            if disable_link:
+                # Stop new joins through the invite link while the members are removed
+                self._call(object_path, 'disableLink')
+
+            # Get the list of members in the group, we leave through quitGroup instead
+            members = [member for member in self._call(object_path, 'Get', GROUP_INTERFACE, 'Members')
+                       if member != self.registered_number]
 
             # Remove all members from the group
-            self.bus.get('org.asamk.Signal', object_path).removeMembers(members)
+            removed = self._mutate_members(object_path, 'removeMembers', members)
+            if len(removed) < len(members):
+                # Stay in the group so the remaining members can still be removed by a later run
+                print(f"Could not remove {len(members) - len(removed)} members, not quitting the group: {group_id}")
+                return False
 
             # Quit the group
-            self.bus.get('org.asamk.Signal', object_path).quitGroup()
+            self._call(object_path, 'quitGroup')
 
             print(f"Removed all members and quit the group: {group_id}")
+            return True
         except Exception as e:
             print(f"Error removing group: {str(e)}")
+            return False
+
+    def send_message(self, recipients, message, attachments=None):
+        try:
+            timestamp = self._call(self.account_path, 'sendMessage', message, self.resolve_attachments(attachments), recipients)
+            self._notify_sent(timestamp, ','.join(recipients), None, message, attachments)
+            return timestamp
+        except Exception as e:
+            print(f"Error sending message: {str(e)}")
+
+    def send_group_message(self, group_id, message, attachments=None):
+        try:
+            timestamp = self._call(self.account_path, 'sendGroupMessage', message, self.resolve_attachments(attachments), group_id)
+            self._notify_sent(timestamp, None, group_id, message, attachments)
+            return timestamp
+        except Exception as e:
+            print(f"Error sending group message: {str(e)}")
+
+    def send_group_messages(self, group_ids, message, attachments=None):
+        # Resolve the attachments once for the whole fan-out
+        cached_attachments = self.resolve_attachments(attachments)
+        timestamps = []
+        for group_id in group_ids:
+            try:
+                timestamp = self._call(self.account_path, 'sendGroupMessage', message, cached_attachments, group_id)
+                self._notify_sent(timestamp, None, group_id, message, attachments)
+                timestamps.append(timestamp)
+            except Exception as e:
+                print(f"Error sending group message: {str(e)}")
+                timestamps.append(None)
+        return timestamps
+
+    def resolve_attachments(self, attachments):
+        if not attachments:
+            return []
+        if self.attachment_cache is None:
+            self.attachment_cache = AttachmentCache(
+                os.getenv('SIGNAL_ATTACHMENT_CACHE', DEFAULT_CACHE_DIR),
+                int(os.getenv('SIGNAL_ATTACHMENT_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+            )
+        return self.attachment_cache.resolve(attachments)
+
+    def receive_messages(self, max_queue=1000, overflow='block', include_sync=True):
+        return MessageStream(self.signal_object, max_queue=max_queue, overflow=overflow, include_sync=include_sync)
 
     def get_group_id(self, group_name):
         groups = self.list_groups()
@@ -168,13 +413,17 @@ class SignalDBus:
         return None
 
     def get_group_object_path(self, group_id):
-        return self.signal_object.getGroup(group_id)
+        key = tuple(group_id)
+        object_path = self._group_paths.get(key)
+        if object_path is None:
+            object_path = self._call(self.account_path, 'getGroup', group_id)
+            self._group_paths[key] = object_path
+        return object_path
 
     def get_group_property(self, group_id, property_name):
         object_path = self.get_group_object_path(group_id)
         try:
-            group_proxy = self.bus.get('org.asamk.Signal', object_path)
-            return getattr(group_proxy, property_name)
+            return self._call(object_path, 'Get', GROUP_INTERFACE, property_name)
         except Exception as e:
             print(f"Error getting group property '{property_name}': {str(e)}")
             return None
@@ -182,72 +431,92 @@ class SignalDBus:
     def set_group_property(self, group_id, property_name, property_value):
         object_path = self.get_group_object_path(group_id)
         try:
-            group_proxy = self.bus.get('org.asamk.Signal', object_path)
-            setattr(group_proxy, property_name, property_value)
+            self._call(object_path, 'Set', GROUP_INTERFACE, property_name, property_value)
+            return True
         except Exception as e:
             print(f"Error setting group property '{property_name}': {str(e)}")
+            return False
+
+    def set_group_properties(self, group_id, properties):
+        object_path = self.get_group_object_path(group_id)
+        for property_name, property_value in properties.items():
+            try:
+                self._call(object_path, 'Set', GROUP_INTERFACE, property_name, property_value)
+            except Exception as e:
+                print(f"Error setting group property '{property_name}': {str(e)}")
 
     def get_all_group_properties(self, group_id):
         object_path = self.get_group_object_path(group_id)
         try:
-            return self.bus.get('org.asamk.Signal', object_path).GetAll('org.asamk.Signal.Group')
+            return self._call(object_path, 'GetAll', GROUP_INTERFACE)
         except Exception as e:
             print(f"Error getting all group properties: {str(e)}")
             return None
 
     def add_admins(self, group_id, recipients):
+        # Returns the recipients that were changed, like add_members and remove_members
         object_path = self.get_group_object_path(group_id)
         try:
-            self.bus.get('org.asamk.Signal', object_path).addAdmins(recipients)
+            self._call(object_path, 'addAdmins', recipients)
+            return list(recipients)
         except Exception as e:
             print(f"Error adding admins: {str(e)}")
+            return []
 
     def add_members(self, group_id, recipients):
         object_path = self.get_group_object_path(group_id)
-        try:
-            self.bus.get('org.asamk.Signal', object_path).addMembers(recipients)
-        except Exception as e:
-            print(f"Error adding members: {str(e)}")
+        return self._mutate_members(object_path, 'addMembers', recipients)
+
+    def get_requesting_members(self, group_id):
+        return self.get_group_property(group_id, 'RequestingMembers') or []
+
+    def approve_requesting_members(self, group_id, recipients):
+        # signal-cli approves a join request when the requesting member is added
+        return self.add_members(group_id, recipients)
+
+    def refuse_requesting_members(self, group_id, recipients):
+        # and refuses it when the requesting member is removed
+        return self.remove_members(group_id, recipients)
 
     def disable_link(self, group_id):
         object_path = self.get_group_object_path(group_id)
         try:
-            self.bus.get('org.asamk.Signal', object_path).disableLink()
+            self._call(object_path, 'disableLink')
         except Exception as e:
             print(f"Error disabling link: {str(e)}")
 
     def enable_link(self, group_id, requires_approval):
         object_path = self.get_group_object_path(group_id)
         try:
-            self.bus.get('org.asamk.Signal', object_path).enableLink(requires_approval)
+            self._call(object_path, 'enableLink', requires_approval)
         except Exception as e:
             print(f"Error enabling link: {str(e)}")
 
     def quit_group(self, group_id):
         object_path = self.get_group_object_path(group_id)
         try:
-            self.bus.get('org.asamk.Signal', object_path).quitGroup()
+            self._call(object_path, 'quitGroup')
         except Exception as e:
             print(f"Error quitting group: {str(e)}")
 
     def remove_admins(self, group_id, recipients):
+        # Returns the recipients that were changed, like add_members and remove_members
         object_path = self.get_group_object_path(group_id)
         try:
-            self.bus.get('org.asamk.Signal', object_path).removeAdmins(recipients)
+            self._call(object_path, 'removeAdmins', recipients)
+            return list(recipients)
         except Exception as e:
             print(f"Error removing admins: {str(e)}")
+            return []
 
     def remove_members(self, group_id, recipients):
         object_path = self.get_group_object_path(group_id)
-        try:
-            self.bus.get('org.asamk.Signal', object_path).removeMembers(recipients)
-        except Exception as e:
-            print(f"Error removing members: {str(e)}")
+        return self._mutate_members(object_path, 'removeMembers', recipients)
 
     def reset_link(self, group_id):
         object_path = self.get_group_object_path(group_id)
         try:
-            self.bus.get('org.asamk.Signal', object_path).resetLink()
+            self._call(object_path, 'resetLink')
         except Exception as e:
             print(f"Error resetting link: {str(e)}")
 
@@ -5,6 +5,8 @@ from dotenv import load_dotenv
 
 from signal_dbus import SignalDBus
 from signal_commands import SignalCommands
+from job_queue import JobQueue, PRIORITY_INTERACTIVE
+from group_picker import pick_group
 from utils import generate_qr_code
 
 load_dotenv()
@@ -45,14 +47,10 @@ def update_group(signal_manager):
     Returns:
         None
     """
-    groups = signal_manager.list_groups()
-    if not groups:
-        print("No groups found.")
+    selection = pick_group(signal_manager, "Select a group to update:")
+    if selection is None:
         return
-
-    group_choices = [f"{group_name}" for group_id, group_name in groups if group_name]
-    selected_group = inquirer.list_input("Select a group to update:", choices=group_choices)
-    group_id = [group_id for (group_id, group_name) in groups if group_name == selected_group][0]
+    group_id, selected_group = selection
 
     update_action = inquirer.list_input("Select an update action:", choices=['Add Members', 'Remove Members'])
     input_choice = inquirer.list_input("Select input method:", choices=['CSV File', 'Manual Input'])
@@ -64,7 +62,16 @@ def update_group(signal_manager):
         manual_input = inquirer.text("Enter phone numbers, separated by commas:")
         members = [member.strip() for member in manual_input.split(',')]
 
-    signal_manager.update_group(group_id, members, remove_members=(update_action == 'Remove Members'))
+    remove_members = update_action == 'Remove Members'
+    if isinstance(signal_manager, SignalDBus) and inquirer.confirm("Run in the background?", default=len(members) > 100):
+        job_queue = JobQueue()
+        job_id = job_queue.enqueue('update_group', {'group_id': group_id, 'members': members, 'remove_members': remove_members},
+                                   priority=PRIORITY_INTERACTIVE)
+        job_queue.close()
+        print(f"Queued job {job_id}. Check its progress with 'python3 job_queue.py status {job_id}'.")
+        return
+
+    signal_manager.update_group(group_id, members, remove_members=remove_members)
 
 def remove_group(signal_manager):
     """
@@ -76,14 +83,10 @@ def remove_group(signal_manager):
     Returns:
         None
     """
-    groups = signal_manager.list_groups()
-    if not groups:
-        print("No groups found.")
+    selection = pick_group(signal_manager, "Select a group to remove:")
+    if selection is None:
         return
-
-    group_choices = [f"{group_name}" for group_id, group_name in groups if group_name]
-    selected_group = inquirer.list_input("Select a group to remove:", choices=group_choices)
-    group_id = [group_id for (group_id, group_name) in groups if group_name == selected_group][0]
+    group_id, selected_group = selection
 
     confirm = inquirer.confirm(f"Are you sure you want to remove the group '{selected_group}'?")
     if confirm:
@@ -106,14 +109,10 @@ def get_group_id(signal_manager):
         None.
 
     """
-    groups = signal_manager.list_groups()
-    if not groups:
-        print("No groups found.")
+    selection = pick_group(signal_manager, "Select a group to get the ID:")
+    if selection is None:
         return
-
-    group_choices = [f"{group_name}" for group_id, group_name in groups if group_name]
-    selected_group = inquirer.list_input("Select a group to get the ID:", choices=group_choices)
-    group_id = [group_id for (group_id, group_name) in groups if group_name == selected_group][0]
+    group_id, selected_group = selection
 
     print(f"Group ID for '{selected_group}': {group_id}")
 
@@ -130,14 +129,10 @@ def get_group_property(signal_manager):
     Raises:
         None
     """
-    groups = signal_manager.list_groups()
-    if not groups:
-        print("No groups found.")
+    selection = pick_group(signal_manager, "Select a group to get property:")
+    if selection is None:
         return
-
-    group_choices = [f"{group_name}" for group_id, group_name in groups if group_name]
-    selected_group = inquirer.list_input("Select a group to get property:", choices=group_choices)
-    group_id = [group_id for (group_id, group_name) in groups if group_name == selected_group][0]
+    group_id, selected_group = selection
 
     property_name = inquirer.text("Enter the property name:")
 
@@ -155,14 +150,10 @@ def set_group_property(signal_manager):
     Returns:
         None
     """
-    groups = signal_manager.list_groups()
-    if not groups:
-        print("No groups found.")
+    selection = pick_group(signal_manager, "Select a group to set property:")
+    if selection is None:
         return
-
-    group_choices = [f"{group_name}" for group_id, group_name in groups if group_name]
-    selected_group = inquirer.list_input("Select a group to set property:", choices=group_choices)
-    group_id = [group_id for (group_id, group_name) in groups if group_name == selected_group][0]
+    group_id, selected_group = selection
 
     property_name = inquirer.text("Enter the property name:")
     property_value = inquirer.text("Enter the property value:")
@@ -0,0 +1,332 @@
+import csv
+import json
+import os
+import sqlite3
+
+DEFAULT_CURSOR_PATH = 'env/source_cursors.json'
+
+
+class CursorInvalid(ValueError):
+    """
+    Raised when a saved cursor no longer points into the change feed, for
+    example after the change log was rotated. The caller falls back to a
+    full sync.
+    """
+
+
+def membership_row(phone_number, name, groups, admin_groups):
+    # Rows in the members.csv format are what the sync engine consumes
+    return {
+        'Name': name or '',
+        'Phone Number': phone_number,
+        'Group Name': ';'.join(groups),
+        'Group Admin': ';'.join(admin_groups),
+    }
+
+
+def membership_change(op, phone_number, group_name, admin=False, name=''):
+    """
+    Build a change record of a change feed.
+
+    Args:
+        op (str): 'add' or 'remove'.
+        phone_number (str): The member's phone number.
+        group_name (str): The group name.
+        admin (bool): For 'add', also make the member an admin. For 'remove',
+            only take away the admin role.
+        name (str): The member's name.
+
+    Returns:
+        dict: The change.
+    """
+    if op not in ('add', 'remove'):
+        raise ValueError(f"Unknown change operation '{op}'")
+    return {'op': op, 'Phone Number': phone_number, 'Group Name': group_name, 'Admin': bool(admin), 'Name': name or ''}
+
+
+class JSONListReader:
+    """
+    Reads the items of a JSON list from a file one at a time, so a large
+    export is never held in memory as a whole. The list is either the whole
+    document or the value of key in a top-level object.
+    """
+
+    def __init__(self, json_file, key, chunk_size=64 * 1024):
+        self.json_file = json_file
+        self.key = key
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+
+    def _fill(self):
+        chunk = self.json_file.read(self.chunk_size)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return bool(chunk)
+
+    def _peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in ' \t\r\n':
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                raise ValueError("Unexpected end of the JSON document")
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"Expected '{char}' in the JSON document, found '{self.buffer[self.position]}'")
+        self.position += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # The value continues in the next chunk
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk as well
+            if end < len(self.buffer) or not self._fill():
+                self.position = end
+                return value
+
+    def __iter__(self):
+        if self._peek() == '{':
+            self._expect('{')
+            while True:
+                if self._peek() == '}':
+                    raise ValueError(f"The JSON document has no '{self.key}' list")
+                name = self._value()
+                self._expect(':')
+                if name == self.key:
+                    break
+                self._value()
+                if self._peek() == ',':
+                    self._expect(',')
+        self._expect('[')
+        if self._peek() == ']':
+            return
+        while True:
+            yield self._value()
+            if self._peek() == ']':
+                return
+            self._expect(',')
+
+
+class MembershipSource:
+    """
+    Base class of membership input adapters.
+
+    Every source yields a full snapshot in the members.csv row format from
+    rows(). Sources with supports_changes set also offer a change feed:
+    current_cursor() returns a cursor for the current end of the feed and
+    changes(cursor) returns the changes after cursor together with the
+    cursor to continue from.
+    """
+
+    kind = None
+    supports_changes = False
+
+    def __init__(self, path):
+        self.path = path
+
+    @property
+    def key(self):
+        return f"{self.kind}:{os.path.abspath(self.path)}"
+
+    def rows(self):
+        raise NotImplementedError
+
+    def size(self):
+        return os.path.getsize(self.path)
+
+    def current_cursor(self):
+        return None
+
+    def changes(self, cursor):
+        raise NotImplementedError(f"{self.kind} sources have no change feed")
+
+
+class CSVSource(MembershipSource):
+    """
+    The members.csv file with one row per person.
+    """
+
+    kind = 'csv'
+
+    def rows(self):
+        with open(self.path, 'r', encoding='UTF-8') as member_csv_file:
+            yield from csv.DictReader(member_csv_file)
+
+
+class JSONSource(MembershipSource):
+    """
+    A JSON directory export, either a list of people or an object with a
+    "members" list. Each person has "phone", "name", "groups" and
+    "admin_groups". The people are read one at a time, so the memory budget
+    of a sync applies to JSON exports as well.
+    """
+
+    kind = 'json'
+    chunk_size = 64 * 1024
+
+    def rows(self):
+        with open(self.path, 'r', encoding='UTF-8') as json_file:
+            for person in JSONListReader(json_file, 'members', self.chunk_size):
+                yield membership_row(person['phone'], person.get('name'), person.get('groups', []), person.get('admin_groups', []))
+
+
+class JSONLChangeLogSource(MembershipSource):
+    """
+    An append-only JSON lines change log.
+
+    Each line is {"op": "add"|"remove", "phone": ..., "group": ..., "admin": bool, "name": ...}.
+    The snapshot replays the whole log. The change feed cursor is the byte
+    offset after the last complete line read, together with the file's inode
+    so that a rotated log invalidates the cursor.
+    """
+
+    kind = 'jsonl'
+    supports_changes = True
+
+    def _read(self, offset=0):
+        changes = []
+        with open(self.path, 'rb') as log_file:
+            log_file.seek(offset)
+            for line in log_file:
+                if not line.endswith(b'\n'):
+                    # A line that is still being written is read on the next run
+                    break
+                offset += len(line)
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                changes.append(membership_change(entry['op'], entry['phone'], entry['group'], entry.get('admin', False), entry.get('name')))
+        return changes, offset
+
+    def rows(self):
+        members = {}
+        for change in self._read()[0]:
+            person = members.setdefault(change['Phone Number'], {'name': '', 'groups': {}, 'admin_groups': {}})
+            person['name'] = change['Name'] or person['name']
+            if change['op'] == 'add':
+                person['groups'][change['Group Name']] = True
+                if change['Admin']:
+                    person['admin_groups'][change['Group Name']] = True
+            else:
+                person['admin_groups'].pop(change['Group Name'], None)
+                if not change['Admin']:
+                    person['groups'].pop(change['Group Name'], None)
+        for phone_number, person in members.items():
+            if person['groups']:
+                yield membership_row(phone_number, person['name'], person['groups'], person['admin_groups'])
+
+    def current_cursor(self):
+        stat = os.stat(self.path)
+        # Only complete lines count, so the cursor never points into the middle of a line
+        return {'inode': stat.st_ino, 'offset': self._read()[1]}
+
+    def changes(self, cursor):
+        stat = os.stat(self.path)
+        if stat.st_ino != cursor['inode'] or stat.st_size < cursor['offset']:
+            raise CursorInvalid(f"The change log '{self.path}' was replaced")
+        changes, offset = self._read(cursor['offset'])
+        return changes, {'inode': stat.st_ino, 'offset': offset}
+
+
+class SQLiteSource(MembershipSource):
+    """
+    A SQLite directory export.
+
+    The "members" table has one row per membership with the columns phone,
+    name, group_name and admin. An optional "changes" table with the columns
+    id (INTEGER PRIMARY KEY), op, phone, group_name, admin and name provides
+    the change feed, the cursor is the last id read.
+    """
+
+    kind = 'sqlite'
+
+    def __init__(self, path):
+        super().__init__(path)
+        # Opened read-only so a sync never modifies the export
+        self.connection = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+        self.supports_changes = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'changes'"
+        ).fetchone() is not None
+
+    def rows(self):
+        cursor = self.connection.execute('SELECT phone, name, group_name, admin FROM members ORDER BY phone')
+        person = None
+        for phone_number, name, group_name, admin in cursor:
+            if person is None or person[0] != phone_number:
+                if person is not None:
+                    yield membership_row(*person)
+                person = (phone_number, name, [], [])
+            person[2].append(group_name)
+            if admin:
+                person[3].append(group_name)
+        if person is not None:
+            yield membership_row(*person)
+
+    def current_cursor(self):
+        return self.connection.execute('SELECT COALESCE(MAX(id), 0) FROM changes').fetchone()[0]
+
+    def changes(self, cursor):
+        rows = self.connection.execute(
+            'SELECT id, op, phone, group_name, admin, name FROM changes WHERE id > ? ORDER BY id', (cursor,)
+        ).fetchall()
+        changes = [membership_change(op, phone, group_name, admin, name) for _, op, phone, group_name, admin, name in rows]
+        return changes, rows[-1][0] if rows else cursor
+
+
+SOURCE_TYPES = {source_type.kind: source_type for source_type in (CSVSource, JSONSource, JSONLChangeLogSource, SQLiteSource)}
+
+
+def open_source(spec):
+    """
+    Open a membership source from a "kind:path" specification.
+
+    A path without a kind is opened by its file extension.
+
+    Args:
+        spec (str): For example "csv:env/members.csv" or "env/changes.jsonl".
+
+    Returns:
+        MembershipSource: The source.
+    """
+    kind, separator, path = spec.partition(':')
+    if not separator or kind not in SOURCE_TYPES:
+        path = spec
+        extension = os.path.splitext(spec)[1].lower()
+        kind = {'.csv': 'csv', '.json': 'json', '.jsonl': 'jsonl', '.sqlite': 'sqlite', '.sqlite3': 'sqlite', '.db': 'sqlite'}.get(extension)
+        if kind is None:
+            raise ValueError(f"Cannot tell the source type of '{spec}', use kind:path with one of {', '.join(SOURCE_TYPES)}")
+    return SOURCE_TYPES[kind](path)
+
+
+def load_cursors(cursor_file_path=DEFAULT_CURSOR_PATH):
+    if not os.path.exists(cursor_file_path):
+        return {}
+    with open(cursor_file_path, 'r', encoding='UTF-8') as cursor_file:
+        return json.load(cursor_file)
+
+
+def save_cursor(source, cursor, cursor_file_path=DEFAULT_CURSOR_PATH):
+    """
+    Atomically store the cursor of a source.
+
+    Args:
+        source (MembershipSource): The source.
+        cursor: The cursor to continue from on the next run.
+        cursor_file_path (str): Path to the JSON file with the cursors of all sources.
+    """
+    cursors = load_cursors(cursor_file_path)
+    cursors[source.key] = cursor
+    temp_path = cursor_file_path + '.tmp'
+    with open(temp_path, 'w', encoding='UTF-8') as cursor_file:
+        json.dump(cursors, cursor_file, indent=2)
+    os.replace(temp_path, cursor_file_path)
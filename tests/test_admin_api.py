@@ -0,0 +1,129 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+
+pytest.importorskip('dotenv')
+pytest.importorskip('gi')
+pytest.importorskip('pydbus')
+pytest.importorskip('qrcode')
+
+from admin_api import AdminAPI, HTTPError, TTLCache
+from utils import encode_group_id
+
+GROUP_ID = encode_group_id([1, 2, 3], urlsafe=True)
+TOKEN = 'secret'
+
+
+class FakeSignalDBus:
+    """
+    Stand-in for SignalDBus with one group, failing every change for the numbers in failing.
+    """
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+
+    def get_all_group_properties(self, group_id):
+        if group_id != [1, 2, 3]:
+            raise Exception("org.asamk.Signal.Error.Failure: Group not found")
+        return {'Name': 'Team Alpha', 'Members': ['+4915100000001'], 'Admins': [], 'PendingMembers': []}
+
+    def add_members(self, group_id, recipients):
+        return [recipient for recipient in recipients if recipient not in self.failing]
+
+
+def add_members(failing, members, token=TOKEN):
+    api = AdminAPI(FakeSignalDBus(failing), token=TOKEN)
+    return asyncio.run(api.dispatch('POST', f"/groups/{GROUP_ID}/members", {'members': members}, token))
+
+
+def test_change_members_reports_failed_members():
+    members = ['+4915100000001', '+4915100000002']
+    assert add_members((), members) == (HTTPStatus.OK, {'id': GROUP_ID, 'added': members, 'failed': []})
+
+    status, payload = add_members({'+4915100000002'}, members)
+    assert status == HTTPStatus.MULTI_STATUS
+    assert payload['added'] == ['+4915100000001'] and payload['failed'] == ['+4915100000002']
+
+    status, payload = add_members(set(members), members)
+    assert status == HTTPStatus.BAD_GATEWAY
+    assert payload['added'] == [] and payload['failed'] == members
+
+
+def test_change_members_needs_the_bearer_token():
+    for token in (None, 'wrong'):
+        with pytest.raises(HTTPError) as error:
+            add_members((), ['+4915100000001'], token)
+        assert error.value.status == HTTPStatus.UNAUTHORIZED
+
+    api = AdminAPI(FakeSignalDBus())
+    with pytest.raises(HTTPError) as error:
+        asyncio.run(api.dispatch('POST', f"/groups/{GROUP_ID}/members", {'members': []}, TOKEN))
+    assert error.value.status == HTTPStatus.FORBIDDEN
+
+
+def test_unknown_group_is_not_found():
+    api = AdminAPI(FakeSignalDBus())
+    assert asyncio.run(api.dispatch('GET', f"/groups/{GROUP_ID}/members", None))[0] == HTTPStatus.OK
+    with pytest.raises(HTTPError) as error:
+        asyncio.run(api.dispatch('GET', f"/groups/{encode_group_id([9], urlsafe=True)}/members", None))
+    assert error.value.status == HTTPStatus.NOT_FOUND
+
+
+class Loader:
+    """
+    Counts its loads, each of which waits until release is set.
+    """
+
+    def __init__(self):
+        self.loads = 0
+        self.release = None
+
+    async def __call__(self):
+        self.loads += 1
+        if self.release is not None:
+            await self.release.wait()
+        return self.loads
+
+
+def test_cache_expires_after_the_ttl():
+    async def run():
+        cache, loader = TTLCache(0.05), Loader()
+        assert await cache.get('groups', loader) == 1
+        assert await cache.get('groups', loader) == 1
+        await asyncio.sleep(0.1)
+        assert await cache.get('groups', loader) == 2
+        cache.invalidate('groups')
+        assert await cache.get('groups', loader) == 3
+
+    asyncio.run(run())
+
+
+def test_concurrent_requests_share_one_load():
+    async def run():
+        cache, loader = TTLCache(10), Loader()
+        loader.release = asyncio.Event()
+        requests = [asyncio.ensure_future(cache.get('groups', loader)) for _ in range(3)]
+        await asyncio.sleep(0)
+        loader.release.set()
+        assert await asyncio.gather(*requests) == [1, 1, 1]
+        assert loader.loads == 1
+
+    asyncio.run(run())
+
+
+def test_cancelled_request_does_not_cancel_the_others():
+    async def run():
+        cache, loader = TTLCache(10), Loader()
+        loader.release = asyncio.Event()
+        first = asyncio.ensure_future(cache.get('groups', loader))
+        second = asyncio.ensure_future(cache.get('groups', loader))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        loader.release.set()
+        assert await second == 1
+        assert first.cancelled()
+        assert loader.loads == 1
+
+    asyncio.run(run())
@@ -0,0 +1,28 @@
+import os
+
+from attachment_cache import AttachmentCache
+
+
+def test_cached_copy_keeps_the_file_name(tmp_path):
+    flyer = tmp_path / 'flyer.pdf'
+    flyer.write_bytes(b'%PDF flyer')
+    cache = AttachmentCache(str(tmp_path / 'cache'))
+
+    cached_path = cache.store(str(flyer))
+    assert os.path.basename(cached_path) == 'flyer.pdf'
+    assert os.path.basename(os.path.dirname(cached_path)) == cache.digest(str(flyer))
+    assert cache.resolve([str(flyer)]) == [cached_path]
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = AttachmentCache(str(tmp_path / 'cache'), max_bytes=15)
+    paths = []
+    for index in range(3):
+        path = tmp_path / f"file{index}.txt"
+        path.write_bytes(bytes([index]) * 6)
+        paths.append(cache.store(str(path)))
+        os.utime(paths[-1], (index, index))
+
+    assert not os.path.exists(paths[0])
+    assert not os.path.exists(os.path.dirname(paths[0]))
+    assert os.path.exists(paths[2])
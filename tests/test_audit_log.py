@@ -0,0 +1,107 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('qrcode')
+
+from audit_log import AuditLog
+
+GROUP_PATH = '/org/asamk/Signal/_4915100000001/Groups/AQID'
+
+
+def mutate(audit_log, number):
+    audit_log.on_mutation(GROUP_PATH, 'addMembers', ([number],), None, None, 0.01)
+
+
+def read_records(directory):
+    records = []
+    for name in sorted(os.listdir(directory)):
+        with gzip.open(os.path.join(directory, name), 'rt', encoding='utf-8') as audit_file:
+            records.extend(json.loads(line) for line in audit_file)
+    return records
+
+
+def hold_writer(audit_log):
+    """
+    Makes the writer wait in its first batch until the returned event is set, recording the batch sizes.
+    """
+    release = threading.Event()
+    batches = []
+    write_batch = audit_log._write_batch
+
+    def held_write_batch(batch):
+        if not batches:
+            release.wait(5)
+        batches.append(len(batch))
+        write_batch(batch)
+
+    audit_log._write_batch = held_write_batch
+    return release, batches
+
+
+def test_queued_calls_are_written_in_batches(tmp_path):
+    audit_log = AuditLog(str(tmp_path), actor='tester', batch_size=2)
+    release, batches = hold_writer(audit_log)
+    mutate(audit_log, '+4915100000000')
+    while audit_log._queue.qsize():
+        time.sleep(0.01)
+    for i in range(1, 6):
+        mutate(audit_log, f"+491510000000{i}")
+    release.set()
+    audit_log.close()
+
+    assert batches == [1, 2, 2, 1]
+    records = read_records(tmp_path)
+    assert [record['members'] for record in records] == [[f"+491510000000{i}"] for i in range(6)]
+    assert all(record['actor'] == 'tester' and record['group'] == GROUP_PATH for record in records)
+    assert audit_log.written == 6
+
+
+def test_new_file_is_started_at_max_bytes(tmp_path):
+    audit_log = AuditLog(str(tmp_path), max_bytes=1)
+    for i in range(3):
+        mutate(audit_log, f"+491510000000{i}")
+        while audit_log.written <= i:
+            time.sleep(0.01)
+    audit_log.close()
+    assert len(os.listdir(tmp_path)) == 3
+    assert sorted(record['members'][0] for record in read_records(tmp_path)) == [f"+491510000000{i}" for i in range(3)]
+
+
+def test_dropped_records_are_counted_in_the_log(tmp_path):
+    audit_log = AuditLog(str(tmp_path), max_queue=1, put_timeout=0.01)
+    release, _ = hold_writer(audit_log)
+    mutate(audit_log, '+4915100000000')
+    while audit_log._queue.qsize():
+        time.sleep(0.01)
+    for i in range(1, 4):
+        mutate(audit_log, f"+491510000000{i}")
+    release.set()
+    audit_log.close()
+
+    assert audit_log.dropped == 2
+    records = read_records(tmp_path)
+    # The count is written with the next batch after the drops
+    assert [record['operation'] for record in records] == ['dropped', 'addMembers', 'addMembers']
+    assert records[0]['count'] == 2
+
+
+def test_queued_records_are_written_when_the_program_ends_without_close(tmp_path):
+    script = (
+        "import sys\n"
+        "from audit_log import AuditLog\n"
+        "audit_log = AuditLog(sys.argv[1])\n"
+        "for i in range(100):\n"
+        "    audit_log.on_mutation('/group', 'removeMembers', (['+4915100000001'],), None, None, 0.01)\n"
+        "raise SystemExit(1)\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.getenv('PYTHONPATH')])))
+    assert subprocess.run([sys.executable, '-c', script, str(tmp_path)], env=env, timeout=30).returncode == 1
+    assert len(read_records(tmp_path)) == 100
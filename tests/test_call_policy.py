@@ -0,0 +1,101 @@
+import pytest
+
+import call_policy
+from call_policy import CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded, is_daemon_error
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(call_policy, 'time', clock)
+    return clock
+
+
+class Probe:
+    def __init__(self, ok=True):
+        self.ok = ok
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if not self.ok:
+            raise Exception('org.freedesktop.DBus.Error.NoReply')
+
+
+def test_breaker_opens_after_the_threshold_and_probes_after_the_reset_timeout(clock):
+    probe = Probe()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, probe=probe)
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.before_call()
+    assert not breaker.is_open
+
+    breaker.record_failure()
+    assert breaker.is_open
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert probe.calls == 0
+
+    clock.now += 1
+    breaker.before_call()
+    assert probe.calls == 1
+    assert not breaker.is_open
+    assert breaker.failures == 0
+
+
+def test_failed_probe_keeps_the_breaker_open(clock):
+    probe = Probe(ok=False)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, probe=probe)
+    breaker.record_failure()
+    clock.now += 30
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert probe.calls == 1
+
+    # The next probe waits for another reset_timeout
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert probe.calls == 1
+    probe.ok = True
+    clock.now += 1
+    breaker.before_call()
+    assert not breaker.is_open
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open
+
+
+def test_only_daemon_errors_count():
+    assert is_daemon_error(Exception('org.freedesktop.DBus.Error.NoReply: Did not receive a reply'))
+    assert is_daemon_error(Exception('org.freedesktop.DBus.Error.ServiceUnknown: The name is not activatable'))
+    assert not is_daemon_error(Exception('org.asamk.Signal.Error.InvalidNumber: Invalid number'))
+
+
+def test_deadline_expires_and_can_be_cancelled(clock):
+    deadline = Deadline(10)
+    clock.now += 9
+    deadline.check()
+    assert deadline.remaining() == 1
+    clock.now += 1
+    with pytest.raises(DeadlineExceeded, match='exceeded'):
+        deadline.check()
+
+    deadline = Deadline(10)
+    deadline.cancel()
+    with pytest.raises(DeadlineExceeded, match='cancelled'):
+        deadline.check()
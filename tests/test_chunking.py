@@ -0,0 +1,60 @@
+import pytest
+
+from call_policy import CallAborted
+from chunking import AdaptiveChunker, apply_in_chunks
+
+
+class FlakyCall:
+    """
+    Batch call that fails whenever a chunk contains one of the bad items.
+    """
+
+    def __init__(self, bad=(), flaky=()):
+        self.bad = set(bad)
+        self.flaky = set(flaky)
+        self.chunks = []
+
+    def __call__(self, chunk):
+        self.chunks.append(list(chunk))
+        if self.bad & set(chunk):
+            raise RuntimeError('rejected')
+        if self.flaky & set(chunk):
+            # Fails once, then goes through
+            self.flaky -= set(chunk)
+            raise RuntimeError('timeout')
+
+
+def test_failing_item_is_isolated_by_bisection():
+    items = [f"+49151000000{i:02d}" for i in range(8)]
+    call = FlakyCall(bad={items[5]})
+    succeeded, failed = apply_in_chunks(call, items, AdaptiveChunker(initial=8))
+    assert sorted(succeeded) == sorted(items[:5] + items[6:])
+    assert failed == [(items[5], 'rejected')]
+    # 8 -> 4 -> 2 -> 1, plus one retry of the single bad item
+    assert call.chunks[:3] == [items, items[:4], items[4:]]
+    assert call.chunks.count([items[5]]) == 2
+
+
+def test_single_item_is_retried_before_it_fails():
+    call = FlakyCall(flaky={'+4915100000001'})
+    succeeded, failed = apply_in_chunks(call, ['+4915100000001'], AdaptiveChunker(), retries=1)
+    assert succeeded == ['+4915100000001']
+    assert failed == []
+
+
+def test_aborted_run_is_not_bisected():
+    def call(chunk):
+        raise CallAborted('deadline')
+
+    with pytest.raises(CallAborted):
+        apply_in_chunks(call, ['+4915100000001', '+4915100000002'], AdaptiveChunker())
+
+
+def test_chunker_halves_on_errors_and_grows_on_fast_calls():
+    chunker = AdaptiveChunker(initial=40, target_latency=1.0)
+    chunker.record(40, 0.1, ok=False)
+    assert chunker.size == 20
+    chunker.record(20, 0.1, ok=True)
+    assert chunker.size == 25
+    chunker.record(25, 2.5, ok=True)
+    assert chunker.size == 10
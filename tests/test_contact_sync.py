@@ -0,0 +1,64 @@
+import csv
+
+import pytest
+
+from contact_sync import load_state, name_hash, sync_contact_names
+
+NUMBERS = [f"+49151000000{i:02d}" for i in range(20)]
+
+
+class FakeSignalDBus:
+    """
+    Sets contact names, refusing the numbers in failing and raising interrupt on the given call.
+    """
+
+    def __init__(self, failing=(), interrupt_at=None):
+        self.failing = set(failing)
+        self.interrupt_at = interrupt_at
+        self.calls = 0
+        self.names = {}
+
+    def set_contact_name(self, phone_number, name):
+        self.calls += 1
+        if self.calls == self.interrupt_at:
+            raise KeyboardInterrupt
+        if phone_number in self.failing:
+            return False
+        self.names[phone_number] = name
+        return True
+
+
+@pytest.fixture
+def member_csv(tmp_path):
+    path = tmp_path / 'members.csv'
+    with open(path, 'w', encoding='UTF-8', newline='') as member_csv_file:
+        writer = csv.writer(member_csv_file)
+        writer.writerow(['Name', 'Phone Number', 'Group Name', 'Group Admin'])
+        for number in NUMBERS:
+            writer.writerow([f"Member {number[-2:]}", number, 'Team Alpha', ''])
+    return str(path)
+
+
+def test_state_only_covers_names_that_were_set(tmp_path, member_csv):
+    state_path = str(tmp_path / 'contact_names.json')
+    signal_dbus = FakeSignalDBus(failing={NUMBERS[1]})
+    assert sync_contact_names(signal_dbus, member_csv, state_path, max_workers=2) == 19
+    state = load_state(state_path)
+    assert set(state) == set(NUMBERS) - {NUMBERS[1]}
+    assert state[NUMBERS[0]] == name_hash('Member 00')
+
+    # Only the refused name is pushed again
+    signal_dbus = FakeSignalDBus()
+    assert sync_contact_names(signal_dbus, member_csv, state_path, max_workers=2) == 1
+    assert list(signal_dbus.names) == [NUMBERS[1]]
+
+
+def test_interrupted_run_saves_progress_and_stops_sending(tmp_path, member_csv):
+    state_path = str(tmp_path / 'contact_names.json')
+    signal_dbus = FakeSignalDBus(interrupt_at=5)
+    with pytest.raises(KeyboardInterrupt):
+        sync_contact_names(signal_dbus, member_csv, state_path, max_workers=1)
+    # Only the calls already submitted ran, not the whole backlog
+    assert signal_dbus.calls <= 6
+    state = load_state(state_path)
+    assert set(NUMBERS[:4]) <= set(state) <= set(signal_dbus.names)
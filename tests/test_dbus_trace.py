@@ -0,0 +1,122 @@
+import csv
+
+import pytest
+
+pytest.importorskip('dotenv')
+pytest.importorskip('gi')
+pytest.importorskip('pydbus')
+pytest.importorskip('qrcode')
+
+from dbus_trace import ReplayBus, ReplayError, TraceReplayer, env_numbers, read_trace
+from group_sync import sync_group_members_from_csv
+from signal_dbus import SignalDBus
+
+REGISTERED_NUMBER = '+4915100000001'
+GROUP_PATH = '/org/asamk/Signal/_4915100000001/Groups/AQID'
+
+
+class FakeProxy:
+    def __init__(self, daemon, object_path):
+        self._daemon = daemon
+        self._object_path = object_path
+
+    def __getattr__(self, method):
+        def call(*args, timeout=None):
+            return getattr(self._daemon, method)(*args)
+        return call
+
+
+class FakeDaemon:
+    """
+    Bus with one group, standing in for the signal-cli daemon.
+    """
+
+    def __init__(self, members):
+        self.members = list(members)
+
+    def get(self, bus_name, object_path=None, timeout=None):
+        return FakeProxy(self, object_path)
+
+    def isRegistered(self, number):
+        return number != '+4915100000009'
+
+    def getGroup(self, group_id):
+        return GROUP_PATH
+
+    def Get(self, interface, property_name):
+        return list(self.members)
+
+    def addMembers(self, members):
+        self.members.extend(members)
+
+    def removeMembers(self, members):
+        self.members = [member for member in self.members if member not in members]
+
+
+def write_env(directory):
+    directory.mkdir()
+    with open(directory / 'groups_created.csv', 'w', encoding='UTF-8', newline='') as groups_created_file:
+        writer = csv.writer(groups_created_file)
+        writer.writerow(['Group Name', 'Group ID'])
+        writer.writerow(['Team Alpha', '[1, 2, 3]'])
+    with open(directory / 'members.csv', 'w', encoding='UTF-8', newline='') as member_csv_file:
+        writer = csv.writer(member_csv_file)
+        writer.writerow(['Name', 'Phone Number', 'Group Name', 'Group Admin'])
+        for number in ('+4915100000002', '+4915100000003', '+4915100000009'):
+            writer.writerow(['', number, 'Team Alpha', ''])
+
+
+def calls(trace_path):
+    return [(record['p'], record['m'], record['a']) for record in read_trace(trace_path)[1]]
+
+
+def test_replay_reproduces_recorded_calls(tmp_path, monkeypatch):
+    monkeypatch.setenv('SIGNAL_TRACE_KEY', 'test-key')
+    monkeypatch.chdir(tmp_path)
+    write_env(tmp_path / 'env')
+
+    # The group has a member missing from members.csv, who only appears as a pseudonym on replay
+    signal_dbus = SignalDBus(REGISTERED_NUMBER, bus=FakeDaemon(['+4915100000002', '+4915100000007']))
+    signal_dbus.start_recording(str(tmp_path / 'recorded.jsonl.gz'))
+    sync_group_members_from_csv(signal_dbus, 'env/members.csv', 'env/groups_created.csv')
+    signal_dbus.stop_recording()
+
+    replayer = TraceReplayer(str(tmp_path / 'recorded.jsonl.gz'), speed=0,
+                             numbers=env_numbers('env') | {REGISTERED_NUMBER})
+    replayed = []
+    answer = replayer.answer
+
+    def record_answer(object_path, method, args):
+        replayed.append((replayer.anonymizer.value(object_path), method, replayer.anonymizer.value(list(args))))
+        return answer(object_path, method, args)
+
+    replayer.answer = record_answer
+    replay_dbus = SignalDBus(REGISTERED_NUMBER, bus=ReplayBus(replayer))
+    sync_group_members_from_csv(replay_dbus, 'env/members.csv', 'env/groups_created.csv')
+
+    recorded = calls(tmp_path / 'recorded.jsonl.gz')
+    assert [method for _, method, _ in recorded] == [
+        'isRegistered', 'isRegistered', 'isRegistered', 'getGroup', 'Get', 'removeMembers', 'addMembers'
+    ]
+    assert replayed == recorded
+    assert replayer.unmatched == 0
+
+
+def test_replay_requires_recording_key(tmp_path, monkeypatch):
+    monkeypatch.delenv('SIGNAL_TRACE_KEY', raising=False)
+    monkeypatch.chdir(tmp_path)
+    write_env(tmp_path / 'env')
+    signal_dbus = SignalDBus(REGISTERED_NUMBER, bus=FakeDaemon([]))
+    signal_dbus.start_recording(str(tmp_path / 'unkeyed.jsonl.gz'))
+    signal_dbus.is_registered('+4915100000002')
+    signal_dbus.stop_recording()
+    with pytest.raises(ReplayError):
+        TraceReplayer(str(tmp_path / 'unkeyed.jsonl.gz'), speed=0)
+
+    monkeypatch.setenv('SIGNAL_TRACE_KEY', 'test-key')
+    signal_dbus.start_recording(str(tmp_path / 'keyed.jsonl.gz'))
+    signal_dbus.is_registered('+4915100000002')
+    signal_dbus.stop_recording()
+    monkeypatch.setenv('SIGNAL_TRACE_KEY', 'other-key')
+    with pytest.raises(ReplayError):
+        TraceReplayer(str(tmp_path / 'keyed.jsonl.gz'), speed=0)
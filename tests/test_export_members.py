@@ -0,0 +1,58 @@
+import csv
+import io
+
+import pytest
+
+pytest.importorskip('dotenv')
+pytest.importorskip('gi')
+pytest.importorskip('pydbus')
+pytest.importorskip('qrcode')
+
+from export_members import export_memberships
+
+ALICE = '+4915100000001'
+BOB = '+4915100000002'
+
+
+class FakeSignalDBus:
+    """
+    In-memory stand-in for SignalDBus with groups keyed by their names.
+    """
+
+    def __init__(self, groups):
+        self.groups = groups
+
+    def list_groups(self):
+        return [([index], name) for index, name in enumerate(self.groups)]
+
+    def get_all_group_properties(self, group_id):
+        return self.groups[list(self.groups)[group_id[0]]]
+
+
+@pytest.fixture
+def signal_dbus():
+    return FakeSignalDBus({
+        'Team Beta': {'Members': [ALICE], 'Admins': [], 'PendingMembers': [BOB]},
+        'Team Alpha': {'Members': [BOB, ALICE], 'Admins': [ALICE], 'PendingMembers': []},
+    })
+
+
+def read_rows(output):
+    return list(csv.DictReader(io.StringIO(output.getvalue())))
+
+
+def test_export_writes_one_row_per_person(signal_dbus):
+    output = io.StringIO()
+    assert export_memberships(signal_dbus, output, max_workers=2, include_pending=True) == 2
+    assert read_rows(output) == [
+        {'Name': '', 'Phone Number': ALICE, 'Group Name': 'Team Alpha;Team Beta', 'Group Admin': 'Team Alpha', 'Pending Group': ''},
+        {'Name': '', 'Phone Number': BOB, 'Group Name': 'Team Alpha', 'Group Admin': '', 'Pending Group': 'Team Beta'},
+    ]
+
+
+def test_long_export_writes_one_row_per_membership(signal_dbus):
+    output = io.StringIO()
+    assert export_memberships(signal_dbus, output, long_format=True) == 3
+    assert [(row['Phone Number'], row['Group Name']) for row in read_rows(output)] == [
+        (ALICE, 'Team Beta'), (BOB, 'Team Alpha'), (ALICE, 'Team Alpha'),
+    ]
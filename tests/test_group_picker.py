@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip('inquirer')
+pytest.importorskip('qrcode')
+
+from group_picker import GroupIndex
+
+GROUPS = [
+    ('AAAA', 'Alpha Squad'),
+    ('BBBB', 'Bravo Team'),
+    ('CCCC', 'Charlie Support'),
+]
+
+
+def names(matches):
+    return [group_name for _, group_name, _ in matches]
+
+
+def test_search_finds_misspelled_names():
+    index = GroupIndex(GROUPS)
+    assert names(index.search('alpah')) == ['Alpha Squad']
+    assert names(index.search('suport')) == ['Charlie Support']
+
+
+def test_refined_query_keeps_fuzzy_matches():
+    index = GroupIndex(GROUPS)
+    for query in ('al', 'alp', 'alpa', 'alpah'):
+        assert names(index.search(query)) == ['Alpha Squad']
+    # A fresh index gives the same ranking as the refined one
+    assert index.search('alpah squad') == GroupIndex(GROUPS).search('alpah squad')
+
+
+def test_refined_query_drops_groups_that_no_longer_match():
+    index = GroupIndex(GROUPS)
+    assert set(names(index.search('a'))) == {'Alpha Squad', 'Bravo Team', 'Charlie Support'}
+    assert names(index.search('al')) == ['Alpha Squad']
+    assert names(index.search('alpha')) == ['Alpha Squad']
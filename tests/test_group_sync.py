@@ -0,0 +1,258 @@
+import csv
+import json
+import time
+
+import pytest
+
+pytest.importorskip('dotenv')
+pytest.importorskip('gi')
+pytest.importorskip('pydbus')
+pytest.importorskip('qrcode')
+
+import group_sync
+from group_sync import (
+    RegistrationCache, apply_membership_changes, approve_join_requests, group_property_changes, sync_from_source,
+    sync_snapshot,
+)
+from sources import JSONLChangeLogSource, load_cursors, membership_change
+
+GROUP_ID = '[1, 2, 3]'
+
+
+class FakeSignalDBus:
+    """
+    In-memory stand-in for SignalDBus with one group, failing every change for the numbers in failing.
+    """
+
+    def __init__(self, members=(), failing=()):
+        self.members = set(members)
+        self.admins = set()
+        self.failing = set(failing)
+
+    def is_registered(self, number):
+        return True
+
+    def get_group_property(self, group_id, property_name):
+        return sorted(self.members) if property_name == 'Members' else sorted(self.admins)
+
+    def _apply(self, recipients, target, add):
+        succeeded = [recipient for recipient in recipients if recipient not in self.failing]
+        if add:
+            target.update(succeeded)
+        else:
+            target.difference_update(succeeded)
+        return succeeded
+
+    def add_members(self, group_id, recipients):
+        return self._apply(recipients, self.members, True)
+
+    def remove_members(self, group_id, recipients):
+        return self._apply(recipients, self.members, False)
+
+    def add_admins(self, group_id, recipients):
+        return self._apply(recipients, self.admins, True)
+
+    def remove_admins(self, group_id, recipients):
+        return self._apply(recipients, self.admins, False)
+
+
+@pytest.fixture
+def env(tmp_path):
+    groups_created_file_path = tmp_path / 'groups_created.csv'
+    with open(groups_created_file_path, 'w', encoding='UTF-8', newline='') as groups_created_file:
+        writer = csv.writer(groups_created_file)
+        writer.writerow(['Group Name', 'Group ID'])
+        writer.writerow(['Team Alpha', GROUP_ID])
+    return tmp_path
+
+
+def append_changes(log_path, *changes):
+    with open(log_path, 'a', encoding='UTF-8') as log_file:
+        for op, phone in changes:
+            log_file.write(json.dumps({'op': op, 'phone': phone, 'group': 'Team Alpha'}) + '\n')
+
+
+def test_change_feed_cursor_only_moves_past_applied_changes(env):
+    log_path = env / 'changes.jsonl'
+    cursor_path = str(env / 'cursors.json')
+    groups_created = str(env / 'groups_created.csv')
+    append_changes(log_path, ('add', '+4915100000001'))
+    source = JSONLChangeLogSource(str(log_path))
+    signal_dbus = FakeSignalDBus()
+
+    sync_from_source(signal_dbus, source, groups_created, cursor_file_path=cursor_path)
+    first_cursor = load_cursors(cursor_path)[source.key]
+    assert signal_dbus.members == {'+4915100000001'}
+
+    append_changes(log_path, ('add', '+4915100000002'), ('add', '+4915100000003'))
+    signal_dbus.failing = {'+4915100000003'}
+    sync_from_source(signal_dbus, source, groups_created, cursor_file_path=cursor_path)
+    assert load_cursors(cursor_path)[source.key] == first_cursor
+
+    # Once the daemon accepts the change, the same changes are read again and the cursor moves on
+    signal_dbus.failing = set()
+    sync_from_source(signal_dbus, source, groups_created, cursor_file_path=cursor_path)
+    assert signal_dbus.members == {'+4915100000001', '+4915100000002', '+4915100000003'}
+    assert load_cursors(cursor_path)[source.key] == source.current_cursor()
+
+
+def test_failed_snapshot_sync_does_not_save_cursor(env):
+    log_path = env / 'changes.jsonl'
+    cursor_path = str(env / 'cursors.json')
+    append_changes(log_path, ('add', '+4915100000001'), ('add', '+4915100000002'))
+    source = JSONLChangeLogSource(str(log_path))
+
+    signal_dbus = FakeSignalDBus(failing={'+4915100000002'})
+    sync_from_source(signal_dbus, source, str(env / 'groups_created.csv'), cursor_file_path=cursor_path)
+    assert source.key not in load_cursors(cursor_path)
+
+
+def test_group_property_changes_use_dbus_property_names():
+    row = {
+        'Group Name': 'Team Alpha',
+        'Group Description': 'Weekly planning',
+        'PermissionAddMembers': 'ONLY_ADMINS',
+        'PermissionEditDetails': 'ONLY_ADMINS',
+        'PermissionSendMessages': 'EVERY_MEMBER',
+    }
+    current = {
+        'Name': 'Team Alpha',
+        'Description': 'Weekly planning',
+        'PermissionAddMember': 'ONLY_ADMINS',
+        'PermissionEditDetails': 'ONLY_ADMINS',
+        'PermissionSendMessage': 'EVERY_MEMBER',
+    }
+    assert group_property_changes(row, current) == {}
+
+    current['PermissionSendMessage'] = 'ONLY_ADMINS'
+    assert group_property_changes(row, current) == {'PermissionSendMessage': 'EVERY_MEMBER'}
+
+    # Empty permission cells leave the current setting alone
+    assert group_property_changes(dict(row, PermissionSendMessages=''), current) == {}
+
+
+def test_registration_cache_forgets_unregistered_numbers():
+    registration_cache = RegistrationCache(negative_ttl=0.05)
+    registration_cache['+4915100000001'] = True
+    registration_cache['+4915100000002'] = False
+    assert '+4915100000002' in registration_cache
+    time.sleep(0.1)
+    assert '+4915100000001' in registration_cache
+    assert '+4915100000002' not in registration_cache
+
+
+def test_membership_changes_fold_to_the_last_change(env):
+    signal_dbus = FakeSignalDBus(members={'+4915100000002', '+4915100000003'})
+    signal_dbus.admins = {'+4915100000003'}
+    changes = [
+        # Added and removed again, which folds into a single removal
+        membership_change('add', '+4915100000001', 'Team Alpha'),
+        membership_change('remove', '+4915100000001', 'Team Alpha'),
+        # Removed and added back
+        membership_change('remove', '+4915100000002', 'Team Alpha'),
+        membership_change('add', '+4915100000002', 'Team Alpha', admin=True),
+        # Only the admin role is taken away
+        membership_change('remove', '+4915100000003', 'Team Alpha', admin=True),
+        membership_change('add', '+4915100000004', 'Unknown Group'),
+    ]
+    applied, failed = apply_membership_changes(signal_dbus, changes, str(env / 'groups_created.csv'))
+    assert signal_dbus.members == {'+4915100000002', '+4915100000003'}
+    assert signal_dbus.admins == {'+4915100000002'}
+    assert (applied, failed) == (4, 0)
+
+
+class JoinRequestSignalDBus:
+    """
+    Stand-in for SignalDBus that records the handling of join requests per group.
+    """
+
+    def __init__(self, requesting):
+        self.requesting = requesting
+        self.calls = []
+
+    def get_requesting_members(self, group_id):
+        return list(self.requesting.get(str(group_id), []))
+
+    def approve_requesting_members(self, group_id, recipients):
+        self.calls.append(('approve', str(group_id), list(recipients)))
+        return list(recipients)
+
+    def refuse_requesting_members(self, group_id, recipients):
+        self.calls.append(('refuse', str(group_id), list(recipients)))
+        return list(recipients)
+
+
+@pytest.fixture
+def join_env(env):
+    with open(env / 'groups_created.csv', 'a', encoding='UTF-8', newline='') as groups_created_file:
+        csv.writer(groups_created_file).writerow(['Team Beta', '[4, 5, 6]'])
+    with open(env / 'members.csv', 'w', encoding='UTF-8', newline='') as member_csv_file:
+        writer = csv.writer(member_csv_file)
+        writer.writerow(['Name', 'Phone Number', 'Group Name', 'Group Admin'])
+        writer.writerow(['Listed', '+4915100000001', 'Team Alpha;Team Beta', ''])
+    return env
+
+
+def handle_join_requests(join_env, reject_unknown):
+    signal_dbus = JoinRequestSignalDBus({GROUP_ID: ['+4915100000001', '+4915100000002']})
+    result = approve_join_requests(signal_dbus, str(join_env / 'members.csv'), str(join_env / 'groups_created.csv'),
+                                   reject_unknown=reject_unknown)
+    return result, signal_dbus.calls
+
+
+def test_join_requests_of_listed_numbers_are_approved(join_env):
+    # The unlisted number is left alone and Team Beta without requests gets no calls
+    assert handle_join_requests(join_env, reject_unknown=False) == (
+        (1, 0), [('approve', GROUP_ID, ['+4915100000001'])]
+    )
+
+
+def test_join_requests_of_unlisted_numbers_are_refused_on_request(join_env):
+    assert handle_join_requests(join_env, reject_unknown=True) == (
+        (1, 1), [('approve', GROUP_ID, ['+4915100000001']), ('refuse', GROUP_ID, ['+4915100000002'])]
+    )
+
+
+class SnapshotSignalDBus:
+    """
+    Stand-in for SignalDBus with fixed current members per group.
+    """
+
+    def __init__(self, members):
+        self.members = members
+
+    def is_registered(self, number):
+        return number != '+4915100000009'
+
+    def get_group_property(self, group_id, property_name):
+        return list(self.members.get(str(group_id), []))
+
+
+def test_partitioned_snapshot_sync_computes_the_same_deltas(env, monkeypatch):
+    with open(env / 'groups_created.csv', 'a', encoding='UTF-8', newline='') as groups_created_file:
+        writer = csv.writer(groups_created_file)
+        writer.writerow(['Team Beta', '[4, 5, 6]'])
+        writer.writerow(['Team Gamma', '[7, 8, 9]'])
+        writer.writerow(['Admins Only', '[10, 11]'])
+    rows = [
+        {'Phone Number': '+4915100000001', 'Group Name': 'Team Alpha;Team Beta', 'Group Admin': 'Team Alpha'},
+        {'Phone Number': '+4915100000002', 'Group Name': 'Team Beta; Team Gamma', 'Group Admin': 'Admins Only'},
+        {'Phone Number': '+4915100000003', 'Group Name': 'Team Gamma', 'Group Admin': ''},
+        {'Phone Number': '+4915100000004', 'Group Name': 'Team Alpha;Admins Only', 'Group Admin': 'Admins Only;Team Gamma'},
+        {'Phone Number': '+4915100000009', 'Group Name': 'Team Alpha', 'Group Admin': ''},
+    ]
+    current = {GROUP_ID: ['+4915100000001', '+4915100000005'], '[7, 8, 9]': ['+4915100000003']}
+
+    def sync(memory_budget):
+        deltas = []
+        monkeypatch.setattr(group_sync, 'apply_membership_deltas', lambda signal_dbus, group_deltas, *args: deltas.extend(group_deltas) or 0)
+        failed = sync_snapshot(SnapshotSignalDBus(current), iter(rows), str(env / 'groups_created.csv'),
+                               input_bytes=1000, memory_budget=memory_budget)
+        return failed, sorted(
+            (delta['group_id'], sorted(delta['add']), sorted(delta['remove']), sorted(delta['admins'])) for delta in deltas
+        )
+
+    in_memory = sync(None)
+    partitioned = sync(1000)
+    assert partitioned == in_memory
+    assert len(in_memory[1]) == 4
@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('dotenv')
+pytest.importorskip('gi')
+pytest.importorskip('pydbus')
+pytest.importorskip('qrcode')
+
+from job_queue import OPERATIONS, JobQueue, renew_lease
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / 'jobs.sqlite3')
+
+
+def test_only_the_lease_holder_completes_a_job(queue_path):
+    job_queue = JobQueue(queue_path, lease_seconds=0.1)
+    job_id = job_queue.enqueue('add_members', {'group_id': [1], 'members': ['+4915100000001']})
+    assert job_queue.lease('worker-a')['id'] == job_id
+    time.sleep(0.15)
+    # The lease of worker-a expired, so worker-b takes the job over
+    assert job_queue.lease('worker-b')['id'] == job_id
+    assert not job_queue.complete(job_id, 'worker-a')
+    assert not job_queue.fail(job_id, 'late failure', 'worker-a')
+    assert job_queue.complete(job_id, 'worker-b')
+    assert job_queue.get(job_id)['status'] == 'done'
+    job_queue.close()
+
+
+def test_renewed_lease_is_not_taken_over(queue_path):
+    job_queue = JobQueue(queue_path, lease_seconds=0.3)
+    job_id = job_queue.enqueue('add_members', {'group_id': [1], 'members': ['+4915100000001']})
+    job_queue.lease('worker-a')
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=renew_lease, args=(queue_path, job_id, 'worker-a', stop, 0.3))
+    heartbeat.start()
+    try:
+        time.sleep(0.6)
+        assert job_queue.lease('worker-b') is None
+    finally:
+        stop.set()
+        heartbeat.join()
+    assert job_queue.complete(job_id, 'worker-a')
+    job_queue.close()
+
+
+def test_expired_lease_on_last_attempt_fails_the_job(queue_path):
+    job_queue = JobQueue(queue_path, lease_seconds=0.05)
+    job_id = job_queue.enqueue('add_members', {'group_id': [1], 'members': ['+4915100000001']}, max_attempts=1)
+    job_queue.lease('worker-a')
+    time.sleep(0.1)
+    assert job_queue.lease('worker-b') is None
+    job = job_queue.get(job_id)
+    assert job['status'] == 'failed'
+    assert job['attempts'] == 1
+    job_queue.close()
+
+
+def test_requeued_job_keeps_its_attempts(queue_path):
+    job_queue = JobQueue(queue_path)
+    job_id = job_queue.enqueue('add_members', {'group_id': [1], 'members': ['+4915100000001']}, max_attempts=1)
+    for _ in range(3):
+        job_queue.lease('worker-a')
+        assert not job_queue.requeue(job_id, 'worker-b', time.time(), 'Circuit open')
+        assert job_queue.requeue(job_id, 'worker-a', time.time(), 'Circuit open')
+        job = job_queue.get(job_id)
+        assert (job['status'], job['attempts']) == ('queued', 0)
+
+    # A real failure still uses up the attempt
+    job_queue.lease('worker-a')
+    assert job_queue.fail(job_id, 'Group not found', 'worker-a')
+    assert job_queue.get(job_id)['status'] == 'failed'
+    job_queue.close()
+
+
+def test_requeued_job_waits_until_run_after(queue_path):
+    job_queue = JobQueue(queue_path)
+    job_id = job_queue.enqueue('add_members', {'group_id': [1], 'members': ['+4915100000001']})
+    job_queue.lease('worker-a')
+    job_queue.requeue(job_id, 'worker-a', time.time() + 60)
+    assert job_queue.lease('worker-b') is None
+    job_queue.close()
+
+
+class PartialSignalDBus:
+    def add_members(self, group_id, recipients):
+        return recipients[:1]
+
+    def set_group_property(self, group_id, property_name, property_value):
+        return False
+
+
+def test_operations_raise_on_partial_failure():
+    with pytest.raises(RuntimeError, match='1 of 2 members'):
+        OPERATIONS['add_members'](PartialSignalDBus(), [1], ['+4915100000001', '+4915100000002'])
+    OPERATIONS['add_members'](PartialSignalDBus(), [1], ['+4915100000001'])
+    with pytest.raises(RuntimeError):
+        OPERATIONS['set_group_property'](PartialSignalDBus(), [1], 'Name', 'Team Alpha')
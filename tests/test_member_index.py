@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip('dotenv')
+pytest.importorskip('gi')
+pytest.importorskip('pydbus')
+pytest.importorskip('qrcode')
+
+from member_index import MemberIndex, offboard
+
+NUMBER = '+4915100000001'
+
+
+class FakeSignalDBus:
+    """
+    In-memory stand-in for SignalDBus with groups keyed by their ID bytes.
+    """
+
+    def __init__(self, groups):
+        self.groups = groups
+
+    def list_groups(self):
+        return [(list(group_id), group['name']) for group_id, group in self.groups.items()]
+
+    def get_group_object_path(self, group_id):
+        return f"/groups/{bytes(group_id).hex()}"
+
+    def get_all_group_properties(self, group_id):
+        group = self.groups[bytes(group_id)]
+        return {'Members': sorted(group['members']), 'Admins': sorted(group['admins'])}
+
+    def remove_admins(self, group_id, recipients):
+        self.groups[bytes(group_id)]['admins'].difference_update(recipients)
+        return list(recipients)
+
+    def remove_members(self, group_id, recipients):
+        self.groups[bytes(group_id)]['members'].difference_update(recipients)
+        return list(recipients)
+
+
+def test_offboard_finds_groups_joined_after_the_index_was_built():
+    signal_dbus = FakeSignalDBus({
+        b'\x01': {'name': 'Team Alpha', 'members': {NUMBER}, 'admins': set()},
+        b'\x02': {'name': 'Team Beta', 'members': set(), 'admins': set()},
+    })
+    index = MemberIndex.build(signal_dbus)
+    # Added by another tool, so the index never saw it
+    signal_dbus.groups[b'\x02']['members'].add(NUMBER)
+    signal_dbus.groups[b'\x02']['admins'].add(NUMBER)
+
+    assert offboard(signal_dbus, index, NUMBER) == []
+    assert all(NUMBER not in group['members'] | group['admins'] for group in signal_dbus.groups.values())
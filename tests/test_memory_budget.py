@@ -0,0 +1,52 @@
+import tracemalloc
+
+from memory_budget import MemoryReport, needs_spilling, partition_count, read_partition, spill_rows
+
+ROWS = [
+    {'Phone Number': '+4915100000001', 'Group Name': 'Team Alpha;Team Beta', 'Group Admin': 'Team Alpha'},
+    {'Phone Number': '+4915100000002', 'Group Name': 'Team Beta', 'Group Admin': 'Admins Only'},
+    {'Phone Number': '+4915100000003', 'Group Name': 'Team Gamma', 'Group Admin': ''},
+]
+
+
+def test_spilling_is_only_needed_above_the_budget():
+    assert not needs_spilling(1000, None)
+    assert not needs_spilling(1000, 100000)
+    assert needs_spilling(1000, 1000)
+    assert partition_count(1000, 1000) == 20
+
+
+def test_spilled_groups_stay_in_one_partition(tmp_path):
+    paths = spill_rows(iter(ROWS), str(tmp_path), 3)
+    partitions = [list(read_partition(path)) for path in paths]
+    groups_per_partition = [
+        {row['Group Name'] or row['Group Admin'] for row in partition} for partition in partitions
+    ]
+    for group_name in ('Team Alpha', 'Team Beta', 'Team Gamma', 'Admins Only'):
+        assert sum(group_name in groups for groups in groups_per_partition) == 1
+
+    records = sorted((row['Phone Number'], row['Group Name'], row['Group Admin']) for partition in partitions for row in partition)
+    assert records == [
+        ('+4915100000001', 'Team Alpha', 'Team Alpha'),
+        ('+4915100000001', 'Team Beta', ''),
+        ('+4915100000002', '', 'Admins Only'),
+        ('+4915100000002', 'Team Beta', ''),
+        ('+4915100000003', 'Team Gamma', ''),
+    ]
+
+
+def test_report_keeps_the_largest_peak_of_a_repeated_phase():
+    report = MemoryReport()
+    try:
+        with report.phase('resolve'):
+            data = [bytes(1024 * 1024)]
+        with report.phase('resolve'):
+            del data
+        with report.phase('apply'):
+            pass
+    finally:
+        tracemalloc.stop()
+    assert list(report.phases) == ['resolve', 'apply']
+    assert report.phases['resolve'][0] >= 1024 * 1024
+    assert report.phases['apply'][0] < 1024 * 1024
+    assert MemoryReport(enabled=False).phases == {}
@@ -0,0 +1,133 @@
+import sqlite3
+
+import pytest
+
+pytest.importorskip('dotenv')
+
+import message_archive
+from message_archive import MessageArchive, open_archive, search, store_group_names
+
+GROUP_ID = 'AQID'
+OWN_NUMBER = '+4915100000009'
+
+
+def record(timestamp, message, record_type='message', sender='+4915100000001', destination=None, group_id=GROUP_ID):
+    return {
+        'type': record_type,
+        'timestamp': timestamp,
+        'sender': sender,
+        'destination': destination,
+        'group_id': group_id,
+        'message': message,
+        'attachments': [],
+    }
+
+
+RECORDS = [
+    record(1000, 'the refund arrived'),
+    record(3000, 'refund requested again'),
+    record(2000, 'no news yet', group_id=''),
+    record(4000, 'refund sent', record_type='sent', sender=None, destination='+4915100000001', group_id=None),
+    record(5000, 'hello from the team', record_type='sent', sender=None, group_id=GROUP_ID),
+]
+
+
+def ingest(archive_path, records):
+    archive = MessageArchive(archive_path)
+    for message in records:
+        archive.add(message)
+    archive.close()
+    return archive
+
+
+@pytest.fixture
+def archive_path(tmp_path):
+    path = str(tmp_path / 'messages.sqlite3')
+    try:
+        open_archive(path).close()
+    except RuntimeError:
+        pytest.skip("The SQLite library of this Python does not support FTS5")
+    return path
+
+
+def test_missing_fts5_is_reported(tmp_path, monkeypatch):
+    class NoFTS5Connection:
+        def __init__(self):
+            self.closed = False
+
+        def execute(self, *args):
+            pass
+
+        def executescript(self, script):
+            raise sqlite3.OperationalError('no such module: fts5')
+
+        def close(self):
+            self.closed = True
+
+    connection = NoFTS5Connection()
+    monkeypatch.setattr(message_archive.sqlite3, 'connect', lambda *args, **kwargs: connection)
+    with pytest.raises(RuntimeError, match='FTS5'):
+        open_archive(str(tmp_path / 'messages.sqlite3'))
+    assert connection.closed
+
+
+def test_ingest_stores_every_message(archive_path):
+    archive = ingest(archive_path, RECORDS)
+    assert (archive.added, archive.written) == (5, 5)
+
+    connection = open_archive(archive_path)
+    messages = search(connection)
+    connection.close()
+    assert [message['timestamp'] for message in messages] == [5000, 4000, 3000, 2000, 1000]
+    # Messages outside of groups have no group ID, whether received or sent
+    assert [message['group_id'] for message in messages] == [GROUP_ID, None, GROUP_ID, None, GROUP_ID]
+
+
+def test_importing_the_same_messages_again_adds_nothing(archive_path):
+    ingest(archive_path, RECORDS)
+    archive = ingest(archive_path, RECORDS + [record(6000, 'new message')])
+    assert (archive.added, archive.written) == (6, 1)
+
+    connection = open_archive(archive_path)
+    count, = connection.execute('SELECT COUNT(*) FROM messages').fetchone()
+    connection.close()
+    assert count == 6
+
+
+def test_text_search_returns_the_newest_matches_first(archive_path):
+    ingest(archive_path, RECORDS)
+    connection = open_archive(archive_path)
+    store_group_names(connection, [([1, 2, 3], 'Team Alpha')])
+    try:
+        matches = search(connection, text='refund')
+        limited = search(connection, text='refund', limit=2)
+        in_group = search(connection, text='refund', group_id=GROUP_ID)
+        filtered = search(connection, sender='+4915100000001', since=1000, until=3000)
+    finally:
+        connection.close()
+    assert [message['message'] for message in matches] == ['refund sent', 'refund requested again', 'the refund arrived']
+    assert [message['timestamp'] for message in limited] == [4000, 3000]
+    assert [message['group_name'] for message in in_group] == ['Team Alpha', 'Team Alpha']
+    assert [message['timestamp'] for message in filtered] == [2000, 1000]
+
+
+def test_older_archives_are_deduplicated(archive_path):
+    connection = open_archive(archive_path)
+    # The index of older archives did not identify messages without a sender
+    connection.execute('DROP INDEX messages_identity')
+    connection.execute(
+        "CREATE UNIQUE INDEX messages_identity ON messages (sender, timestamp, IFNULL(group_id, ''), IFNULL(destination, ''))"
+    )
+    for group_id in ('', None, ''):
+        connection.execute(message_archive.INSERT_MESSAGE, (1000, 'sent', None, '+4915100000001', group_id, 'twice', None))
+    connection.commit()
+    connection.close()
+
+    connection = open_archive(archive_path)
+    try:
+        rows = connection.execute('SELECT group_id, body FROM messages').fetchall()
+        matches = search(connection, text='twice')
+    finally:
+        connection.close()
+    assert rows == [(None, 'twice')]
+    assert len(matches) == 1
@@ -0,0 +1,91 @@
+import json
+import os
+import threading
+
+import pytest
+
+pytest.importorskip('dotenv')
+pytest.importorskip('gi')
+pytest.importorskip('qrcode')
+
+from message_stream import JsonlSink, MessageStream
+
+
+def receive(stream, *texts):
+    for text in texts:
+        stream._on_message(1700000000000, '+4915100000001', [], text, [])
+
+
+def drain(stream):
+    messages = []
+    while not stream.queue.empty():
+        messages.append(stream.get(timeout=0)['message'])
+    return messages
+
+
+def test_drop_newest_discards_incoming_messages():
+    stream = MessageStream(None, max_queue=2, overflow='drop_newest')
+    receive(stream, 'one', 'two', 'three')
+    assert drain(stream) == ['one', 'two']
+    assert (stream.received, stream.dropped) == (3, 1)
+
+
+def test_drop_oldest_discards_queued_messages():
+    stream = MessageStream(None, max_queue=2, overflow='drop_oldest')
+    receive(stream, 'one', 'two', 'three')
+    assert drain(stream) == ['two', 'three']
+    assert (stream.received, stream.dropped) == (3, 1)
+
+
+def test_block_waits_for_the_consumer():
+    stream = MessageStream(None, max_queue=1, overflow='block')
+    receive(stream, 'one')
+    producer = threading.Thread(target=receive, args=(stream, 'two'))
+    producer.start()
+    producer.join(timeout=0.2)
+    assert producer.is_alive()
+
+    assert stream.get(timeout=1)['message'] == 'one'
+    producer.join(timeout=2)
+    assert not producer.is_alive()
+    assert stream.get(timeout=1)['message'] == 'two'
+    assert stream.dropped == 0
+
+
+def test_close_wakes_a_blocked_producer():
+    stream = MessageStream(None, max_queue=1, overflow='block')
+    receive(stream, 'one')
+    producer = threading.Thread(target=receive, args=(stream, 'two'))
+    producer.start()
+    stream.close()
+    producer.join(timeout=2)
+    assert not producer.is_alive()
+    assert stream.get(timeout=0) is None
+
+
+def read_messages(directory):
+    messages = []
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), encoding='UTF-8') as jsonl_file:
+            messages.extend(json.loads(line)['message'] for line in jsonl_file)
+    return messages
+
+
+def test_sink_rotates_at_max_bytes(tmp_path):
+    with JsonlSink(str(tmp_path), max_bytes=1) as sink:
+        for text in ('one', 'two', 'three'):
+            sink.write({'message': text})
+    assert len(os.listdir(tmp_path)) == 3
+    assert sorted(read_messages(tmp_path)) == ['one', 'three', 'two']
+
+
+def test_sink_prunes_the_oldest_files(tmp_path):
+    old_path = tmp_path / 'messages-20200101-000000.jsonl'
+    old_path.write_text(json.dumps({'message': 'old'}) + '\n')
+    os.utime(old_path, (0, 0))
+    with JsonlSink(str(tmp_path), max_bytes=1, max_files=2) as sink:
+        for text in ('one', 'two', 'three'):
+            sink.write({'message': text})
+    assert not old_path.exists()
+    assert len(os.listdir(tmp_path)) == 2
+    assert 'three' in read_messages(tmp_path)
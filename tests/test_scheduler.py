@@ -0,0 +1,72 @@
+from scheduler import schedule_deltas
+
+
+class RecordingSignalDBus:
+    """
+    Records every member change, failing the changes for the numbers in failing.
+    """
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+
+    def _apply(self, operation, group_id, recipients):
+        self.calls.append((operation, group_id[0], list(recipients)))
+        return [recipient for recipient in recipients if recipient not in self.failing]
+
+    def add_members(self, group_id, recipients):
+        return self._apply('add', group_id, recipients)
+
+    def remove_members(self, group_id, recipients):
+        return self._apply('remove', group_id, recipients)
+
+    def add_admins(self, group_id, recipients):
+        return self._apply('admins', group_id, recipients)
+
+
+def delta(number, name, add=(), remove=(), admins=()):
+    return {'group_id': f"[{number}]", 'group_name': name, 'add': list(add), 'remove': list(remove), 'admins': list(admins)}
+
+
+def test_higher_priority_groups_run_first_and_removals_before_additions():
+    signal_dbus = RecordingSignalDBus()
+    deltas = [
+        delta(1, 'Team Alpha', add=['+4915100000001'], remove=['+4915100000002']),
+        delta(2, 'Team Beta', add=['+4915100000003'], remove=['+4915100000004'], admins=['+4915100000003']),
+    ]
+    assert schedule_deltas(signal_dbus, deltas, priorities={'Team Beta': 1}, max_workers=1) == 0
+    assert signal_dbus.calls == [
+        ('remove', 2, ['+4915100000004']),
+        ('add', 2, ['+4915100000003']),
+        ('admins', 2, ['+4915100000003']),
+        ('remove', 1, ['+4915100000002']),
+        ('add', 1, ['+4915100000001']),
+    ]
+
+
+def test_removals_of_all_groups_run_before_additions():
+    signal_dbus = RecordingSignalDBus()
+    deltas = [
+        delta(1, 'Team Alpha', add=['+4915100000001'], remove=['+4915100000002']),
+        delta(2, 'Team Beta', remove=['+4915100000004']),
+    ]
+    schedule_deltas(signal_dbus, deltas, max_workers=1)
+    operations = [operation for operation, _, _ in signal_dbus.calls]
+    assert operations == ['remove', 'remove', 'add']
+
+
+def test_failed_members_are_counted_and_recorded():
+    signal_dbus = RecordingSignalDBus(failing={'+4915100000002'})
+    deltas = [delta(1, 'Team Alpha', add=['+4915100000001', '+4915100000002', '+4915100000003'])]
+    assert schedule_deltas(signal_dbus, deltas, max_workers=1, slice_size=2) == 1
+    assert deltas[0]['failed'] == {'remove': [], 'add': ['+4915100000002'], 'admins': []}
+
+
+def test_remaining_steps_of_a_raising_group_count_as_failed():
+    class RaisingSignalDBus(RecordingSignalDBus):
+        def remove_members(self, group_id, recipients):
+            raise RuntimeError('daemon gone')
+
+    deltas = [delta(1, 'Team Alpha', add=['+4915100000001'], remove=['+4915100000002'])]
+    assert schedule_deltas(RaisingSignalDBus(), deltas, max_workers=1) == 2
+    assert deltas[0]['failed']['add'] == ['+4915100000001']
@@ -0,0 +1,109 @@
+import pytest
+
+pytest.importorskip('dotenv')
+pytest.importorskip('gi')
+pytest.importorskip('pydbus')
+pytest.importorskip('qrcode')
+
+import call_policy
+from call_policy import CircuitBreaker, CircuitOpenError, DeadlineExceeded
+from signal_dbus import SignalDBus
+
+REGISTERED_NUMBER = '+4915100000001'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeProxy:
+    def __init__(self, bus):
+        self._bus = bus
+
+    def __getattr__(self, method):
+        def call(*args, timeout=None):
+            self._bus.calls.append((method, timeout))
+            self._bus.arguments.append(args)
+            if self._bus.error is not None:
+                raise self._bus.error
+            return True
+        return call
+
+
+class FakeBus:
+    """
+    Bus whose calls all succeed, or raise error when it is set.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.arguments = []
+        self.error = None
+
+    def get(self, bus_name, object_path=None, timeout=None):
+        return FakeProxy(self)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.delenv('SIGNAL_AUDIT_LOG', raising=False)
+    monkeypatch.delenv('SIGNAL_MESSAGE_ARCHIVE', raising=False)
+    clock = FakeClock()
+    monkeypatch.setattr(call_policy, 'time', clock)
+    return clock
+
+
+def signal_dbus_with(bus, failure_threshold=3):
+    return SignalDBus(REGISTERED_NUMBER, breaker=CircuitBreaker(failure_threshold=failure_threshold), bus=bus)
+
+
+def test_call_raises_once_the_deadline_has_passed(clock):
+    bus = FakeBus()
+    signal_dbus = signal_dbus_with(bus)
+    signal_dbus.set_deadline(5)
+    clock.now += 4
+    signal_dbus._call(signal_dbus.account_path, 'isRegistered', REGISTERED_NUMBER)
+    # The call timeout is cut short to the remaining time of the run
+    assert bus.calls == [('isRegistered', 1)]
+
+    clock.now += 1
+    with pytest.raises(DeadlineExceeded):
+        signal_dbus._call(signal_dbus.account_path, 'isRegistered', REGISTERED_NUMBER)
+    assert len(bus.calls) == 1
+
+
+def test_daemon_errors_open_the_circuit(clock):
+    bus = FakeBus()
+    signal_dbus = signal_dbus_with(bus)
+    bus.error = Exception('org.freedesktop.DBus.Error.NoReply: Did not receive a reply')
+    for _ in range(3):
+        with pytest.raises(Exception, match='NoReply'):
+            signal_dbus._call(signal_dbus.account_path, 'isRegistered', REGISTERED_NUMBER)
+    with pytest.raises(CircuitOpenError):
+        signal_dbus._call(signal_dbus.account_path, 'isRegistered', REGISTERED_NUMBER)
+    assert len(bus.calls) == 3
+
+
+def test_request_errors_do_not_open_the_circuit(clock):
+    bus = FakeBus()
+    signal_dbus = signal_dbus_with(bus)
+    bus.error = Exception('org.asamk.Signal.Error.InvalidNumber: Invalid number')
+    for _ in range(5):
+        with pytest.raises(Exception, match='InvalidNumber'):
+            signal_dbus._call(signal_dbus.account_path, 'isRegistered', REGISTERED_NUMBER)
+    assert not signal_dbus.breaker.is_open
+
+
+def test_join_requests_are_handled_with_add_and_remove_members(clock):
+    bus = FakeBus()
+    signal_dbus = signal_dbus_with(bus)
+    signal_dbus._group_paths[(1, 2, 3)] = '/org/asamk/Signal/_4915100000001/Groups/AQID'
+    # signal-cli approves a join request through addMembers and refuses it through removeMembers
+    assert signal_dbus.approve_requesting_members([1, 2, 3], ['+4915100000002']) == ['+4915100000002']
+    assert signal_dbus.refuse_requesting_members([1, 2, 3], ['+4915100000003']) == ['+4915100000003']
+    assert [method for method, _ in bus.calls] == ['addMembers', 'removeMembers']
+    assert bus.arguments == [(['+4915100000002'],), (['+4915100000003'],)]
@@ -0,0 +1,101 @@
+import json
+import os
+
+import pytest
+
+from sources import CursorInvalid, JSONLChangeLogSource, JSONSource, membership_row
+
+
+def append(log_path, data):
+    with open(log_path, 'a', encoding='UTF-8') as log_file:
+        log_file.write(data)
+
+
+def change_line(op, phone):
+    return json.dumps({'op': op, 'phone': phone, 'group': 'Team Alpha'}) + '\n'
+
+
+def test_change_feed_resumes_after_the_cursor(tmp_path):
+    log_path = str(tmp_path / 'changes.jsonl')
+    append(log_path, change_line('add', '+4915100000001'))
+    source = JSONLChangeLogSource(log_path)
+    cursor = source.current_cursor()
+
+    append(log_path, change_line('add', '+4915100000002') + change_line('remove', '+4915100000001'))
+    changes, cursor = source.changes(cursor)
+    assert [(change['op'], change['Phone Number']) for change in changes] == [
+        ('add', '+4915100000002'), ('remove', '+4915100000001'),
+    ]
+    assert cursor == source.current_cursor()
+    assert source.changes(cursor)[0] == []
+
+
+def test_partial_line_is_read_once_it_is_complete(tmp_path):
+    log_path = str(tmp_path / 'changes.jsonl')
+    append(log_path, '')
+    source = JSONLChangeLogSource(log_path)
+    cursor = source.current_cursor()
+
+    line = change_line('add', '+4915100000001')
+    append(log_path, line[:10])
+    changes, cursor = source.changes(cursor)
+    assert changes == []
+    assert cursor['offset'] == 0
+
+    append(log_path, line[10:])
+    changes, cursor = source.changes(cursor)
+    assert [change['Phone Number'] for change in changes] == ['+4915100000001']
+    assert cursor['offset'] == len(line)
+
+
+def test_rotated_log_invalidates_the_cursor(tmp_path):
+    log_path = str(tmp_path / 'changes.jsonl')
+    append(log_path, change_line('add', '+4915100000001'))
+    source = JSONLChangeLogSource(log_path)
+    cursor = source.current_cursor()
+
+    os.replace(log_path, log_path + '.1')
+    append(log_path, change_line('add', '+4915100000002'))
+    with pytest.raises(CursorInvalid):
+        source.changes(cursor)
+
+
+PEOPLE = [
+    {'phone': '+4915100000001', 'name': 'Ada "A" Lovelace', 'groups': ['Team Alpha', 'Team Beta'], 'admin_groups': []},
+    {'phone': '+4915100000002', 'name': None, 'groups': ['Admins Only'], 'admin_groups': ['Admins Only']},
+    {'phone': '+4915100000003', 'name': 'Grace [Hopper], {RN}', 'groups': []},
+]
+
+
+def expected_rows():
+    return [membership_row(person['phone'], person['name'], person['groups'], person.get('admin_groups', [])) for person in PEOPLE]
+
+
+def read_rows(path, chunk_size):
+    source = JSONSource(path)
+    source.chunk_size = chunk_size
+    return list(source.rows())
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 64 * 1024])
+def test_json_list_is_read_in_chunks(tmp_path, chunk_size):
+    json_path = str(tmp_path / 'people.json')
+    with open(json_path, 'w', encoding='UTF-8') as json_file:
+        json.dump(PEOPLE, json_file, indent=2)
+    assert read_rows(json_path, chunk_size) == expected_rows()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 64 * 1024])
+def test_json_members_are_read_after_other_keys(tmp_path, chunk_size):
+    json_path = str(tmp_path / 'export.json')
+    with open(json_path, 'w', encoding='UTF-8') as json_file:
+        json.dump({'meta': {'count': 3, 'groups': ['Team Alpha']}, 'version': 12, 'members': PEOPLE}, json_file)
+    assert read_rows(json_path, chunk_size) == expected_rows()
+
+
+def test_json_without_members_is_an_error(tmp_path):
+    json_path = str(tmp_path / 'export.json')
+    with open(json_path, 'w', encoding='UTF-8') as json_file:
+        json.dump({'meta': {}}, json_file)
+    with pytest.raises(ValueError):
+        list(JSONSource(json_path).rows())
@@ -1,11 +1,15 @@
+import base64
+import os
+
 import qrcode
 
-def generate_qr_code(data):
+def generate_qr_code(data, file_path="qr_code.png"):
     """
     Generates a QR code image based on the provided data.
 
     Args:
         data (str): The data to be encoded in the QR code.
+        file_path (str): Path of the PNG file to write.
 
     Raises:
         Exception: If there is an error generating the QR code.
@@ -14,13 +18,63 @@ def generate_qr_code(data):
         None
     """
     try:
-        # Generate the QR code image
-        qr = qrcode.QRCode(version=None, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
-        qr.add_data(data)
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white")
-        img.save("qr_code.png")
-        print("QR code generated and saved as 'qr_code.png'")
+        render_qr_code(data, file_path)
+        print(f"QR code generated and saved as '{file_path}'")
     except Exception as e:
-        print(f"Error generating QR code: {str(e)}")
\ No newline at end of file
+        print(f"Error generating QR code: {str(e)}")
+
+
+def render_qr_code(data, file_path):
+    """
+    Renders the data as a QR code PNG file without printing anything, so it
+    can be used from worker processes.
+
+    Args:
+        data (str): The data to be encoded in the QR code.
+        file_path (str): Path of the PNG file to write.
+
+    Returns:
+        str: The path of the written file.
+    """
+    qr = qrcode.QRCode(version=None, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    # Write to a temporary file first so an interrupted run never leaves a truncated image
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as image_file:
+        img.save(image_file)
+    os.replace(temp_path, file_path)
+    return file_path
+
+def encode_group_id(group_id, urlsafe=False):
+    """
+    Encodes a D-Bus group ID (byte array) as a base64 string.
+
+    Args:
+        group_id (list or bytes): The group ID as returned by signal-cli.
+        urlsafe (bool): Use the URL-safe base64 alphabet.
+
+    Returns:
+        str: The base64 encoded group ID, or None for an empty ID.
+    """
+    if not group_id:
+        return None
+    if urlsafe:
+        return base64.urlsafe_b64encode(bytes(group_id)).decode('ascii')
+    return base64.b64encode(bytes(group_id)).decode('ascii')
+
+
+def decode_group_id(encoded_group_id):
+    """
+    Decodes a base64 group ID (standard or URL-safe alphabet) into the byte
+    list expected by signal-cli.
+
+    Args:
+        encoded_group_id (str): The base64 encoded group ID.
+
+    Returns:
+        list: The group ID as a list of byte values.
+    """
+    return list(base64.urlsafe_b64decode(encoded_group_id.replace('+', '-').replace('/', '_')))